@@ -0,0 +1,150 @@
+"""Ограничение одновременных записей и частоты записей пользователя.
+
+SQLite пропускает одну запись за раз, поэтому лишние POST-запросы
+не ждут блокировку базы до таймаута воркера, а сразу получают 503
+(очередь переполнена или ожидание затянулось) или 429 (пользователь
+превысил свою частоту). Ограничения действуют в пределах процесса.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from threading import Condition, Lock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+COUNTERS = ('admitted', 'queued', 'shed', 'throttled')
+MAX_BUCKETS = 10000
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+class WriteGate:
+    """Не больше ADMISSION_MAX_WRITES записей одновременно.
+
+    Остальные ждут в очереди длиной не больше ADMISSION_QUEUE_SIZE
+    и не дольше ADMISSION_QUEUE_TIMEOUT секунд.
+    """
+
+    def __init__(self):
+        self.condition = Condition()
+        self.active = 0
+        self.waiting = 0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def count(self, counter):
+        with self.condition:
+            self.counters[counter] += 1
+
+    def acquire(self):
+        """True, если запрос допущен; False - если его нужно сбросить."""
+        limit = setting('ADMISSION_MAX_WRITES', 4)
+        with self.condition:
+            if self.active < limit and not self.waiting:
+                self.active += 1
+                self.counters['admitted'] += 1
+                return True
+            if self.waiting >= setting('ADMISSION_QUEUE_SIZE', 16):
+                self.counters['shed'] += 1
+                return False
+            self.waiting += 1
+            self.counters['queued'] += 1
+            try:
+                admitted = self.condition.wait_for(
+                    lambda: self.active < limit,
+                    setting('ADMISSION_QUEUE_TIMEOUT', 2.0),
+                )
+            finally:
+                self.waiting -= 1
+            if not admitted:
+                self.counters['shed'] += 1
+                return False
+            self.active += 1
+            self.counters['admitted'] += 1
+            return True
+
+    async def aacquire(self):
+        """Асинхронный acquire: очередь ждёт в потоке, не в цикле событий."""
+        waiting = asyncio.ensure_future(
+            sync_to_async(self.acquire, thread_sensitive=False)()
+        )
+        try:
+            return await asyncio.shield(waiting)
+        except asyncio.CancelledError:
+            # Запрос отменили, а место в очереди он может получить позже.
+            waiting.add_done_callback(
+                lambda done: done.result() and self.release()
+            )
+            raise
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    def stats(self):
+        with self.condition:
+            return dict(self.counters)
+
+    def reset(self):
+        with self.condition:
+            self.counters = dict.fromkeys(COUNTERS, 0)
+
+
+class TokenBuckets:
+    """Корзины токенов: ADMISSION_RATE записей в секунду с запасом
+    ADMISSION_BURST на каждого пользователя.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.buckets = OrderedDict()
+
+    def take(self, key):
+        """0, если токен взят, иначе сколько секунд ждать следующего."""
+        rate = setting('ADMISSION_RATE', 5.0)
+        burst = setting('ADMISSION_BURST', 20)
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+            # Самые давние корзины вытесняются первыми.
+            self.buckets[key] = (tokens, now)
+            while len(self.buckets) > MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def reset(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+write_gate = WriteGate()
+buckets = TokenBuckets()
+
+
+def retry_after(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+
+def client_key(request, user):
+    if user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{request.META.get("REMOTE_ADDR")}'
+
+
+def admission_stats():
+    return write_gate.stats()
+
+
+def reset():
+    write_gate.reset()
+    buckets.reset()
@@ -0,0 +1,256 @@
+import json
+from http import HTTPStatus
+
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views import generic
+
+from .forms import WARNING, NoteForm
+from .pagination import keyset_paginate, parse_cursor
+from .tags import tag_string
+from .views import NoteBase
+
+NOTE_FIELDS = ('title', 'text', 'slug')
+MAX_PAGE_SIZE = 200
+MAX_BATCH_SIZE = 500
+
+
+class ApiError(Exception):
+    """Ошибка запроса, которую нужно вернуть клиенту в виде JSON."""
+
+    def __init__(self, status, errors):
+        super().__init__(errors)
+        self.status = status
+        self.errors = errors
+
+
+def serialize_note(note):
+    return {
+        'id': note.pk,
+        'title': note.title,
+        'text': note.text,
+        'slug': note.slug,
+        'created': note.created.isoformat(),
+        'updated': note.updated.isoformat(),
+    }
+
+
+def clean_payload(data):
+    """Проверяет типы полей JSON до формы; метки - строка или список."""
+    errors = {
+        field: ['Ожидается строка.'] for field in NOTE_FIELDS
+        if field in data and not isinstance(data[field], str)
+    }
+    data = dict(data)
+    tags = data.get('tags')
+    if isinstance(tags, list) and all(isinstance(tag, str) for tag in tags):
+        data['tags'] = ' '.join(tags)
+    elif tags is not None and not isinstance(tags, str):
+        errors['tags'] = ['Ожидается строка или список строк.']
+    if errors:
+        raise ApiError(HTTPStatus.BAD_REQUEST, errors)
+    return data
+
+
+def form_errors(form):
+    return {field: list(errors) for field, errors in form.errors.items()}
+
+
+class NoteApiBase(NoteBase, generic.View):
+    """Общая часть JSON API: авторизация, разбор тела, операции."""
+
+    def handle_no_permission(self):
+        return JsonResponse(
+            {'errors': {'__all__': ['Требуется авторизация.']}},
+            status=HTTPStatus.UNAUTHORIZED,
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as error:
+            return JsonResponse({'errors': error.errors}, status=error.status)
+
+    def get_payload(self):
+        try:
+            payload = json.loads(self.request.body or b'{}')
+        except (ValueError, UnicodeDecodeError):
+            raise ApiError(
+                HTTPStatus.BAD_REQUEST, {'__all__': ['Некорректный JSON.']}
+            )
+        if not isinstance(payload, dict):
+            raise ApiError(
+                HTTPStatus.BAD_REQUEST,
+                {'__all__': ['Ожидается JSON-объект.']},
+            )
+        return payload
+
+    def get_note(self, slug):
+        note = self.get_queryset().filter(slug=slug).first()
+        if note is None:
+            raise ApiError(
+                HTTPStatus.NOT_FOUND, {'__all__': ['Заметка не найдена.']}
+            )
+        return note
+
+    def save_form(self, form):
+        """Сохраняет форму; slug, занятый в гонке, - ошибка поля."""
+        if not form.is_valid():
+            raise ApiError(HTTPStatus.BAD_REQUEST, form_errors(form))
+        try:
+            with transaction.atomic():
+                return form.save()
+        except IntegrityError:
+            if not form.slug_taken():
+                raise
+            raise ApiError(
+                HTTPStatus.BAD_REQUEST,
+                {'slug': [form.cleaned_data['slug'] + WARNING]},
+            )
+
+    def create_note(self, data):
+        form = NoteForm(data=clean_payload(data))
+        form.instance.author = self.request.user
+        return self.save_form(form)
+
+    def update_note(self, note, data):
+        """Частичное обновление: отсутствующие поля не меняются."""
+        merged = {field: getattr(note, field) for field in NOTE_FIELDS}
+        # Иначе форма получила бы пустые метки и сняла их с заметки.
+        merged['tags'] = tag_string(note)
+        merged.update(clean_payload(data))
+        return self.save_form(NoteForm(data=merged, instance=note))
+
+
+class NoteApiList(NoteApiBase):
+    """GET - страница заметок по курсору, POST - новая заметка."""
+
+    def get(self, request):
+        try:
+            limit = min(int(request.GET.get('limit', 50)), MAX_PAGE_SIZE)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ApiError(
+                HTTPStatus.BAD_REQUEST, {'limit': ['Некорректный размер.']}
+            )
+        try:
+            cursor = parse_cursor(request.GET.get('after'))
+        except Http404:
+            raise ApiError(
+                HTTPStatus.BAD_REQUEST, {'after': ['Некорректный курсор.']}
+            )
+        page = keyset_paginate(self.get_queryset(), cursor, limit)
+        return JsonResponse({
+            'results': [serialize_note(note) for note in page.object_list],
+            'next': page.next_cursor,
+        })
+
+    def post(self, request):
+        note = self.create_note(self.get_payload())
+        return JsonResponse(serialize_note(note), status=HTTPStatus.CREATED)
+
+
+class NoteApiDetail(NoteApiBase):
+    """Одна заметка: чтение, частичное обновление, удаление."""
+
+    def get(self, request, slug):
+        return JsonResponse(serialize_note(self.get_note(slug)))
+
+    def patch(self, request, slug):
+        note = self.update_note(self.get_note(slug), self.get_payload())
+        return JsonResponse(serialize_note(note))
+
+    def delete(self, request, slug):
+        self.get_note(slug).delete()
+        return HttpResponse(status=HTTPStatus.NO_CONTENT)
+
+
+class NoteApiBatch(NoteApiBase):
+    """Пачка операций в одной транзакции с результатом по каждой.
+
+    Каждая операция выполняется в своей точке сохранения: ошибка
+    откатывает только её. С "atomic": true любая ошибка откатывает
+    всю пачку.
+    """
+
+    def post(self, request):
+        payload = self.get_payload()
+        operations = payload.get('operations')
+        if not isinstance(operations, list):
+            raise ApiError(
+                HTTPStatus.BAD_REQUEST,
+                {'operations': ['Ожидается список операций.']},
+            )
+        if len(operations) > MAX_BATCH_SIZE:
+            raise ApiError(
+                HTTPStatus.BAD_REQUEST,
+                {'operations': [f'Не больше {MAX_BATCH_SIZE} операций.']},
+            )
+        with transaction.atomic():
+            # Все заметки, на которые ссылается пачка, - одним запросом.
+            self.notes = self.get_queryset().in_bulk(
+                {
+                    operation['slug'] for operation in operations
+                    if isinstance(operation, dict)
+                    and isinstance(operation.get('slug'), str)
+                },
+                field_name='slug',
+            )
+            results = [self.apply(operation) for operation in operations]
+            failed = any(result['status'] >= 400 for result in results)
+            if failed and payload.get('atomic'):
+                transaction.set_rollback(True)
+        status = HTTPStatus.BAD_REQUEST if failed else HTTPStatus.OK
+        return JsonResponse({'results': results}, status=status)
+
+    def get_note(self, slug):
+        if slug not in self.notes:
+            self.notes[slug] = super().get_note(slug)
+        return self.notes[slug]
+
+    def apply(self, operation):
+        try:
+            with transaction.atomic():
+                return self.run(operation)
+        except ApiError as error:
+            # Форма могла изменить закэшированный объект до ошибки.
+            if isinstance(operation, dict):
+                slug = operation.get('slug')
+                if isinstance(slug, str):
+                    self.notes.pop(slug, None)
+            return {'status': error.status, 'errors': error.errors}
+
+    def run(self, operation):
+        if not isinstance(operation, dict):
+            raise ApiError(
+                HTTPStatus.BAD_REQUEST,
+                {'__all__': ['Операция должна быть JSON-объектом.']},
+            )
+        action = operation.get('op')
+        data = operation.get('data') or {}
+        if not isinstance(data, dict):
+            raise ApiError(
+                HTTPStatus.BAD_REQUEST, {'data': ['Ожидается JSON-объект.']}
+            )
+        if action == 'create':
+            note = self.create_note(data)
+            self.notes[note.slug] = note
+            return {'status': HTTPStatus.CREATED, 'note': serialize_note(note)}
+        if action not in ('update', 'delete'):
+            raise ApiError(
+                HTTPStatus.BAD_REQUEST,
+                {'op': ['Ожидается create, update или delete.']},
+            )
+        slug = operation.get('slug')
+        if not isinstance(slug, str):
+            raise ApiError(HTTPStatus.BAD_REQUEST, {'slug': ['Укажите slug.']})
+        note = self.get_note(slug)
+        if action == 'delete':
+            note.delete()
+            del self.notes[slug]
+            return {'status': HTTPStatus.NO_CONTENT}
+        note = self.update_note(note, data)
+        del self.notes[slug]
+        self.notes[note.slug] = note
+        return {'status': HTTPStatus.OK, 'note': serialize_note(note)}
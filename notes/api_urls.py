@@ -0,0 +1,11 @@
+from django.urls import path
+
+from notes import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('notes/', api.NoteApiList.as_view(), name='list'),
+    path('notes/<slug:slug>/', api.NoteApiDetail.as_view(), name='detail'),
+    path('batch/', api.NoteApiBatch.as_view(), name='batch'),
+]
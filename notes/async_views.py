@@ -0,0 +1,217 @@
+"""Асинхронные варианты CRUD-представлений заметок для работы под ASGI.
+
+Включаются настройкой NOTES_ASYNC_VIEWS. Запросы к базе идут через
+асинхронный ORM, шаблоны получают уже загруженные объекты, поэтому
+отрисовка не обращается к базе из цикла событий. Исключение - страница
+заметки: её кэшируемый фрагмент отрисовывается в потоке, чтобы при
+попадании в кэш не читать лишнего.
+"""
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.db import IntegrityError
+from django.http import Http404, HttpResponseRedirect
+from django.shortcuts import render
+from django.urls import reverse_lazy
+from django.views import generic
+
+from . import views
+from .cache import notes_version
+from .db import ReadDatabaseMixin
+from .forms import WARNING, NoteForm
+from .links import backlinks
+from .models import Note, Tag
+from .pagination import akeyset_paginate, parse_cursor
+from .rendering import note_html
+from .similarity import similar_notes
+from .summary import aget_summary
+from .tags import aset_tags, atag_string, author_tags, prefetch_tags
+from .views import ConditionalGetMixin, FragmentCacheMixin
+
+
+class AsyncNoteBase(generic.View):
+    """Асинхронный аналог NoteBase."""
+    model = Note
+    success_url = reverse_lazy('notes:success')
+    template_name = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        # request.user - ленивый объект с синхронным запросом к базе;
+        # подменяем его пользователем, загруженным асинхронно.
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return redirect_to_login(
+                request.get_full_path(), settings.LOGIN_URL
+            )
+        return await super().dispatch(request, *args, **kwargs)
+
+    def get_queryset(self):
+        """Пользователь может работать только со своими заметками."""
+        return self.model.objects.filter(author=self.request.user)
+
+    async def aget_object(self):
+        try:
+            return await self.get_queryset().aget(slug=self.kwargs['slug'])
+        except self.model.DoesNotExist:
+            raise Http404('Заметка не найдена.')
+
+    def render(self, **context):
+        return render(self.request, self.template_name, context)
+
+
+class AsyncFormMixin:
+    """Обработка NoteForm: проверка в потоке, сохранение асинхронно."""
+    form_class = NoteForm
+
+    def render_form(self, form, note=None):
+        return self.render(form=form, note=note, object=note)
+
+    async def save_form(self, form, note=None):
+        # Проверка формы обращается к базе (уникальность slug).
+        if not await sync_to_async(form.is_valid)():
+            return self.render_form(form, note)
+        fields = dict(form.cleaned_data)
+        tags = fields.pop('tags')
+        try:
+            if note is None:
+                note = await self.model.objects.acreate(
+                    author=self.request.user, **fields
+                )
+            else:
+                await form.instance.asave()
+        except IntegrityError:
+            if not await sync_to_async(form.slug_taken)():
+                raise
+            form.add_error('slug', form.cleaned_data['slug'] + WARNING)
+            return self.render_form(form, note)
+        await aset_tags(note, tags)
+        return HttpResponseRedirect(self.success_url)
+
+
+class NoteCreate(AsyncFormMixin, AsyncNoteBase):
+    """Добавление заметки."""
+    template_name = 'notes/form.html'
+
+    async def get(self, request):
+        return self.render_form(self.form_class())
+
+    async def post(self, request):
+        return await self.save_form(self.form_class(request.POST))
+
+
+class NoteUpdate(AsyncFormMixin, AsyncNoteBase):
+    """Редактирование заметки."""
+    template_name = 'notes/form.html'
+
+    async def get(self, request, slug):
+        note = await self.aget_object()
+        form = self.form_class(
+            instance=note, initial={'tags': await atag_string(note)}
+        )
+        return self.render_form(form, note)
+
+    async def post(self, request, slug):
+        note = await self.aget_object()
+        form = self.form_class(request.POST, instance=note)
+        return await self.save_form(form, note)
+
+
+class NoteDelete(AsyncNoteBase):
+    """Удаление заметки."""
+    template_name = 'notes/delete.html'
+
+    async def get(self, request, slug):
+        note = await self.aget_object()
+        return self.render(note=note, object=note)
+
+    async def post(self, request, slug):
+        note = await self.aget_object()
+        await note.adelete()
+        return HttpResponseRedirect(self.success_url)
+
+
+class NotesList(ReadDatabaseMixin, ConditionalGetMixin, AsyncNoteBase):
+    """Список всех заметок пользователя."""
+    template_name = 'notes/list.html'
+    paginate_by = views.NotesList.paginate_by
+    cursor_kwarg = views.NotesList.cursor_kwarg
+
+    tag_kwarg = views.NotesList.tag_kwarg
+
+    def get_queryset(self):
+        return super().get_queryset().only(
+            *views.NotesList.list_fields
+        ).prefetch_related(prefetch_tags())
+
+    async def aget_tag(self, name):
+        try:
+            return await Tag.objects.aget(author=self.request.user, name=name)
+        except Tag.DoesNotExist:
+            raise Http404('Метка не найдена.')
+
+    async def get(self, request):
+        summary = await aget_summary(request.user.pk)
+        cursor = request.GET.get(self.cursor_kwarg, '')
+        name = request.GET.get(self.tag_kwarg, '')
+        etag, timestamp, response = self.check_conditions(
+            ((*summary, name, cursor), summary[1])
+        )
+        if response is None:
+            queryset = self.get_queryset()
+            tag = await self.aget_tag(name) if name else None
+            if tag is not None:
+                queryset = queryset.filter(tags=tag)
+            page = await akeyset_paginate(
+                queryset, parse_cursor(cursor), self.paginate_by
+            )
+            response = self.render(
+                object_list=page.object_list,
+                note_list=page.object_list,
+                page_obj=page,
+                is_paginated=page.has_next(),
+                tag=tag,
+                tags=[obj async for obj in author_tags(request.user.pk)],
+                note_count=summary[0] if tag is None else tag.note_count,
+                notes_version=notes_version(summary),
+                fragment_cache_timeout=(
+                    FragmentCacheMixin.fragment_cache_timeout
+                ),
+            )
+        return self.set_validators(response, etag, timestamp)
+
+
+class NoteDetail(ReadDatabaseMixin, ConditionalGetMixin, AsyncNoteBase):
+    """Заметка подробно."""
+    template_name = 'notes/detail.html'
+
+    async def get(self, request, slug):
+        state = await self.get_queryset().filter(
+            slug=slug
+        ).values_list('pk', 'updated').afirst()
+        if state is None:
+            raise Http404('Заметка не найдена.')
+        summary = await aget_summary(request.user.pk)
+        etag, timestamp, response = self.check_conditions(
+            views.detail_validators(state, summary)
+        )
+        if response is None:
+            note = await self.aget_object()
+            # Как и в синхронном представлении, текст, метки и связи
+            # читаются лениво - только при промахе кэша фрагментов.
+            # Поэтому шаблон отрисовывается в потоке, а не в цикле
+            # событий.
+            response = await sync_to_async(self.render)(
+                note=note,
+                object=note,
+                note_html=partial(note_html, note),
+                note_tags=note.tags.all(),
+                backlinks=backlinks(note),
+                similar_notes=partial(similar_notes, note),
+                notes_version=notes_version(summary),
+                fragment_cache_timeout=(
+                    FragmentCacheMixin.fragment_cache_timeout
+                ),
+            )
+        return self.set_validators(response, etag, timestamp)
@@ -0,0 +1,180 @@
+"""Кэш пользователей для AuthenticationMiddleware.
+
+Запись хранится по id пользователя вместе с хешем сессии
+(get_session_auth_hash) и используется, только если хеш совпадает с
+записанным в сессии. Смена пароля меняет хеш, а сохранение пользователя
+и выход из системы удаляют запись (см. notes.signals).
+
+Удаление видно только процессам с общим кэшем. В кэше процесса
+(LocMemCache) запись живёт не дольше LOCAL_USER_TIMEOUT секунд: столько
+старая сессия другого воркера ещё проходит после смены пароля. Для
+нескольких воркеров нужен общий кэш (проверка check --deploy).
+
+Для JSON API есть вход без cookie: заголовок Authorization: Bearer с
+подписанным токеном (make_api_token, команда api_token). В токене тот же
+хеш, поэтому смена пароля его отзывает.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.models import AnonymousUser
+from django.core import signing
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.crypto import constant_time_compare
+
+USER_CACHE = 'users'
+USER_KEY = 'auth:user:{user_id}'
+API_TOKEN_SALT = 'notes.auth.api-token'
+LOCAL_USER_TIMEOUT = 30
+
+
+def user_key(user_id):
+    return USER_KEY.format(user_id=user_id)
+
+
+def is_process_local(cache):
+    return isinstance(cache, LocMemCache)
+
+
+def user_timeout(cache):
+    """Время жизни записи: в кэше процесса не больше LOCAL_USER_TIMEOUT."""
+    if not is_process_local(cache):
+        return DEFAULT_TIMEOUT
+    if cache.default_timeout is None:
+        return LOCAL_USER_TIMEOUT
+    return min(cache.default_timeout, LOCAL_USER_TIMEOUT)
+
+
+def cache_user(backend_path, user):
+    cache = caches[USER_CACHE]
+    cache.set(
+        user_key(user.pk),
+        (backend_path, user.get_session_auth_hash(), user),
+        user_timeout(cache),
+    )
+
+
+def match_entry(entry, backend_path, session_hash):
+    """Пользователь из записи кэша, если она подходит к сессии."""
+    if entry is None or not session_hash:
+        return None
+    cached_backend, cached_hash, user = entry
+    if (
+        cached_backend != backend_path
+        or backend_path not in settings.AUTHENTICATION_BACKENDS
+        or not constant_time_compare(cached_hash, session_hash)
+    ):
+        return None
+    return user
+
+
+def remember_user(request, user):
+    if user.is_authenticated:
+        cache_user(request.session.get(auth.BACKEND_SESSION_KEY), user)
+    return user
+
+
+async def aremember_user(request, user):
+    if user.is_authenticated:
+        cache_user(
+            await request.session.aget(auth.BACKEND_SESSION_KEY), user
+        )
+    return user
+
+
+def forget_user(user_id):
+    caches[USER_CACHE].delete(user_key(user_id))
+
+
+def get_user(request):
+    """Как auth.get_user, но без запроса к базе при попадании в кэш."""
+    if not hasattr(request, '_cached_user'):
+        session = request.session
+        user_id = session.get(auth.SESSION_KEY)
+        user = None
+        if user_id is not None:
+            user = match_entry(
+                caches[USER_CACHE].get(user_key(user_id)),
+                session.get(auth.BACKEND_SESSION_KEY),
+                session.get(auth.HASH_SESSION_KEY),
+            )
+        if user is None:
+            user = remember_user(request, auth.get_user(request))
+        request._cached_user = user
+    return request._cached_user
+
+
+async def aget_user(request):
+    """Асинхронный get_user."""
+    if not hasattr(request, '_acached_user'):
+        session = request.session
+        user_id = await session.aget(auth.SESSION_KEY)
+        user = None
+        if user_id is not None:
+            user = match_entry(
+                caches[USER_CACHE].get(user_key(user_id)),
+                await session.aget(auth.BACKEND_SESSION_KEY),
+                await session.aget(auth.HASH_SESSION_KEY),
+            )
+        if user is None:
+            user = await aremember_user(request, await auth.aget_user(request))
+        request._acached_user = user
+    return request._acached_user
+
+
+def make_api_token(user):
+    """Токен API: id пользователя и хеш пароля, подписанные SECRET_KEY."""
+    return signing.dumps(
+        [user.pk, user.get_session_auth_hash()], salt=API_TOKEN_SALT
+    )
+
+
+def api_token(request):
+    """Токен из заголовка Authorization: Bearer или None."""
+    scheme, _, token = request.META.get(
+        'HTTP_AUTHORIZATION', ''
+    ).partition(' ')
+    if scheme.lower() != 'bearer':
+        return None
+    return token.strip()
+
+
+def load_api_token(token):
+    """(id пользователя, хеш) из токена или None, если он неверен."""
+    try:
+        user_id, token_hash = signing.loads(
+            token, salt=API_TOKEN_SALT,
+            max_age=getattr(settings, 'API_TOKEN_MAX_AGE', None),
+        )
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    return user_id, token_hash
+
+
+def match_token(user, token_hash):
+    if user is None or not constant_time_compare(
+        str(token_hash), user.get_session_auth_hash()
+    ):
+        return AnonymousUser()
+    return user
+
+
+def user_from_token(token):
+    payload = load_api_token(token)
+    if payload is None:
+        return AnonymousUser()
+    user = auth.get_user_model().objects.filter(
+        pk=payload[0], is_active=True
+    ).first()
+    return match_token(user, payload[1])
+
+
+async def auser_from_token(token):
+    payload = load_api_token(token)
+    if payload is None:
+        return AnonymousUser()
+    user = await auth.get_user_model().objects.filter(
+        pk=payload[0], is_active=True
+    ).afirst()
+    return match_token(user, payload[1])
@@ -0,0 +1,153 @@
+import json
+import math
+import time
+from itertools import cycle
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .bulk import after_bulk_create
+from .models import Note
+
+User = get_user_model()
+
+ROUTES = ('notes:list', 'notes:detail', 'notes:add', 'notes:edit',
+          'notes:delete')
+# Метрики, рост которых - регрессия, и метрики, падение которых - регрессия.
+LOWER_IS_BETTER = ('p50', 'p95', 'p99', 'queries')
+HIGHER_IS_BETTER = ('throughput',)
+
+
+def seed(users, notes_per_user, text_bytes, batch_size=1000):
+    """Создаёт пользователей и заметки пачками, минуя сигналы."""
+    text = ('x' * 63 + '\n') * (text_bytes // 64) + 'x' * (text_bytes % 64)
+    authors = User.objects.bulk_create(
+        User(username=f'bench-{number}') for number in range(users)
+    )
+    for author in authors:
+        for start in range(0, notes_per_user, batch_size):
+            notes = Note.objects.bulk_create(
+                Note(
+                    title=f'Заметка {number}',
+                    text=text,
+                    slug=f'bench-{author.pk}-{number}',
+                    author=author,
+                )
+                for number in range(
+                    start, min(start + batch_size, notes_per_user)
+                )
+            )
+            after_bulk_create(notes)
+    return authors
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(timings, queries, elapsed):
+    return {
+        'requests': len(timings),
+        'throughput': len(timings) / elapsed if elapsed else 0.0,
+        'p50': percentile(timings, 0.50),
+        'p95': percentile(timings, 0.95),
+        'p99': percentile(timings, 0.99),
+        'queries': sum(queries) / len(queries),
+    }
+
+
+def route_requests(route, author, requests):
+    """Запросы (метод, URL, данные) для одного маршрута."""
+    slugs = cycle(
+        Note.objects.filter(author=author)
+        .order_by('id').values_list('slug', flat=True)[:requests]
+    )
+    for number in range(requests):
+        if route == 'notes:list':
+            yield 'get', reverse(route), None
+        elif route == 'notes:detail':
+            yield 'get', reverse(route, args=(next(slugs),)), None
+        elif route == 'notes:add':
+            yield 'post', reverse(route), {
+                'title': f'Новая {number}', 'text': 'Текст',
+                'slug': f'bench-new-{author.pk}-{number}',
+            }
+        elif route == 'notes:edit':
+            slug = next(slugs)
+            yield 'post', reverse(route, args=(slug,)), {
+                'title': f'Правка {number}', 'text': 'Новый текст',
+                'slug': slug,
+            }
+        elif route == 'notes:delete':
+            yield 'post', reverse(route, args=(next(slugs),)), None
+
+
+# Меряем представления, а не ограничение частоты записей
+# (AdmissionMiddleware): иначе запись дальше ADMISSION_BURST - это 429.
+@override_settings(ADMISSION_BURST=math.inf)
+def run(author, requests, routes=ROUTES):
+    """Прогоняет маршруты через тестовый клиент и собирает статистику.
+
+    Удаление идёт последним и удаляет разные заметки, поэтому у автора
+    должно быть не меньше requests заметок.
+    """
+    client = Client()
+    client.force_login(author)
+    for cache in caches.all():
+        cache.clear()
+    results = {}
+    for route in routes:
+        timings, queries = [], []
+        started = time.perf_counter()
+        for method, url, data in route_requests(route, author, requests):
+            with CaptureQueriesContext(connection) as captured:
+                request_started = time.perf_counter()
+                response = getattr(client, method)(url, data)
+                timings.append(time.perf_counter() - request_started)
+            if response.status_code >= 400:
+                raise RuntimeError(
+                    f'{route}: {url} ответил {response.status_code}'
+                )
+            queries.append(len(captured))
+        results[route] = summarize(
+            timings, queries, time.perf_counter() - started
+        )
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Список регрессий относительно baseline с допуском threshold."""
+    regressions = []
+    for route, metrics in results.items():
+        expected = baseline.get(route)
+        if expected is None:
+            continue
+        for name in LOWER_IS_BETTER:
+            if metrics[name] > expected[name] * (1 + threshold):
+                regressions.append(
+                    f'{route} {name}: {metrics[name]:.4f} > '
+                    f'{expected[name]:.4f}'
+                )
+        for name in HIGHER_IS_BETTER:
+            if metrics[name] < expected[name] * (1 - threshold):
+                regressions.append(
+                    f'{route} {name}: {metrics[name]:.1f} < '
+                    f'{expected[name]:.1f}'
+                )
+    return regressions
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as stream:
+        return json.load(stream)
+
+
+def save_baseline(path, results):
+    with open(path, 'w', encoding='utf-8') as stream:
+        json.dump(results, stream, indent=2, ensure_ascii=False)
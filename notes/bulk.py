@@ -0,0 +1,27 @@
+"""Учёт новых заметок, созданных bulk_create.
+
+bulk_create не отправляет сигналы post_save, поэтому импорт и
+заполнение данных для бенчмарка обновляют производные таблицы сами -
+одним вызовом, чтобы эти пути не расходились с сигналами.
+"""
+from collections import Counter
+
+from .links import link_notes
+from .search import index_notes
+from .similarity import band_notes
+from .summary import note_added
+
+
+def after_bulk_create(notes):
+    """Индекс, ссылки, полосы LSH и сводки авторов пачки новых заметок."""
+    index_notes(notes)
+    link_notes(notes)
+    band_notes(notes)
+    counts = Counter(note.author_id for note in notes)
+    latest = {}
+    for note in notes:
+        latest[note.author_id] = max(
+            note.updated, latest.get(note.author_id, note.updated)
+        )
+    for author_id, count in counts.items():
+        note_added(author_id, latest[author_id], count)
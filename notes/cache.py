@@ -0,0 +1,75 @@
+from threading import Lock
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+FRAGMENT_CACHE = 'fragments'
+
+# Счётчики общие для всех экземпляров кэша с одним LOCATION,
+# как и сами данные LocMemCache.
+_stats = {}
+_stats_locks = {}
+
+
+class StatsLocMemCache(LocMemCache):
+    """LocMemCache со счётчиками попаданий, промахов и вытеснений."""
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._stats = _stats.setdefault(
+            name, {'hits': 0, 'misses': 0, 'evictions': 0}
+        )
+        self._stats_lock = _stats_locks.setdefault(name, Lock())
+
+    def _count(self, counter, amount=1):
+        with self._stats_lock:
+            self._stats[counter] += amount
+
+    def get(self, key, default=None, version=None):
+        missing = object()
+        value = super().get(key, missing, version=version)
+        if value is missing:
+            self._count('misses')
+            return default
+        self._count('hits')
+        return value
+
+    def _cull(self):
+        # Вызывается под блокировкой кэша, когда достигнут MAX_ENTRIES.
+        before = len(self._cache)
+        super()._cull()
+        self._count('evictions', before - len(self._cache))
+
+    def stats(self):
+        """Снимок счётчиков и доля попаданий."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        requests = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / requests if requests else 0.0
+        stats['size'] = len(self._cache)
+        return stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            for counter in self._stats:
+                self._stats[counter] = 0
+
+
+def notes_version(summary):
+    """Версия заметок автора для ключей фрагментов - из его сводки.
+
+    Сводка (notes.summary) меняется в одной транзакции с заметками и
+    метками и хранится в базе: после фиксации новую версию видят все
+    процессы, а до неё никто не сохранит старое содержимое под новым
+    ключом. Сбрасывать фрагменты отдельно не нужно.
+    """
+    note_count, last_modified = summary
+    return f'{note_count}:{last_modified.isoformat() if last_modified else ""}'
+
+
+def fragment_cache_stats():
+    """Счётчики кэша фрагментов, если бэкенд их ведёт."""
+    fragment_cache = caches[FRAGMENT_CACHE]
+    if not hasattr(fragment_cache, 'stats'):
+        return {}
+    return fragment_cache.stats()
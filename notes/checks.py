@@ -0,0 +1,21 @@
+from django.core.cache import caches
+from django.core.checks import Tags, Warning, register
+
+from .auth import LOCAL_USER_TIMEOUT, USER_CACHE, is_process_local
+
+
+@register(Tags.caches, Tags.security, deploy=True)
+def check_user_cache(app_configs, **kwargs):
+    """Кэш пользователей должен быть общим для всех воркеров."""
+    if not is_process_local(caches[USER_CACHE]):
+        return []
+    return [Warning(
+        f'Кэш {USER_CACHE!r} хранится в памяти процесса: после смены '
+        'пароля старые сессии в других воркерах действуют ещё до '
+        f'{LOCAL_USER_TIMEOUT} с.',
+        hint=(
+            f'Укажите для CACHES[{USER_CACHE!r}] общий кэш '
+            '(Redis, Memcached или базу данных).'
+        ),
+        id='notes.W001',
+    )]
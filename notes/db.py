@@ -0,0 +1,73 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Псевдоним соединения (или реплики) только для чтения.
+READ_DATABASE = 'read'
+
+_reading = ContextVar('notes_read_database', default=False)
+
+
+def apply_sqlite_pragmas(connection):
+    """Применяет PRAGMA из профиля базы к новому соединению SQLite."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        if connection.alias == READ_DATABASE:
+            cursor.execute('PRAGMA query_only = ON')
+
+
+@contextmanager
+def use_read_database():
+    """Внутри блока чтение заметок идёт через соединение для чтения."""
+    token = _reading.set(True)
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+class ReadDatabaseRouter:
+    """Направляет чтение заметок из read-only представлений на READ_DATABASE.
+
+    Сессии и пользователи всегда читаются из основной базы, чтобы
+    вход в систему не зависел от отставания реплики.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            _reading.get()
+            and model._meta.app_label == 'notes'
+            and READ_DATABASE in settings.DATABASES
+        ):
+            return READ_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == READ_DATABASE:
+            return False
+        return None
+
+
+class ReadDatabaseMixin:
+    """Выполняет представление с чтением из READ_DATABASE."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self._async_dispatch(request, *args, **kwargs)
+        with use_read_database():
+            return super().dispatch(request, *args, **kwargs)
+
+    async def _async_dispatch(self, request, *args, **kwargs):
+        with use_read_database():
+            return await super().dispatch(request, *args, **kwargs)
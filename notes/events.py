@@ -0,0 +1,153 @@
+"""Поток изменений заметок автора (Server-Sent Events) для ASGI.
+
+Сигналы сохранения и удаления Note после фиксации транзакции
+публикуют событие в broker процесса. Каждое открытое соединение -
+подписка с ограниченным буфером в цикле событий: ожидающий клиент
+не занимает поток, а только объект подписки и корутину. Если клиент
+не успевает читать и буфер переполнился, события заменяются одним
+reset - клиенту стоит перечитать список целиком.
+
+События видят только соединения этого процесса; при нескольких
+воркерах клиент получает изменения, сделанные в его воркере.
+"""
+import asyncio
+import json
+from collections import defaultdict, deque
+from http import HTTPStatus
+from itertools import count
+from threading import Lock
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+
+RESET = (None, {'action': 'reset'})
+RETRY_MILLISECONDS = 5000
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+class Subscription:
+    """Буфер событий одного соединения; живёт в его цикле событий."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.size = setting('NOTES_EVENTS_BUFFER', 100)
+        self.events = deque()
+        self.ready = asyncio.Event()
+
+    def push(self, event):
+        """Кладёт пару (номер, событие) в буфер."""
+        if len(self.events) >= self.size:
+            self.events.clear()
+            event = RESET
+        self.events.append(event)
+        self.ready.set()
+
+    async def next(self, timeout):
+        """Следующее событие или None, если за timeout ничего не было."""
+        if not self.events:
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except TimeoutError:
+                return None
+        self.ready.clear()
+        return self.events.popleft()
+
+
+class Broker:
+    """Подписки процесса по пользователям."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.subscriptions = defaultdict(set)
+        self.ids = count(1)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self.lock:
+            self.subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscriptions[subscription.user_id]
+
+    def publish(self, user_id, event):
+        """Отдаёт событие подпискам пользователя из любого потока."""
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(user_id, ()))
+            event = (next(self.ids), event)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.push, event
+                )
+            except RuntimeError:
+                # Цикл событий соединения уже закрыт.
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self):
+        with self.lock:
+            return sum(map(len, self.subscriptions.values()))
+
+
+broker = Broker()
+
+
+def note_event(action, note):
+    return {
+        'action': action,
+        'id': note.pk,
+        'slug': note.slug,
+        'title': note.title,
+    }
+
+
+def format_event(event_id, event):
+    data = json.dumps(event, ensure_ascii=False)
+    prefix = f'id: {event_id}\n' if event_id else ''
+    return f'{prefix}event: note\ndata: {data}\n\n'.encode()
+
+
+async def stream(user_id):
+    heartbeat = setting('NOTES_EVENTS_HEARTBEAT', 15)
+    # Подписка появляется, только когда сервер начал отдавать поток.
+    subscription = broker.subscribe(user_id)
+    try:
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'.encode()
+        while True:
+            event = await subscription.next(heartbeat)
+            if event is None:
+                # Комментарий не даёт прокси закрыть тихое соединение.
+                yield b': ping\n\n'
+            else:
+                yield format_event(*event)
+    finally:
+        # Сервер отменяет поток, когда клиент отключился.
+        broker.unsubscribe(subscription)
+
+
+async def note_events(request):
+    """События create/update/delete заметок пользователя."""
+    if not isinstance(request, ASGIRequest):
+        # Под WSGI бесконечный поток занял бы воркер целиком.
+        return HttpResponse(
+            'Поток событий доступен только под ASGI.',
+            status=HTTPStatus.NOT_IMPLEMENTED,
+        )
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=HTTPStatus.UNAUTHORIZED)
+    return StreamingHttpResponse(
+        stream(user.pk),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
@@ -0,0 +1,72 @@
+import io
+import zipfile
+
+from asgiref.sync import sync_to_async
+
+# Сколько символов текста сжимать за один шаг и сколько строк
+# читать из базы за один запрос.
+TEXT_CHUNK = 64 * 1024
+ROWS_CHUNK = 100
+
+
+class ZipBuffer(io.RawIOBase):
+    """Поток без seek: ZipFile пишет в него, генератор забирает байты."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def note_markdown(note):
+    """Части Markdown-файла заметки, текст нарезан кусками."""
+    yield f'# {note.title}\n\n'
+    for start in range(0, len(note.text), TEXT_CHUNK):
+        yield note.text[start:start + TEXT_CHUNK]
+    yield '\n'
+
+
+def stream_zip(notes):
+    """Отдаёт ZIP с файлом <slug>.md на каждую заметку по мере сжатия.
+
+    В памяти одновременно держится одна пачка строк из базы и один
+    кусок сжатых данных, сколько бы заметок ни было.
+    """
+    buffer = ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for note in notes.iterator(chunk_size=ROWS_CHUNK):
+            info = zipfile.ZipInfo(f'{note.slug}.md')
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, 'w', force_zip64=True) as entry:
+                for part in note_markdown(note):
+                    entry.write(part.encode())
+                    yield buffer.pop()
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+async def astream_zip(notes):
+    """stream_zip для ASGI: каждый кусок сжимается в потоке.
+
+    Синхронный генератор под ASGI Django целиком собирает в список,
+    прежде чем отправить. Здесь куски отдаются по одному, а чтение
+    базы и сжатие остаются в одном потоке запроса.
+    """
+    chunks = stream_zip(notes)
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # Клиент мог отключиться: закрываем курсор в том же потоке.
+        await sync_to_async(chunks.close)()
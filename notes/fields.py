@@ -0,0 +1,214 @@
+"""Текстовое поле, сжимающее большие значения.
+
+Значение длиннее NOTES_COMPRESS_THRESHOLD байт хранится в той же
+колонке как BLOB: байт формата и сжатые zlib (или zstd, если установлен
+пакет zstandard и NOTES_COMPRESSION = 'zstd') данные. SQLite не
+приводит BLOB к тексту, поэтому короткие заметки остаются обычным
+текстом и по ним работает поиск LIKE. На других СУБД значения не
+сжимаются.
+
+Из базы сжатое значение приходит как CompressedText и распаковывается
+при первом обращении к атрибуту модели. values()/values_list() отдают
+CompressedText как есть - такие значения приводят через as_text().
+"""
+import hashlib
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+from .minhash import signature
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZLIB = b'\x01'
+ZSTD = b'\x02'
+DEFAULT_THRESHOLD = 4096
+COMPRESSION_LEVEL = 6
+PREVIEW_LENGTH = 140
+
+
+def compress(text):
+    """Сжатое значение или None, если сжимать не стоит."""
+    data = text.encode()
+    if len(data) < getattr(
+        settings, 'NOTES_COMPRESS_THRESHOLD', DEFAULT_THRESHOLD
+    ):
+        return None
+    if getattr(settings, 'NOTES_COMPRESSION', 'zlib') == 'zstd':
+        if zstandard is None:
+            raise ImproperlyConfigured(
+                'Для NOTES_COMPRESSION = "zstd" нужен пакет zstandard.'
+            )
+        packed = ZSTD + zstandard.ZstdCompressor().compress(data)
+    else:
+        packed = ZLIB + zlib.compress(data, COMPRESSION_LEVEL)
+    return packed if len(packed) < len(data) else None
+
+
+def decompress(packed):
+    packed = bytes(packed)
+    method, data = packed[:1], packed[1:]
+    if method == ZLIB:
+        return zlib.decompress(data).decode()
+    if method == ZSTD:
+        if zstandard is None:
+            raise ImproperlyConfigured(
+                'Заметка сжата zstd, но пакет zstandard не установлен.'
+            )
+        return zstandard.ZstdDecompressor().decompress(data).decode()
+    raise ValueError('Неизвестный формат сжатого текста.')
+
+
+class CompressedText:
+    """Сжатое значение из базы; распаковывается при первом str()."""
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = bytes(data)
+
+    def __str__(self):
+        return decompress(self.data)
+
+    def __repr__(self):
+        return f'<CompressedText: {len(self.data)} bytes>'
+
+
+def as_text(value):
+    """Строка из значения values()/values_list() сжатого поля."""
+    if isinstance(value, CompressedText):
+        return str(value)
+    return value
+
+
+class CompressedTextDescriptor(DeferredAttribute):
+    """Распаковывает значение при первом чтении атрибута.
+
+    Дескриптор данных (есть __set__), иначе значение из __dict__
+    экземпляра возвращалось бы в обход __get__.
+    """
+
+    def __get__(self, instance, cls=None):
+        value = super().__get__(instance, cls)
+        if isinstance(value, CompressedText):
+            value = instance.__dict__[self.field.attname] = str(value)
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.TextField):
+    descriptor_class = CompressedTextDescriptor
+
+    def from_db_value(self, value, expression, connection):
+        if isinstance(value, (bytes, memoryview)):
+            return CompressedText(value)
+        return value
+
+    def to_python(self, value):
+        if isinstance(value, CompressedText):
+            return str(value)
+        return super().to_python(value)
+
+    def get_db_prep_save(self, value, connection):
+        if hasattr(value, 'as_sql'):
+            return value
+        if connection.vendor == 'sqlite':
+            if isinstance(value, CompressedText):
+                # Не распакованное значение записываем без пересжатия.
+                return value.data
+            value = self.get_prep_value(value)
+            if value is not None:
+                packed = compress(value)
+                if packed is not None:
+                    return packed
+            return value
+        return super().get_db_prep_save(as_text(value), connection)
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def make_preview(text, length=PREVIEW_LENGTH):
+    """Начало текста в одну строку, не длиннее length символов."""
+    # Пробелы схлопываются только в начале текста, а не во всём нём.
+    words = text[:length * 4].split()
+    preview = ' '.join(words)
+    if len(preview) > length or len(text) > length * 4:
+        preview = preview[:length - 1].rstrip() + '…'
+    return preview
+
+
+class DerivedField:
+    """Значение, вычисляемое из поля source при каждом сохранении.
+
+    Считается и при bulk_create. Если текст не менялся после загрузки
+    (остался сжатым), значение не пересчитывается.
+    """
+
+    def __init__(self, *args, source='text', **kwargs):
+        self.source = source
+        kwargs.setdefault('blank', True)
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['source'] = self.source
+        return name, path, args, kwargs
+
+    def derive(self, text):
+        raise NotImplementedError
+
+    def pre_save(self, model_instance, add):
+        text = model_instance.__dict__.get(self.source)
+        current = model_instance.__dict__.get(self.attname)
+        if isinstance(text, CompressedText) and current is not None:
+            return current
+        value = self.derive(getattr(model_instance, self.source))
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class DerivedTextField(DerivedField, models.CharField):
+    pass
+
+
+class PreviewField(DerivedTextField):
+    """Краткое начало текста для списков."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', PREVIEW_LENGTH)
+        super().__init__(*args, **kwargs)
+
+    def derive(self, text):
+        return make_preview(text)
+
+
+class DigestField(DerivedTextField):
+    """SHA-256 текста: ключ закэшированной отрисовки (notes.rendering)."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 64)
+        super().__init__(*args, **kwargs)
+
+    def derive(self, text):
+        return text_digest(text)
+
+
+class SignatureField(DerivedField, models.BinaryField):
+    """MinHash-подпись текста для поиска похожих (notes.similarity)."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('null', True)
+        super().__init__(*args, **kwargs)
+
+    def derive(self, text):
+        return signature(text)
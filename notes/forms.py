@@ -1,29 +1,68 @@
-from pytils.translit import slugify
-
 from django import forms
 from django.core.exceptions import ValidationError
 
-from .models import Note
+from .models import Note, Tag
+from .tags import MAX_TAGS, parse_tags, set_tags, tag_string
 
 WARNING = ' - такой slug уже существует, придумайте уникальное значение!'
 
 
 class NoteForm(forms.ModelForm):
     """Форма для создания или обновления заметки."""
+    tags = forms.CharField(
+        label='Метки',
+        required=False,
+        help_text='Через пробел или запятую',
+    )
 
     class Meta:
         model = Note
         fields = ('title', 'text', 'slug')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Асинхронные представления передают метки в initial сами.
+        if (
+            self.instance.pk and not self.is_bound
+            and 'tags' not in self.initial
+        ):
+            self.initial['tags'] = tag_string(self.instance)
+
+    def clean_tags(self):
+        names = parse_tags(self.cleaned_data['tags'])
+        if len(names) > MAX_TAGS:
+            raise ValidationError(f'Не больше {MAX_TAGS} меток.')
+        max_length = Tag._meta.get_field('name').max_length
+        for name in names:
+            if len(name) > max_length:
+                raise ValidationError(
+                    f'Метка {name} длиннее {max_length} символов.'
+                )
+        return names
+
+    def _save_m2m(self):
+        super()._save_m2m()
+        set_tags(self.instance, self.cleaned_data['tags'])
+
     def clean_slug(self):
-        """Обрабатывает случай, если slug не уникален."""
-        cleaned_data = super().clean()
-        slug = cleaned_data.get('slug')
-        if not slug:
-            title = cleaned_data.get('title')
-            slug = slugify(title)[:100]
-        if Note.objects.filter(
+        """Обрабатывает случай, если заданный slug не уникален.
+
+        Пустой slug подберёт модель при сохранении.
+        """
+        slug = self.cleaned_data.get('slug')
+        if slug and Note.objects.filter(
                 slug=slug
         ).exclude(id=self.instance.pk).exists():
             raise ValidationError(slug + WARNING)
         return slug
+
+    def slug_taken(self):
+        """Занят ли заданный slug другой заметкой.
+
+        Нужно после IntegrityError при сохранении: ошибка могла прийти
+        не от уникальности slug.
+        """
+        slug = self.cleaned_data.get('slug')
+        return bool(slug) and Note.objects.filter(
+            slug=slug
+        ).exclude(id=self.instance.pk).exists()
@@ -0,0 +1,314 @@
+"""Очередь фоновых задач в базе.
+
+Задача - строка Job: имя зарегистрированной функции и её аргументы
+в JSON. Поставленная в транзакции запроса задача сохраняется вместе
+с его изменениями и переживает перезапуск процесса. Обработчик
+(Worker) захватывает готовые задачи и выполняет их в пуле потоков
+или процессов: внутри приложения (JOBS_RUN_IN_APP) или отдельной
+командой run_jobs. Несколько обработчиков могут работать с одной
+базой: захват - условный UPDATE, задачу получает только один.
+
+Упавшая задача повторяется с экспоненциальной задержкой, пока не
+исчерпает max_attempts. Задача с ключом ставится один раз: повторная
+постановка с тем же ключом ничего не делает. Выполненные задачи
+старше JOBS_KEEP_DAYS обработчик удаляет сам раз в JOBS_PURGE_INTERVAL
+секунд.
+"""
+import atexit
+import logging
+import random
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+from multiprocessing import get_context
+from threading import Event, Lock, Thread
+
+import django
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+DEFAULT_MAX_ATTEMPTS = 5
+PURGE_BATCH_SIZE = 1000
+# Дольше этого обработчик не ждёт после сбоя своего цикла.
+MAX_ERROR_DELAY = 60
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+# Обработчик, запущенный в этом процессе (start_worker).
+worker = None
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def task(name, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Регистрирует функцию как задачу с именем name."""
+    def register(func):
+        func.max_attempts = max_attempts
+        TASKS[name] = func
+        return func
+    return register
+
+
+def enqueue(name, *args, key=None, delay=0):
+    """Ставит задачу в очередь в текущей транзакции.
+
+    Обработчик этого процесса просыпается после фиксации транзакции,
+    остальные найдут задачу при следующем опросе.
+    """
+    if name not in TASKS:
+        raise LookupError(f'Задача {name} не зарегистрирована.')
+    job = Job(
+        name=name,
+        args=list(args),
+        key=key,
+        max_attempts=TASKS[name].max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    if key is None:
+        job.save(force_insert=True)
+    else:
+        Job.objects.bulk_create([job], ignore_conflicts=True)
+    transaction.on_commit(wake)
+
+
+def wake():
+    if worker is not None:
+        worker.wakeup.set()
+
+
+def retry_delay(attempts):
+    """Задержка перед повтором: растёт вдвое, со случайным разбросом."""
+    delay = min(
+        setting('JOBS_RETRY_DELAY', 5) * 2 ** (attempts - 1),
+        setting('JOBS_RETRY_MAX_DELAY', 3600),
+    )
+    # Разброс не даёт задачам, упавшим вместе, вместе и повториться.
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def release_stale():
+    """Возвращает в очередь задачи упавших обработчиков."""
+    ids = list(Job.objects.filter(
+        state=Job.RUNNING,
+        locked_at__lt=timezone.now() - timedelta(
+            seconds=setting('JOBS_LOCK_TIMEOUT', 600)
+        ),
+    ).values_list('id', flat=True))
+    # Без зависших задач обходимся чтением: UPDATE взял бы блокировку
+    # записи SQLite даже без подходящих строк.
+    if not ids:
+        return
+    stale = Job.objects.filter(pk__in=ids, state=Job.RUNNING)
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        state=Job.FAILED,
+        finished=timezone.now(),
+        last_error='Обработчик не завершил задачу.',
+    )
+    stale.update(state=Job.PENDING, locked_by='', locked_at=None)
+
+
+def claim(limit):
+    """Захватывает до limit готовых задач и возвращает их."""
+    now = timezone.now()
+    ids = list(
+        Job.objects.filter(state=Job.PENDING, run_at__lte=now)
+        .order_by('run_at').values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # Задачи, которые успел захватить другой обработчик, уже не PENDING.
+    Job.objects.filter(pk__in=ids, state=Job.PENDING).update(
+        state=Job.RUNNING,
+        locked_by=token,
+        locked_at=now,
+        attempts=F('attempts') + 1,
+    )
+    return list(Job.objects.filter(locked_by=token, state=Job.RUNNING))
+
+
+def finish(job, **fields):
+    # Задачу могли вернуть в очередь как зависшую - тогда не трогаем.
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+        locked_by='', locked_at=None, **fields
+    )
+
+
+def execute(job):
+    """Выполняет захваченную задачу и записывает результат."""
+    try:
+        func = TASKS.get(job.name)
+        if func is None:
+            raise LookupError(f'Задача {job.name} не зарегистрирована.')
+        func(*job.args)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            finish(
+                job, state=Job.FAILED, finished=timezone.now(),
+                last_error=error,
+            )
+        else:
+            finish(
+                job, state=Job.PENDING,
+                run_at=timezone.now() + retry_delay(job.attempts),
+                last_error=error,
+            )
+    else:
+        finish(job, state=Job.DONE, finished=timezone.now(), last_error='')
+
+
+def run_job(job_id):
+    """Выполняет задачу в потоке или процессе пула."""
+    close_old_connections()
+    try:
+        job = Job.objects.filter(pk=job_id, state=Job.RUNNING).first()
+        if job is not None:
+            execute(job)
+    finally:
+        close_old_connections()
+
+
+def run_pending(limit=100):
+    """Выполняет готовые задачи в текущем потоке; возвращает их число."""
+    total = 0
+    while True:
+        jobs = claim(limit)
+        if not jobs:
+            return total
+        for job in jobs:
+            execute(job)
+        total += len(jobs)
+
+
+def purge_finished(days=None, batch_size=PURGE_BATCH_SIZE):
+    """Удаляет выполненные задачи старше days дней пачками.
+
+    Вместе с задачей пропадает и её ключ идемпотентности. Неудавшиеся
+    задачи остаются для разбора.
+    """
+    if days is None:
+        days = setting('JOBS_KEEP_DAYS', 7)
+    before = timezone.now() - timedelta(days=days)
+    total = 0
+    while True:
+        ids = list(
+            Job.objects.filter(state=Job.DONE, finished__lt=before)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return total
+        total += Job.objects.filter(pk__in=ids).delete()[0]
+
+
+def make_pool(kind, size):
+    if kind == 'process':
+        # spawn: дочерний процесс не наследует соединения с базой.
+        return ProcessPoolExecutor(
+            size, mp_context=get_context('spawn'), initializer=django.setup
+        )
+    return ThreadPoolExecutor(size, thread_name_prefix='notes-jobs')
+
+
+class Worker:
+    """Захватывает задачи, пока в пуле есть свободные места."""
+
+    def __init__(self, size=None, pool=None):
+        self.size = size or setting('JOBS_WORKERS', 2)
+        self.pool = make_pool(
+            pool or setting('JOBS_POOL', 'thread'), self.size
+        )
+        self.lock = Lock()
+        self.running = set()
+        self.wakeup = Event()
+        self.stopping = Event()
+        self.released_at = None
+        self.purged_at = None
+
+    def done(self, future):
+        with self.lock:
+            self.running.discard(future)
+        # Место в пуле освободилось.
+        self.wakeup.set()
+
+    def maybe_release_stale(self):
+        interval = setting('JOBS_LOCK_TIMEOUT', 600) / 2
+        now = time.monotonic()
+        if self.released_at is None or now - self.released_at >= interval:
+            self.released_at = now
+            release_stale()
+
+    def maybe_purge(self):
+        interval = setting('JOBS_PURGE_INTERVAL', 3600)
+        now = time.monotonic()
+        if self.purged_at is None or now - self.purged_at >= interval:
+            self.purged_at = now
+            purge_finished()
+
+    def run_once(self):
+        """Отдаёт в пул готовые задачи; возвращает их число."""
+        with self.lock:
+            free = self.size - len(self.running)
+        if free <= 0:
+            return 0
+        close_old_connections()
+        self.maybe_release_stale()
+        self.maybe_purge()
+        jobs = claim(free)
+        for job in jobs:
+            future = self.pool.submit(run_job, job.pk)
+            with self.lock:
+                self.running.add(future)
+            future.add_done_callback(self.done)
+        return len(jobs)
+
+    def run(self, burst=False):
+        """Цикл обработчика; burst - выйти, когда задачи кончатся."""
+        interval = setting('JOBS_POLL_INTERVAL', 1.0)
+        failures = 0
+        while not self.stopping.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception as error:
+                # Сбой цикла (например, база занята или недоступна) не
+                # должен молча останавливать фоновый поток.
+                failures += 1
+                if isinstance(error, DatabaseError):
+                    logger.warning('База недоступна обработчику: %s', error)
+                else:
+                    logger.exception('Сбой обработчика задач')
+                close_old_connections()
+                self.stopping.wait(
+                    min(interval * 2 ** failures, MAX_ERROR_DELAY)
+                )
+                continue
+            failures = 0
+            if burst and not claimed and not self.running:
+                break
+            self.wakeup.wait(interval)
+            self.wakeup.clear()
+        close_old_connections()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        self.pool.shutdown(wait=True)
+
+
+def start_worker():
+    """Запускает обработчик в фоновом потоке процесса приложения."""
+    global worker
+    if worker is None:
+        worker = Worker()
+        Thread(target=worker.run, name='notes-jobs', daemon=True).start()
+        atexit.register(worker.stop)
+    return worker
@@ -0,0 +1,57 @@
+"""Вики-ссылки [[slug]] между заметками.
+
+Ссылки из текста хранятся в NoteLink и обновляются при сохранении
+заметки разницей старого и нового набора, поэтому обратные ссылки -
+выборка по индексу (target_slug, source), а не поиск по всем текстам.
+"""
+import re
+
+from .models import Note, NoteLink
+
+WIKI_LINK = re.compile(r'\[\[([-a-zA-Z0-9_]{1,100})\]\]')
+# Внутри кода [[...]] - не ссылка, как и при отрисовке Markdown.
+CODE = re.compile(r'```.*?```|`[^`\n]*`', re.DOTALL)
+
+
+def parse_links(text):
+    """Множество slug, на которые ссылается текст."""
+    return set(WIKI_LINK.findall(CODE.sub('', text)))
+
+
+def update_links(note, created=False):
+    """Приводит ссылки заметки к её тексту; возвращает (добавлено, удалено)."""
+    links = parse_links(note.text)
+    stored = set() if created else set(
+        NoteLink.objects.filter(source=note)
+        .values_list('target_slug', flat=True)
+    )
+    added, removed = links - stored, stored - links
+    if removed:
+        NoteLink.objects.filter(
+            source=note, target_slug__in=removed
+        ).delete()
+    if added:
+        NoteLink.objects.bulk_create(
+            [NoteLink(source=note, target_slug=slug) for slug in added],
+            ignore_conflicts=True,
+        )
+    return len(added), len(removed)
+
+
+def link_notes(notes):
+    """Ссылки пачки новых заметок одним INSERT (для bulk_create)."""
+    NoteLink.objects.bulk_create(
+        [
+            NoteLink(source=note, target_slug=slug)
+            for note in notes
+            for slug in parse_links(note.text)
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def backlinks(note):
+    """Заметки того же автора, ссылающиеся на note."""
+    return Note.objects.filter(
+        author_id=note.author_id, links__target_slug=note.slug
+    ).exclude(pk=note.pk).only('slug', 'title').order_by('title')
@@ -0,0 +1,21 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.auth import make_api_token
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Выдаёт токен JSON API (заголовок Authorization: Bearer).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Имя пользователя.')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(
+                f'Пользователь {options["username"]} не найден.'
+            )
+        self.stdout.write(make_api_token(user))
@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases,
+    teardown_test_environment,
+)
+
+from notes import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон маршрутов заметок на отдельной тестовой базе: '
+        'пропускная способность, p50/p95/p99 и число SQL-запросов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument(
+            '--notes', type=int, default=1000,
+            help='Заметок у каждого пользователя.',
+        )
+        parser.add_argument(
+            '--text-bytes', type=int, default=1024,
+            help='Размер текста каждой заметки.',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=100,
+            help='Запросов на каждый маршрут.',
+        )
+        parser.add_argument(
+            '--save-baseline', metavar='PATH',
+            help='Сохранить результаты как эталон.',
+        )
+        parser.add_argument(
+            '--compare', metavar='PATH',
+            help='Сравнить с эталоном и завершиться ошибкой при регрессии.',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимое ухудшение метрики (0.2 - на 20%%).',
+        )
+
+    def handle(self, *args, **options):
+        if options['notes'] < options['requests']:
+            raise CommandError(
+                '--notes должно быть не меньше --requests: '
+                'каждое удаление удаляет отдельную заметку.'
+            )
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            authors = benchmark.seed(
+                options['users'], options['notes'], options['text_bytes']
+            )
+            results = benchmark.run(authors[0], options['requests'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+        self.report(results)
+        if options['save_baseline']:
+            benchmark.save_baseline(options['save_baseline'], results)
+        if options['compare']:
+            regressions = benchmark.compare(
+                results,
+                benchmark.load_baseline(options['compare']),
+                options['threshold'],
+            )
+            if regressions:
+                raise CommandError(
+                    'Регрессия производительности:\n' + '\n'.join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"маршрут":<14}{"запр/с":>10}{"p50 мс":>10}{"p95 мс":>10}'
+            f'{"p99 мс":>10}{"SQL":>6}'
+        )
+        for route, metrics in results.items():
+            self.stdout.write(
+                f'{route:<14}{metrics["throughput"]:>10.1f}'
+                f'{metrics["p50"] * 1000:>10.2f}'
+                f'{metrics["p95"] * 1000:>10.2f}'
+                f'{metrics["p99"] * 1000:>10.2f}'
+                f'{metrics["queries"]:>6.1f}'
+            )
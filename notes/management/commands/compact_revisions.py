@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from notes.models import Note
+from notes.revisions import compact_revisions
+
+
+class Command(BaseCommand):
+    help = 'Сливает старые ревизии заметок, оставляя последние.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=50,
+            help='Сколько последних ревизий каждой заметки не трогать.',
+        )
+        parser.add_argument(
+            '--author',
+            help='Имя пользователя, чьи заметки нужно обработать.',
+        )
+
+    def handle(self, *args, **options):
+        keep = options['keep']
+        notes = Note.objects.annotate(
+            revision_count=Count('revisions')
+        ).filter(revision_count__gt=keep + 1)
+        if options['author']:
+            notes = notes.filter(author__username=options['author'])
+        total = 0
+        for note in notes:
+            total += compact_revisions(note, keep)
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено ревизий: {total}'
+        ))
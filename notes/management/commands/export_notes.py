@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notes.fields import as_text
+from notes.models import Note
+from notes.transfer import (
+    FORMATS, detect_format, open_stream, throughput, write_rows
+)
+
+
+class Command(BaseCommand):
+    help = 'Потоково выгружает заметки в JSONL или CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='-',
+            help="Файл для выгрузки, '-' - стандартный вывод.",
+        )
+        parser.add_argument('--format', choices=FORMATS)
+        parser.add_argument(
+            '--author',
+            help='Выгрузить заметки только этого пользователя.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Сколько строк читать из базы за один раз.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        notes = Note.objects.order_by('id')
+        if options['author']:
+            notes = notes.filter(author__username=options['author'])
+        rows = (
+            (title, as_text(text), slug, author)
+            for title, text, slug, author in notes.values_list(
+                'title', 'text', 'slug', 'author__username'
+            ).iterator(chunk_size=options['chunk_size'])
+        )
+        started = time.perf_counter()
+        total = 0
+        with open_stream(path, 'w') as stream:
+            fmt = detect_format(path, options['format'])
+            for _ in write_rows(stream, rows, fmt):
+                total += 1
+        elapsed = time.perf_counter() - started
+        # При выгрузке в stdout отчёт не должен попасть в данные.
+        report = self.stderr if path == '-' else self.stdout
+        report.write(
+            f'Выгружено заметок: {total} за {elapsed:.2f} с '
+            f'({throughput(total, elapsed):.0f} строк/с)'
+        )
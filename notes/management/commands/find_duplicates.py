@@ -0,0 +1,43 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.models import Note
+from notes.similarity import duplicate_clusters
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Находит группы почти одинаковых заметок по индексу LSH.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            help='Наименьшее сходство пары (по умолчанию '
+                 'NOTES_SIMILARITY_THRESHOLD).',
+        )
+        parser.add_argument(
+            '--author',
+            help='Искать только среди заметок этого пользователя.',
+        )
+
+    def handle(self, *args, **options):
+        author_id = None
+        if options['author']:
+            author_id = User.objects.filter(
+                username=options['author']
+            ).values_list('id', flat=True).first()
+            if author_id is None:
+                raise CommandError(
+                    f'Пользователь {options["author"]} не найден.'
+                )
+        clusters = duplicate_clusters(options['threshold'], author_id)
+        slugs = dict(Note.objects.filter(
+            pk__in=[note_id for cluster in clusters for note_id in cluster]
+        ).values_list('id', 'slug'))
+        for cluster in clusters:
+            self.stdout.write(' '.join(slugs[note_id] for note_id in cluster))
+        self.stdout.write(self.style.SUCCESS(
+            f'Найдено групп похожих заметок: {len(clusters)}'
+        ))
@@ -0,0 +1,93 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from notes.bulk import after_bulk_create
+from notes.models import Note
+from notes.slugs import bulk_create_with_slugs
+from notes.transfer import (
+    FORMATS, batched, detect_format, open_stream, read_rows, throughput
+)
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Потоково загружает заметки из JSONL или CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help="Файл с заметками, '-' - стандартный ввод.",
+        )
+        parser.add_argument('--format', choices=FORMATS)
+        parser.add_argument(
+            '--author',
+            help='Пользователь для строк, в которых автор не указан.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько заметок сохранять за одну транзакцию.',
+        )
+
+    def handle(self, *args, **options):
+        self.author_ids = {}
+        self.default_author = options['author']
+        path = options['path']
+        started = time.perf_counter()
+        total = 0
+        with open_stream(path, 'r') as stream:
+            rows = read_rows(stream, detect_format(path, options['format']))
+            for batch in batched(rows, options['batch_size']):
+                total += self.import_batch(batch, first_row=total + 1)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано заметок: {total} за {elapsed:.2f} с '
+            f'({throughput(total, elapsed):.0f} строк/с)'
+        ))
+
+    def resolve_authors(self, usernames):
+        """Находит id авторов пачки одним запросом."""
+        missing = set(filter(None, usernames)) - self.author_ids.keys()
+        if not missing:
+            return
+        self.author_ids.update(
+            User.objects.filter(username__in=missing)
+            .values_list('username', 'id')
+        )
+        unknown = missing - self.author_ids.keys()
+        if unknown:
+            raise CommandError(
+                'Пользователи не найдены: ' + ', '.join(sorted(unknown))
+            )
+
+    def build_note(self, row, number):
+        author = row.get('author') or self.default_author
+        if not author:
+            raise CommandError(f'Строка {number}: не указан автор.')
+        title = row.get('title') or Note._meta.get_field('title').default
+        if len(title) > Note._meta.get_field('title').max_length:
+            raise CommandError(f'Строка {number}: слишком длинный заголовок.')
+        return Note(
+            title=title,
+            text=row.get('text') or '',
+            slug=row.get('slug') or '',
+            author_id=self.author_ids[author],
+        )
+
+    def import_batch(self, rows, first_row):
+        self.resolve_authors(
+            row.get('author') or self.default_author for row in rows
+        )
+        notes = [
+            self.build_note(row, number)
+            for number, row in enumerate(rows, start=first_row)
+        ]
+        with transaction.atomic():
+            bulk_create_with_slugs(notes)
+            after_bulk_create(notes)
+        return len(notes)
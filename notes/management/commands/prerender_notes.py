@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from notes.rendering import prerender, prune
+
+
+class Command(BaseCommand):
+    help = 'Заранее отрисовывает Markdown заметок, у которых нет HTML.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько заметок отрисовывать за один раз.',
+        )
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help='Удалить HTML текстов, которых больше нет в заметках.',
+        )
+
+    def handle(self, *args, **options):
+        total = prerender(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Отрисовано текстов: {total}'
+        ))
+        if options['prune']:
+            self.stdout.write(f'Удалено устаревших: {prune()}')
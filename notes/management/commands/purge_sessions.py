@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from notes.sessions import PURGE_BATCH_SIZE, purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Удаляет истёкшие сессии из базы пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=PURGE_BATCH_SIZE,
+            help='Сколько сессий удалять за одну транзакцию.',
+        )
+
+    def handle(self, *args, **options):
+        total = purge_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено истёкших сессий: {total}'
+        ))
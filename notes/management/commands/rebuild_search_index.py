@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from notes.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс заметок пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько заметок индексировать за одну транзакцию.',
+        )
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            self.stderr.write(
+                'Полнотекстовый индекс доступен только в SQLite.'
+            )
+            return
+        total = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано заметок: {total}'
+        ))
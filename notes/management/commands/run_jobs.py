@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from notes.jobs import Worker, purge_finished
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди в базе.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Размер пула (по умолчанию JOBS_WORKERS).',
+        )
+        parser.add_argument(
+            '--pool',
+            choices=('thread', 'process'),
+            help='Пул потоков или процессов (по умолчанию JOBS_POOL).',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Выйти, когда готовые задачи закончатся.',
+        )
+        parser.add_argument(
+            '--purge',
+            action='store_true',
+            help='Только удалить выполненные задачи старше JOBS_KEEP_DAYS.',
+        )
+
+    def handle(self, *args, **options):
+        if options['purge']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Удалено выполненных задач: {purge_finished()}'
+            ))
+            return
+        worker = Worker(size=options['workers'], pool=options['pool'])
+        try:
+            worker.run(burst=options['burst'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            worker.stop()
+        self.stdout.write(self.style.SUCCESS('Обработчик задач остановлен.'))
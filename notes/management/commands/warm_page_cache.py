@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from notes.page_cache import warm_up
+
+
+class Command(BaseCommand):
+    help = 'Заполняет кэш страниц для анонимов (PAGE_CACHE_URLS).'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(
+            f'Страниц в кэше: {warm_up()}'
+        ))
@@ -0,0 +1,272 @@
+import json
+import os
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from threading import Lock, get_ident
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates
+
+from .admission import COUNTERS as ADMISSION_COUNTERS, admission_stats
+from .cache import fragment_cache_stats
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+CACHE_COUNTERS = ('hits', 'misses', 'evictions')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Статистика текущего запроса: её пополняют обёртка SQL и шаблоны.
+current_request = ContextVar('notes_request_stats', default=None)
+
+
+class RequestStats:
+    """Запросы к базе и время в базе и шаблонах за один HTTP-запрос."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+def empty_view_stats():
+    return {
+        'latency_buckets': [0] * len(LATENCY_BUCKETS),
+        'latency_sum': 0.0,
+        'count': 0,
+        'query_buckets': [0] * len(QUERY_BUCKETS),
+        'queries': 0,
+        'db_seconds': 0.0,
+        'template_seconds': 0.0,
+    }
+
+
+def observe_buckets(buckets, bounds, value):
+    for index, bound in enumerate(bounds):
+        if value <= bound:
+            buckets[index] += 1
+
+
+class Registry:
+    """Метрики процесса; обновляются под блокировкой из любых потоков.
+
+    Если задан METRICS_DIR, снимок периодически сбрасывается в файл
+    процесса, а /metrics складывает файлы всех воркеров.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.views = {}
+        self.flushed_at = 0.0
+
+    def observe(self, view, seconds, stats):
+        with self.lock:
+            # После fork дочерний процесс не должен повторно считать
+            # унаследованные данные родителя.
+            if self.pid != os.getpid():
+                self.reset()
+            data = self.views.setdefault(view, empty_view_stats())
+            observe_buckets(
+                data['latency_buckets'], LATENCY_BUCKETS, seconds
+            )
+            data['latency_sum'] += seconds
+            data['count'] += 1
+            observe_buckets(
+                data['query_buckets'], QUERY_BUCKETS, stats.queries
+            )
+            data['queries'] += stats.queries
+            data['db_seconds'] += stats.db_seconds
+            data['template_seconds'] += stats.template_seconds
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self.lock:
+            views = json.loads(json.dumps(self.views))
+        cache = fragment_cache_stats()
+        return {
+            'views': views,
+            'cache': {name: cache.get(name, 0) for name in CACHE_COUNTERS},
+            'admission': admission_stats(),
+        }
+
+    def path(self):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return None
+        return Path(directory) / f'metrics-{os.getpid()}.json'
+
+    def maybe_flush(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+        if time.monotonic() - self.flushed_at >= interval:
+            self.flush()
+
+    def flush(self):
+        """Атомарно записывает снимок процесса в METRICS_DIR."""
+        path = self.path()
+        self.flushed_at = time.monotonic()
+        if path is None:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(f'.{get_ident()}.tmp')
+        temporary.write_text(json.dumps(self.snapshot()))
+        os.replace(temporary, path)
+
+    def collect(self):
+        """Снимки всех процессов: файлы воркеров плюс живые данные."""
+        path = self.path()
+        if path is None:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for worker_file in path.parent.glob('metrics-*.json'):
+            try:
+                snapshots.append(json.loads(worker_file.read_text()))
+            except (OSError, ValueError):
+                # Файл мог исчезнуть или ещё не дописаться.
+                continue
+        return snapshots
+
+
+registry = Registry()
+
+
+def merge(snapshots):
+    views = {}
+    cache = dict.fromkeys(CACHE_COUNTERS, 0)
+    admission = dict.fromkeys(ADMISSION_COUNTERS, 0)
+    for snapshot in snapshots:
+        for view, data in snapshot['views'].items():
+            total = views.setdefault(view, empty_view_stats())
+            for key, value in data.items():
+                if isinstance(value, list):
+                    total[key] = [a + b for a, b in zip(total[key], value)]
+                else:
+                    total[key] += value
+        for name in CACHE_COUNTERS:
+            cache[name] += snapshot['cache'].get(name, 0)
+        for name in ADMISSION_COUNTERS:
+            admission[name] += snapshot.get('admission', {}).get(name, 0)
+    return views, cache, admission
+
+
+def escape_label(value):
+    return (
+        value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    )
+
+
+def histogram_lines(name, label, bounds, buckets, total, count):
+    # Корзины уже накопительные: значение попадает во все le >= него.
+    for bound, amount in zip(bounds, buckets):
+        yield f'{name}_bucket{{{label},le="{bound}"}} {amount}'
+    yield f'{name}_bucket{{{label},le="+Inf"}} {count}'
+    yield f'{name}_sum{{{label}}} {total}'
+    yield f'{name}_count{{{label}}} {count}'
+
+
+def render_metrics(views, cache, admission):
+    """Текстовый формат экспозиции Prometheus."""
+    lines = [
+        '# HELP yanote_request_duration_seconds Request latency by URL name.',
+        '# TYPE yanote_request_duration_seconds histogram',
+    ]
+    for view, data in sorted(views.items()):
+        lines.extend(histogram_lines(
+            'yanote_request_duration_seconds',
+            f'view="{escape_label(view)}"',
+            LATENCY_BUCKETS, data['latency_buckets'],
+            data['latency_sum'], data['count'],
+        ))
+    lines += [
+        '# HELP yanote_request_queries SQL queries per request by URL name.',
+        '# TYPE yanote_request_queries histogram',
+    ]
+    for view, data in sorted(views.items()):
+        lines.extend(histogram_lines(
+            'yanote_request_queries',
+            f'view="{escape_label(view)}"',
+            QUERY_BUCKETS, data['query_buckets'],
+            data['queries'], data['count'],
+        ))
+    for metric, key, help_text in (
+        ('yanote_db_seconds_total', 'db_seconds',
+         'Time spent executing SQL by URL name.'),
+        ('yanote_template_seconds_total', 'template_seconds',
+         'Time spent rendering templates by URL name.'),
+    ):
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+        for view, data in sorted(views.items()):
+            lines.append(
+                f'{metric}{{view="{escape_label(view)}"}} {data[key]}'
+            )
+    for name in CACHE_COUNTERS:
+        metric = f'yanote_fragment_cache_{name}_total'
+        lines += [
+            f'# HELP {metric} Fragment cache {name}.',
+            f'# TYPE {metric} counter',
+            f'{metric} {cache[name]}',
+        ]
+    for name in ADMISSION_COUNTERS:
+        metric = f'yanote_admission_{name}_total'
+        lines += [
+            f'# HELP {metric} Write requests {name} by admission control.',
+            f'# TYPE {metric} counter',
+            f'{metric} {admission[name]}',
+        ]
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Страница /metrics для Prometheus, доступная из METRICS_ALLOWED_IPS."""
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    views, cache, admission = merge(registry.collect())
+    return HttpResponse(
+        render_metrics(views, cache, admission), content_type=CONTENT_TYPE
+    )
+
+
+class TimedTemplate:
+    """Обёртка шаблона, добавляющая время отрисовки к статистике запроса."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = current_request.get()
+        if stats is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.template_seconds += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Бэкенд DjangoTemplates, замеряющий отрисовку шаблонов."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
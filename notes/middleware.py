@@ -0,0 +1,209 @@
+import time
+from contextlib import ExitStack, contextmanager
+from functools import partial
+from http import HTTPStatus
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.functional import SimpleLazyObject
+
+from . import admission
+from .auth import (
+    aget_user, api_token, auser_from_token, get_user, user_from_token,
+)
+from .metrics import RequestStats, current_request, registry
+from .page_cache import cached_paths, load_page, store_page
+
+
+class HybridMiddleware:
+    """Middleware, работающий и под WSGI, и под ASGI.
+
+    Под ASGI get_response - корутина, и запрос идёт через acall без
+    перехода в поток; иначе Django оборачивал бы middleware
+    в sync_to_async на каждом запросе.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.acall(request)
+        return self.call(request)
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """Собирает задержку, число SQL-запросов и время в базе и шаблонах.
+
+    Метрики группируются по имени URL (например, notes:list) и
+    отдаются на /metrics.
+    """
+
+    @contextmanager
+    def measure(self, request):
+        stats = RequestStats()
+        # Под ASGI контекст и соединения переходят в потоки
+        # sync_to_async вместе с запросом.
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(stats.execute_wrapper)
+                    )
+                yield
+        finally:
+            current_request.reset(token)
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        registry.observe(view, time.perf_counter() - started, stats)
+
+    def call(self, request):
+        with self.measure(request):
+            return self.get_response(request)
+
+    async def acall(self, request):
+        with self.measure(request):
+            return await self.get_response(request)
+
+
+class PageCacheMiddleware(HybridMiddleware):
+    """Отдаёт анонимам страницы из PAGE_CACHE_URLS из кэша.
+
+    Стоит после CsrfViewMiddleware, чтобы CSRF-cookie ставилась и при
+    попадании в кэш. Анонимом считается запрос без cookie сессии и без
+    строки запроса.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.paths = None
+
+    def is_cacheable(self, request):
+        if self.paths is None:
+            self.paths = cached_paths()
+        return (
+            request.method in ('GET', 'HEAD')
+            and not request.GET
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+            and request.path in self.paths
+        )
+
+    def cached_response(self, request):
+        page = load_page(request.path, request)
+        if page is None:
+            return None
+        status, headers, content = page
+        response = HttpResponse(content, status=status, headers=headers)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    def store(self, request, response):
+        if response.status_code == 200 and not response.streaming:
+            store_page(request.path, response)
+        return response
+
+    def call(self, request):
+        if not self.is_cacheable(request):
+            return self.get_response(request)
+        response = self.cached_response(request)
+        if response is not None:
+            return response
+        return self.store(request, self.get_response(request))
+
+    async def acall(self, request):
+        # Кэш страниц - память процесса, обращение к нему не блокирует.
+        if not self.is_cacheable(request):
+            return await self.get_response(request)
+        response = self.cached_response(request)
+        if response is not None:
+            return response
+        return self.store(request, await self.get_response(request))
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware, берущий пользователя из кэша notes.auth.
+
+    Запрос с токеном API (Authorization: Bearer) аутентифицируется
+    только токеном, без сессии, поэтому проверка CSRF ему не нужна.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        token = api_token(request)
+        if token is not None:
+            request._dont_enforce_csrf_checks = True
+            request.user = SimpleLazyObject(lambda: user_from_token(token))
+            request.auser = partial(auser_from_token, token)
+            return
+        request.user = SimpleLazyObject(lambda: get_user(request))
+        request.auser = partial(aget_user, request)
+
+
+class AdmissionMiddleware(HybridMiddleware):
+    """Пускает изменяющие запросы через notes.admission.
+
+    Стоит после аутентификации: частота считается на пользователя,
+    для анонимов - на IP. Переполнение очереди - 503, превышение
+    частоты - 429, оба с Retry-After.
+    """
+    safe_methods = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def throttled(self, request, user):
+        """Ответ 429, если клиент превысил частоту записей, иначе None."""
+        wait = admission.buckets.take(admission.client_key(request, user))
+        if not wait:
+            return None
+        admission.write_gate.count('throttled')
+        response = HttpResponse(
+            'Слишком много запросов.', status=HTTPStatus.TOO_MANY_REQUESTS
+        )
+        response['Retry-After'] = admission.retry_after(wait)
+        return response
+
+    def overloaded(self):
+        response = HttpResponse(
+            'Сервер перегружен, повторите позже.',
+            status=HTTPStatus.SERVICE_UNAVAILABLE,
+        )
+        response['Retry-After'] = admission.retry_after(
+            getattr(settings, 'ADMISSION_RETRY_AFTER', 1)
+        )
+        return response
+
+    def call(self, request):
+        if request.method in self.safe_methods:
+            return self.get_response(request)
+        response = self.throttled(request, request.user)
+        if response is not None:
+            return response
+        if not admission.write_gate.acquire():
+            return self.overloaded()
+        try:
+            return self.get_response(request)
+        finally:
+            admission.write_gate.release()
+
+    async def acall(self, request):
+        if request.method in self.safe_methods:
+            return await self.get_response(request)
+        # request.user читает базу синхронно, в цикле событий нельзя.
+        response = self.throttled(request, await request.auser())
+        if response is not None:
+            return response
+        if not await admission.write_gate.aacquire():
+            return self.overloaded()
+        try:
+            return await self.get_response(request)
+        finally:
+            admission.write_gate.release()
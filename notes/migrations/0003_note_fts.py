@@ -0,0 +1,34 @@
+from django.db import migrations
+
+CREATE_FTS = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS notes_note_fts USING fts5('
+    "title, text, tokenize = 'unicode61 remove_diacritics 2')"
+)
+DROP_FTS = 'DROP TABLE IF EXISTS notes_note_fts'
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_FTS)
+    schema_editor.execute(
+        'INSERT INTO notes_note_fts (rowid, title, text) '
+        'SELECT id, title, text FROM notes_note'
+    )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(DROP_FTS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0002_note_author_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations, transaction
+
+import notes.fields
+
+BATCH_SIZE = 500
+
+
+def compress_texts(apps, schema_editor):
+    """Пересохраняет тексты пачками: большие сжимаются при записи."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Note = apps.get_model('notes', 'Note')
+    last_id = 0
+    while True:
+        notes = list(
+            Note.objects.filter(id__gt=last_id)
+            .order_by('id').only('id', 'text')[:BATCH_SIZE]
+        )
+        if not notes:
+            return
+        with transaction.atomic():
+            Note.objects.bulk_update(notes, ['text'])
+        last_id = notes[-1].id
+
+
+def decompress_texts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT id, text FROM notes_note WHERE typeof(text) = 'blob'"
+        )
+        rows = [
+            (notes.fields.decompress(text), pk)
+            for pk, text in cursor.fetchall()
+        ]
+        cursor.executemany(
+            'UPDATE notes_note SET text = %s WHERE id = %s', rows
+        )
+
+
+class Migration(migrations.Migration):
+    # Каждая пачка коммитится отдельно и не держит блокировку записи.
+    atomic = False
+
+    dependencies = [
+        ('notes', '0005_note_revisions'),
+    ]
+
+    operations = [
+        # Тип колонки не меняется, поэтому таблица не перестраивается.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='note',
+                    name='text',
+                    field=notes.fields.CompressedTextField(
+                        help_text='Добавьте подробностей',
+                        verbose_name='Текст',
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(compress_texts, decompress_texts),
+    ]
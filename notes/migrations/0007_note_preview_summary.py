@@ -0,0 +1,66 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models, transaction
+from django.db.models import Count, Max
+
+import notes.fields
+
+BATCH_SIZE = 500
+
+
+def fill_previews(apps, schema_editor):
+    Note = apps.get_model('notes', 'Note')
+    last_id = 0
+    while True:
+        batch = list(
+            Note.objects.filter(id__gt=last_id)
+            .order_by('id').only('id', 'text')[:BATCH_SIZE]
+        )
+        if not batch:
+            return
+        for note in batch:
+            note.preview = notes.fields.make_preview(note.text)
+        with transaction.atomic():
+            Note.objects.bulk_update(batch, ['preview'])
+        last_id = batch[-1].id
+
+
+def fill_summaries(apps, schema_editor):
+    Note = apps.get_model('notes', 'Note')
+    NoteSummary = apps.get_model('notes', 'NoteSummary')
+    NoteSummary.objects.bulk_create(
+        NoteSummary(author_id=row['author'], **{
+            key: row[key] for key in ('note_count', 'last_modified')
+        })
+        for row in Note.objects.order_by().values('author').annotate(
+            note_count=Count('id'), last_modified=Max('updated')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    # Превью заполняются пачками, каждая в своей транзакции.
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notes', '0006_note_compressed_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteSummary',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='note_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('note_count', models.PositiveIntegerField(default=0, verbose_name='Заметок')),
+                ('last_modified', models.DateTimeField(blank=True, null=True, verbose_name='Последнее изменение')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='preview',
+            field=notes.fields.PreviewField(blank=True, editable=False, max_length=140, source='text', verbose_name='Начало текста'),
+        ),
+        migrations.RunPython(fill_previews, migrations.RunPython.noop),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
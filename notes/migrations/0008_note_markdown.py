@@ -0,0 +1,47 @@
+from django.db import migrations, models, transaction
+
+import notes.fields
+
+BATCH_SIZE = 500
+
+
+def fill_digests(apps, schema_editor):
+    Note = apps.get_model('notes', 'Note')
+    last_id = 0
+    while True:
+        batch = list(
+            Note.objects.filter(id__gt=last_id)
+            .order_by('id').only('id', 'text')[:BATCH_SIZE]
+        )
+        if not batch:
+            return
+        for note in batch:
+            note.text_digest = notes.fields.text_digest(note.text)
+        with transaction.atomic():
+            Note.objects.bulk_update(batch, ['text_digest'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+    # Хеши заполняются пачками, каждая в своей транзакции.
+    atomic = False
+
+    dependencies = [
+        ('notes', '0007_note_preview_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenderedMarkdown',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Хеш текста')),
+                ('html', notes.fields.CompressedTextField(verbose_name='HTML')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='text_digest',
+            field=notes.fields.DigestField(blank=True, db_index=True, editable=False, max_length=64, source='text', verbose_name='Хеш текста'),
+        ),
+        migrations.RunPython(fill_digests, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+import notes.links
+
+BATCH_SIZE = 500
+
+
+def fill_links(apps, schema_editor):
+    """Заполняет ссылки и сбрасывает HTML текстов, где они есть."""
+    Note = apps.get_model('notes', 'Note')
+    NoteLink = apps.get_model('notes', 'NoteLink')
+    RenderedMarkdown = apps.get_model('notes', 'RenderedMarkdown')
+    last_id = 0
+    while True:
+        batch = list(
+            Note.objects.filter(id__gt=last_id)
+            .order_by('id').only('id', 'text', 'text_digest')[:BATCH_SIZE]
+        )
+        if not batch:
+            return
+        links = []
+        digests = set()
+        for note in batch:
+            for slug in notes.links.parse_links(note.text):
+                links.append(NoteLink(source_id=note.id, target_slug=slug))
+                digests.add(note.text_digest)
+        with transaction.atomic():
+            NoteLink.objects.bulk_create(links, ignore_conflicts=True)
+            # Старый HTML отрисован без ссылок.
+            RenderedMarkdown.objects.filter(digest__in=digests).delete()
+        last_id = batch[-1].id
+
+class Migration(migrations.Migration):
+    # Ссылки заполняются пачками, каждая в своей транзакции.
+    atomic = False
+
+    dependencies = [
+        ('notes', '0010_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_slug', models.SlugField(db_index=False, max_length=100, verbose_name='Адрес заметки')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='links', to='notes.note')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('target_slug', 'source'), name='notes_notelink_target_source_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_links, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+import django.db.models.deletion
+import notes.fields
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+import notes.minhash
+
+BATCH_SIZE = 500
+
+
+def fill_signatures(apps, schema_editor):
+    """Считает подписи и ключи полос существующих заметок."""
+    Note = apps.get_model('notes', 'Note')
+    NoteBand = apps.get_model('notes', 'NoteBand')
+    last_id = 0
+    while True:
+        batch = list(
+            Note.objects.filter(id__gt=last_id)
+            .order_by('id').only('id', 'text', 'author_id')[:BATCH_SIZE]
+        )
+        if not batch:
+            return
+        bands = []
+        for note in batch:
+            note.signature = notes.minhash.signature(note.text)
+            if note.signature is not None:
+                # Полосы подписи могут совпасть: ключ - один раз на
+                # заметку, как в notes.similarity.note_bands.
+                bands.extend(
+                    NoteBand(note_id=note.id, author_id=note.author_id, key=key)
+                    for key in set(notes.minhash.band_keys(note.signature))
+                )
+        with transaction.atomic():
+            Note.objects.bulk_update(batch, ['signature'])
+            NoteBand.objects.bulk_create(bands)
+        last_id = batch[-1].id
+
+
+
+class Migration(migrations.Migration):
+    # Подписи заполняются пачками, каждая в своей транзакции.
+    atomic = False
+
+    dependencies = [
+        ('notes', '0011_note_links'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='signature',
+            field=notes.fields.SignatureField(blank=True, null=True, source='text', verbose_name='Подпись MinHash'),
+        ),
+        migrations.CreateModel(
+            name='NoteBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(verbose_name='Ключ полосы')),
+                ('author', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='notes.note')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['author', 'key'], name='notes_noteband_author_key_idx')],
+            },
+        ),
+        migrations.RunPython(fill_signatures, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations, transaction
+
+import notes.fields
+
+BATCH_SIZE = 500
+TOKENIZE = "tokenize = 'unicode61 remove_diacritics 2'"
+CREATE_CONTENTLESS = (
+    'CREATE VIRTUAL TABLE notes_note_fts USING fts5('
+    f"title, text, content = '', {TOKENIZE})"
+)
+CREATE_WITH_CONTENT = (
+    f'CREATE VIRTUAL TABLE notes_note_fts USING fts5(title, text, {TOKENIZE})'
+)
+
+
+def recreate_fts(schema_editor, create):
+    """Пересоздаёт индекс и заполняет его пачками распакованных текстов."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with transaction.atomic(), schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS notes_note_fts')
+        cursor.execute(create)
+    last_id = 0
+    while True:
+        with transaction.atomic(), schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT id, title, text FROM notes_note WHERE id > %s '
+                'ORDER BY id LIMIT %s',
+                [last_id, BATCH_SIZE],
+            )
+            batch = cursor.fetchall()
+            if not batch:
+                return
+            cursor.executemany(
+                'INSERT INTO notes_note_fts (rowid, title, text) '
+                'VALUES (%s, %s, %s)',
+                [
+                    (pk, title, notes.fields.decompress(text)
+                     if isinstance(text, (bytes, memoryview)) else text)
+                    for pk, title, text in batch
+                ],
+            )
+        last_id = batch[-1][0]
+
+
+def make_contentless(apps, schema_editor):
+    recreate_fts(schema_editor, CREATE_CONTENTLESS)
+
+
+def restore_content(apps, schema_editor):
+    recreate_fts(schema_editor, CREATE_WITH_CONTENT)
+
+
+class Migration(migrations.Migration):
+    # Индекс заполняется пачками, каждая в своей транзакции.
+    atomic = False
+
+    dependencies = [
+        ('notes', '0012_note_similarity'),
+    ]
+
+    operations = [
+        # Копия заголовков и текстов в индексе сводила сжатие на нет.
+        migrations.RunPython(make_contentless, restore_content),
+    ]
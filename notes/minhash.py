@@ -0,0 +1,105 @@
+"""MinHash-подписи текстов и ключи LSH.
+
+Подпись - NUM_HASHES минимумов хешей шинглов (троек слов) текста;
+доля совпавших позиций двух подписей оценивает сходство Жаккара их
+наборов шинглов. Подпись режется на BANDS полос по ROWS значений,
+ключ полосы - хеш её значений. Тексты со сходством s совпадают хотя
+бы в одной полосе с вероятностью 1 - (1 - s ** ROWS) ** BANDS: около
+0.12 при s = 0.3, 0.64 при s = 0.5 и больше 0.99 при s = 0.8.
+
+Подписывается только начало текста (MAX_TEXT_LENGTH символов), поэтому
+время подписи при сохранении ограничено и для многомегабайтных логов.
+Тексты с одинаковым началом, которые расходятся дальше, считаются
+одинаковыми.
+"""
+import hashlib
+import heapq
+import random
+import re
+from array import array
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+SHINGLE_WORDS = 3
+# Разбор и хеширование ограничены началом текста, а вычисление
+# минимумов - MAX_SHINGLES хешами.
+MAX_TEXT_LENGTH = 100_000
+MAX_SHINGLES = 1000
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+WORD = re.compile(r'\w+')
+
+# Коэффициенты a * x + b хеш-функций; фиксированы, иначе подписи,
+# посчитанные разными процессами, были бы несравнимы.
+_random = random.Random(20240501)
+COEFFICIENTS = tuple(
+    (_random.randrange(1, MERSENNE_PRIME), _random.randrange(MERSENNE_PRIME))
+    for _ in range(NUM_HASHES)
+)
+
+
+def stable_hash(data):
+    return int.from_bytes(
+        hashlib.blake2b(data, digest_size=8).digest(), 'little'
+    )
+
+
+def shingles(text):
+    """Хеши троек соседних слов начала текста; у короткого - хеши слов.
+
+    Если шинглов больше MAX_SHINGLES, остаются наименьшие хеши -
+    выборка согласованная: у похожих текстов она тоже похожа.
+    """
+    words = WORD.findall(text[:MAX_TEXT_LENGTH].lower())
+    if len(words) < SHINGLE_WORDS:
+        grams = words
+    else:
+        grams = (
+            ' '.join(words[index:index + SHINGLE_WORDS])
+            for index in range(len(words) - SHINGLE_WORDS + 1)
+        )
+    hashes = {stable_hash(gram.encode()) for gram in grams}
+    if len(hashes) > MAX_SHINGLES:
+        hashes = heapq.nsmallest(MAX_SHINGLES, hashes)
+    return hashes
+
+
+def signature(text):
+    """Подпись текста (NUM_HASHES чисел uint32) или None без слов."""
+    hashes = shingles(text)
+    if not hashes:
+        return None
+    return array('I', (
+        min((a * value + b) % MERSENNE_PRIME for value in hashes) & MAX_HASH
+        for a, b in COEFFICIENTS
+    )).tobytes()
+
+
+def unpack(packed):
+    values = array('I')
+    values.frombytes(bytes(packed))
+    return values
+
+
+def band_keys(packed):
+    """Ключи полос подписи - знаковые 64-битные числа для индекса."""
+    data = bytes(packed)
+    width = ROWS * array('I').itemsize
+    return [
+        int.from_bytes(
+            hashlib.blake2b(
+                bytes((band,)) + data[band * width:(band + 1) * width],
+                digest_size=8,
+            ).digest(),
+            'little',
+            signed=True,
+        )
+        for band in range(BANDS)
+    ]
+
+
+def similarity(first, second):
+    """Оценка сходства Жаккара по двум подписям, от 0 до 1."""
+    first, second = unpack(first), unpack(second)
+    return sum(a == b for a, b in zip(first, second)) / NUM_HASHES
@@ -1,7 +1,11 @@
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
 
-from pytils.translit import slugify
+from .fields import (
+    CompressedTextField, DigestField, PreviewField, SignatureField
+)
+from .slugs import SLUG_ATTEMPTS, allocate_slug
 
 
 class Note(models.Model):
@@ -11,10 +15,16 @@ class Note(models.Model):
         default='Название заметки',
         help_text='Дайте короткое название заметке'
     )
-    text = models.TextField(
+    text = CompressedTextField(
         'Текст',
         help_text='Добавьте подробностей'
     )
+    # Начало текста для списка заметок, чтобы не читать весь text.
+    preview = PreviewField('Начало текста')
+    # Ключ готового HTML текста в RenderedMarkdown.
+    text_digest = DigestField('Хеш текста', db_index=True)
+    # Для поиска похожих заметок (notes.similarity).
+    signature = SignatureField('Подпись MinHash')
     slug = models.SlugField(
         'Адрес для страницы с заметкой',
         max_length=100,
@@ -27,12 +37,264 @@ class Note(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    created = models.DateTimeField('Создана', auto_now_add=True)
+    updated = models.DateTimeField('Изменена', auto_now=True)
+    tags = models.ManyToManyField(
+        'Tag',
+        through='NoteTag',
+        related_name='notes',
+        blank=True,
+    )
+
+    class Meta:
+        indexes = (
+            # Курсорная пагинация списка заметок автора.
+            models.Index(
+                fields=('author', 'id'),
+                name='notes_note_author_id_idx',
+            ),
+            # Валидатор списка: MAX(updated) по заметкам автора.
+            models.Index(
+                fields=('author', 'updated'),
+                name='notes_note_author_upd_idx',
+            ),
+        )
 
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            max_slug_length = self._meta.get_field('slug').max_length
-            self.slug = slugify(self.title)[:max_slug_length]
-        super().save(*args, **kwargs)
+        """Пустой slug подбирается из заголовка с числовым суффиксом.
+
+        Занятость не проверяется заранее: если slug успели занять
+        между подбором и INSERT, его подбирают заново.
+
+        Сохранение всегда идёт в транзакции: прежняя версия для истории
+        правок (notes.signals) читается и записывается под блокировкой.
+        """
+        if self.slug:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+            return
+        for attempt in range(1, SLUG_ATTEMPTS + 1):
+            slug = self.slug = allocate_slug(self)
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                self.slug = ''
+                conflict = type(self).objects.filter(
+                    slug=slug
+                ).exclude(pk=self.pk).exists()
+                if attempt == SLUG_ATTEMPTS or not conflict:
+                    raise
+
+
+class Tag(models.Model):
+    """Метка заметок автора и число заметок с ней (notes.tags)."""
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='note_tags',
+        # Покрыт ограничением (author, name).
+        db_index=False,
+    )
+    name = models.CharField('Название', max_length=50)
+    note_count = models.PositiveIntegerField('Заметок', default=0)
+
+    class Meta:
+        ordering = ('name',)
+        constraints = (
+            # Поиск метки автора по названию.
+            models.UniqueConstraint(
+                fields=('author', 'name'),
+                name='notes_tag_author_name_uniq',
+            ),
+        )
+
+    def __str__(self):
+        return self.name
+
+
+class NoteTag(models.Model):
+    """Связь заметки с меткой."""
+    note = models.ForeignKey(Note, on_delete=models.CASCADE)
+    # Отдельный индекс не нужен: tag_id - первая колонка ограничения.
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        constraints = (
+            # Заметки с меткой в порядке id - для списка по курсору.
+            models.UniqueConstraint(
+                fields=('tag', 'note'),
+                name='notes_notetag_tag_note_uniq',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.note_id}:{self.tag_id}'
+
+
+class NoteLink(models.Model):
+    """Ссылка [[slug]] из текста заметки (notes.links).
+
+    Цель хранится как slug: ссылка может вести на ещё не созданную
+    заметку и начинает работать, когда заметку с этим slug создадут.
+    """
+    source = models.ForeignKey(
+        Note,
+        on_delete=models.CASCADE,
+        related_name='links',
+    )
+    # Отдельный индекс не нужен: target_slug - первая колонка ограничения.
+    target_slug = models.SlugField(
+        'Адрес заметки', max_length=100, db_index=False
+    )
+
+    class Meta:
+        constraints = (
+            # Обратные ссылки: заметки, ссылающиеся на slug.
+            models.UniqueConstraint(
+                fields=('target_slug', 'source'),
+                name='notes_notelink_target_source_uniq',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.source_id} -> {self.target_slug}'
+
+
+class NoteBand(models.Model):
+    """Ключ полосы LSH подписи заметки (notes.similarity)."""
+    note = models.ForeignKey(
+        Note,
+        on_delete=models.CASCADE,
+        related_name='bands',
+    )
+    # Копия Note.author: кандидаты ищутся без соединения с заметками.
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    key = models.BigIntegerField('Ключ полосы')
+
+    class Meta:
+        indexes = (
+            # Заметки автора с теми же ключами полос.
+            models.Index(
+                fields=('author', 'key'),
+                name='notes_noteband_author_key_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.note_id}: {self.key}'
+
+
+class NoteRevision(models.Model):
+    """Прошлая версия заметки: сжатая дельта или снимок (notes.revisions)."""
+    note = models.ForeignKey(
+        Note,
+        on_delete=models.CASCADE,
+        related_name='revisions',
+    )
+    number = models.PositiveIntegerField('Номер')
+    title = models.CharField('Заголовок', max_length=100)
+    data = models.BinaryField('Сжатая дельта или текст')
+    is_snapshot = models.BooleanField('Полный снимок', default=False)
+    created = models.DateTimeField('Версия от')
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('note', 'number'),
+                name='notes_revision_note_number_uniq',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.note_id}#{self.number}'
+
+
+class NoteSummary(models.Model):
+    """Число заметок автора и время последнего изменения списка.
+
+    Обновляется по одной заметке (notes.summary), чтобы список
+    и его валидаторы не считали COUNT(*) по notes_note.
+    """
+    author = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='note_summary',
+    )
+    note_count = models.PositiveIntegerField('Заметок', default=0)
+    last_modified = models.DateTimeField(
+        'Последнее изменение', null=True, blank=True
+    )
+
+    def __str__(self):
+        return f'{self.author_id}: {self.note_count}'
+
+
+class RenderedMarkdown(models.Model):
+    """Очищенный HTML текста заметки по SHA-256 этого текста."""
+    digest = models.CharField('Хеш текста', max_length=64, primary_key=True)
+    html = CompressedTextField('HTML')
+
+    def __str__(self):
+        return self.digest
+
+
+class Job(models.Model):
+    """Фоновая задача в очереди (notes.jobs)."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATES = (
+        (PENDING, 'Ожидает'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Не удалась'),
+    )
+
+    name = models.CharField('Задача', max_length=100)
+    args = models.JSONField('Аргументы', default=list)
+    # Повторная постановка задачи с тем же ключом ничего не делает.
+    key = models.CharField(
+        'Ключ идемпотентности',
+        max_length=200,
+        unique=True,
+        null=True,
+        blank=True,
+    )
+    state = models.CharField(
+        'Состояние', max_length=10, choices=STATES, default=PENDING
+    )
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveIntegerField('Наибольшее число попыток')
+    run_at = models.DateTimeField('Выполнить не раньше', default=timezone.now)
+    locked_by = models.CharField('Захвачена', max_length=32, blank=True)
+    locked_at = models.DateTimeField('Захвачена в', null=True, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+    finished = models.DateTimeField('Завершена', null=True, blank=True)
+
+    class Meta:
+        indexes = (
+            # Выбор готовых к запуску задач и очистка выполненных.
+            models.Index(
+                fields=('state', 'run_at'),
+                name='notes_job_state_run_at_idx',
+            ),
+            models.Index(
+                fields=('state', 'finished'),
+                name='notes_job_state_finished_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.name}#{self.pk}'
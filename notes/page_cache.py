@@ -0,0 +1,100 @@
+import re
+from threading import Thread
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.handlers.wsgi import WSGIHandler, WSGIRequest
+from django.db import close_old_connections
+from django.middleware.csrf import get_token
+from django.urls import reverse
+
+PAGE_CACHE = 'pages'
+CSRF_PLACEHOLDER = b'__csrf_token_placeholder__'
+CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+# Заголовки, которые нельзя отдавать другим посетителям.
+PRIVATE_HEADERS = ('Set-Cookie', 'Vary')
+
+
+def cached_paths():
+    """Адреса страниц, которые можно отдавать анонимам из кэша."""
+    return {
+        reverse(name) for name in getattr(settings, 'PAGE_CACHE_URLS', ())
+    }
+
+
+def page_key(path):
+    return f'page:{settings.LANGUAGE_CODE}:{path}'
+
+
+def store_page(path, response):
+    """Сохраняет страницу, заменив CSRF-токен на заглушку."""
+    content = CSRF_INPUT.sub(
+        rb'\g<1>' + CSRF_PLACEHOLDER + rb'\g<2>', response.content
+    )
+    headers = {
+        name: value for name, value in response.headers.items()
+        if name not in PRIVATE_HEADERS
+    }
+    caches[PAGE_CACHE].set(
+        page_key(path), (response.status_code, headers, content)
+    )
+
+
+def load_page(path, request):
+    """Страница из кэша с токеном текущего посетителя или None.
+
+    Токен подставляется заменой строки, без отрисовки шаблона;
+    get_token при необходимости заводит посетителю CSRF-cookie.
+    """
+    page = caches[PAGE_CACHE].get(page_key(path))
+    if page is None:
+        return None
+    status, headers, content = page
+    if CSRF_PLACEHOLDER in content:
+        content = content.replace(
+            CSRF_PLACEHOLDER, get_token(request).encode()
+        )
+    return status, headers, content
+
+
+def warm_up_host():
+    """Имя хоста, которое пропустит проверка ALLOWED_HOSTS."""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def warm_up():
+    """Заполняет кэш страниц анонимными запросами; возвращает их число.
+
+    Запросы проходят через обычный обработчик со всеми middleware,
+    страницы сохраняет PageCacheMiddleware.
+    """
+    handler = WSGIHandler()
+    host = warm_up_host()
+    stored = 0
+    for path in sorted(cached_paths()):
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'HTTP_HOST': host,
+        }
+        setup_testing_defaults(environ)
+        response = handler.get_response(WSGIRequest(environ))
+        stored += response.status_code == 200
+    return stored
+
+
+def start_warm_up():
+    """Прогревает кэш процесса в фоновом потоке, не задерживая запуск.
+
+    Нужно, когда кэш страниц свой у каждого процесса (LocMemCache);
+    общий кэш достаточно прогреть командой warm_page_cache.
+    """
+    def run():
+        try:
+            warm_up()
+        finally:
+            close_old_connections()
+
+    Thread(target=run, name='notes-page-cache', daemon=True).start()
@@ -0,0 +1,75 @@
+from django.http import Http404
+
+
+class KeysetPage:
+    """Страница списка, выбранная по курсору, а не по номеру."""
+
+    def __init__(self, object_list, cursor, next_cursor):
+        self.object_list = object_list
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.cursor is not None
+
+
+def parse_cursor(value):
+    """Превращает курсор из URL в id; пустое значение - первая страница."""
+    if not value:
+        return None
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        raise Http404('Некорректный курсор страницы.')
+    if cursor < 0:
+        raise Http404('Некорректный курсор страницы.')
+    return cursor
+
+
+def keyset_window(queryset, cursor, key='id'):
+    """Записи после курсора в порядке ключа."""
+    queryset = queryset.order_by(key)
+    if cursor is not None:
+        queryset = queryset.filter(**{f'{key}__gt': cursor})
+    return queryset
+
+
+def boundary_query(queryset, page_size, key='id'):
+    """Последний ключ страницы и первый ключ следующей - не больше двух id."""
+    return queryset.values_list(key, flat=True)[page_size - 1:page_size + 1]
+
+
+def make_page(queryset, cursor, boundary, key='id'):
+    next_cursor = None
+    if boundary:
+        queryset = queryset.filter(**{f'{key}__lte': boundary[0]})
+        if len(boundary) > 1:
+            next_cursor = boundary[0]
+    return KeysetPage(queryset, cursor, next_cursor)
+
+
+def keyset_paginate(queryset, cursor, page_size, key='id'):
+    """Возвращает страницу записей с key > cursor.
+
+    Граница страницы ищется по индексу (author, id) среди не более чем
+    двух id, поэтому стоимость страницы не зависит от её номера,
+    в отличие от OFFSET. Список остаётся неурезанным QuerySet,
+    ограниченным диапазоном ключей.
+    """
+    queryset = keyset_window(queryset, cursor, key)
+    boundary = list(boundary_query(queryset, page_size, key))
+    return make_page(queryset, cursor, boundary, key)
+
+
+async def akeyset_paginate(queryset, cursor, page_size, key='id'):
+    """Асинхронный keyset_paginate: строки страницы загружаются сразу."""
+    queryset = keyset_window(queryset, cursor, key)
+    boundary = [
+        value async for value in boundary_query(queryset, page_size, key)
+    ]
+    page = make_page(queryset, cursor, boundary, key)
+    page.object_list = [obj async for obj in page.object_list]
+    return page
@@ -1,9 +1,14 @@
 # conftest.py
+from importlib import import_module, reload
+
 import pytest
 
 # Импортируем класс клиента.
+from django.core.cache import caches
 from django.test.client import Client
+from django.urls import clear_url_caches
 
+from notes import admission
 # Импортируем модель заметки, чтобы создать экземпляр.
 from notes.models import Note
 
@@ -59,4 +64,30 @@ def form_data():
         'title': 'Новый заголовок',
         'text': 'Новый текст',
         'slug': 'new-slug'
-    }
\ No newline at end of file
+    }
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # Кэши живут в памяти процесса и переживают откат транзакции теста.
+    for cache in caches.all():
+        cache.clear()
+    # Как и счётчики ограничения записей.
+    admission.reset()
+
+
+def reload_urlconf():
+    # Выбор между синхронными и асинхронными представлениями делается
+    # при импорте notes.urls, поэтому маршруты нужно перезагрузить.
+    for module in ('notes.urls', 'yanote.urls'):
+        reload(import_module(module))
+    clear_url_caches()
+
+
+@pytest.fixture
+def async_views(settings):
+    settings.NOTES_ASYNC_VIEWS = True
+    reload_urlconf()
+    yield
+    settings.NOTES_ASYNC_VIEWS = False
+    reload_urlconf()
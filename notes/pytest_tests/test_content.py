@@ -1,8 +1,29 @@
 # test_content.py
+import io
+import json
+import logging
+import re
+import zipfile
+from http import HTTPStatus
+
 import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from notes.cache import StatsLocMemCache
+from notes.events import broker
 from notes.forms import NoteForm
+from notes.metrics import empty_view_stats
+from notes.models import Note, RenderedMarkdown, Tag
+from notes.page_cache import page_key
+from notes.summary import note_changed
+from notes.views import NotesList
 
-from django.urls import reverse
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
 
 
 @pytest.mark.parametrize(
@@ -46,3 +67,492 @@ def test_pages_contains_form(author_client, name, args):
     assert 'form' in response.context
     # Проверяем, что объект формы относится к нужному классу.
     assert isinstance(response.context['form'], NoteForm)
+
+
+def test_notes_list_keyset_pagination(author, author_client, monkeypatch):
+    # Уменьшаем размер страницы, чтобы не создавать десятки заметок:
+    monkeypatch.setattr(NotesList, 'paginate_by', 2)
+    notes = Note.objects.bulk_create(
+        Note(title=f'Заметка {i}', text='Текст', slug=f'slug-{i}',
+             author=author)
+        for i in range(3)
+    )
+    url = reverse('notes:list')
+    response = author_client.get(url)
+    page = response.context['page_obj']
+    assert list(response.context['object_list']) == notes[:2]
+    assert page.next_cursor == notes[1].id
+    # Следующая страница определяется курсором в адресе списка:
+    response = author_client.get(url, {'after': page.next_cursor})
+    assert list(response.context['object_list']) == notes[2:]
+    assert not response.context['page_obj'].has_next()
+
+
+def test_notes_list_invalid_cursor(author_client):
+    response = author_client.get(reverse('notes:list'), {'after': 'abc'})
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+@pytest.mark.parametrize(
+    'parametrized_client, note_in_results',
+    (
+        (pytest.lazy_fixture('author_client'), True),
+        (pytest.lazy_fixture('not_author_client'), False),
+    )
+)
+def test_search_results_for_different_users(
+    note, parametrized_client, note_in_results
+):
+    # Ищем по началу слова из текста заметки:
+    response = parametrized_client.get(reverse('notes:search'), {'q': 'замет'})
+    assert (note in response.context['object_list']) is note_in_results
+
+
+def test_search_ranks_title_matches(author, author_client):
+    Note.objects.create(
+        title='Другое', text='Молоко и хлеб', slug='other', author=author
+    )
+    best = Note.objects.create(
+        title='Молоко', text='Купить молоко', slug='milk', author=author
+    )
+    response = author_client.get(reverse('notes:search'), {'q': 'молоко'})
+    object_list = list(response.context['object_list'])
+    assert len(object_list) == 2
+    assert object_list[0] == best
+
+
+def test_note_detail_fragment_is_cached(author_client, note):
+    fragments = caches['fragments']
+    url = reverse('notes:detail', args=(note.slug,))
+    author_client.get(url)
+    hits_before = fragments.stats()['hits']
+    response = author_client.get(url)
+    assert fragments.stats()['hits'] == hits_before + 1
+    assert note.text in response.content.decode()
+
+
+@pytest.mark.usefixtures('async_views')
+def test_async_note_detail_skips_context_on_fragment_hit(
+    author_client, note
+):
+    url = reverse('notes:detail', args=(note.slug,))
+    author_client.get(url)
+    with CaptureQueriesContext(connection) as queries:
+        response = author_client.get(url)
+    assert note.text in response.content.decode()
+    # Текст, метки, обратные ссылки и похожие заметки берутся из
+    # закэшированного фрагмента:
+    tables = ('renderedmarkdown', 'notelink', 'noteband', 'notes_tag')
+    assert not [
+        query for query in queries.captured_queries
+        if any(table in query['sql'] for table in tables)
+    ]
+
+
+def test_note_change_invalidates_fragments(author_client, note):
+    detail_url = reverse('notes:detail', args=(note.slug,))
+    list_url = reverse('notes:list')
+    author_client.get(detail_url)
+    author_client.get(list_url)
+    note.title = 'Обновлённый заголовок'
+    note.save()
+    assert note.title in author_client.get(detail_url).content.decode()
+    assert note.title in author_client.get(list_url).content.decode()
+
+
+def test_fragment_keys_follow_changes_from_other_processes(
+    author, author_client, note
+):
+    list_url = reverse('notes:list')
+    author_client.get(list_url)
+    # Правка из другого процесса видна этому только через базу:
+    # строка заметки и сводка автора.
+    Note.objects.filter(pk=note.pk).update(title='Из другого процесса')
+    note_changed(author.pk, timezone.now())
+    assert 'Из другого процесса' in author_client.get(
+        list_url
+    ).content.decode()
+
+
+def test_fragment_cache_counts_evictions():
+    cache = StatsLocMemCache(
+        'test-evictions', {'OPTIONS': {'MAX_ENTRIES': 2, 'CULL_FREQUENCY': 2}}
+    )
+    for key in 'abc':
+        cache.set(key, key)
+    assert cache.stats()['evictions'] == 1
+    assert cache.get('a') is None
+    assert cache.get('c') == 'c'
+    assert cache.stats()['hit_rate'] == 0.5
+
+
+def test_note_detail_conditional_get(author_client, note):
+    url = reverse('notes:detail', args=(note.slug,))
+    response = author_client.get(url)
+    etag = response['ETag']
+    response = author_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    response = author_client.get(
+        url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+    )
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    note.text = 'Изменённый текст'
+    note.save()
+    response = author_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.OK
+
+
+@pytest.mark.parametrize('async_mode', (False, True))
+def test_note_detail_revalidated_when_backlinks_change(
+    author, author_client, note, async_mode, request
+):
+    if async_mode:
+        request.getfixturevalue('async_views')
+    url = reverse('notes:detail', args=(note.slug,))
+    etag = author_client.get(url)['ETag']
+    # Заметка не менялась, но на неё появилась ссылка:
+    linking = Note.objects.create(
+        title='Ссылается', text=f'[[{note.slug}]]', author=author
+    )
+    response = author_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.OK
+    assert 'Ссылается' in response.content.decode()
+    etag = response['ETag']
+    linking.text = 'Без ссылки'
+    linking.save()
+    response = author_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.OK
+    assert 'Ссылается' not in response.content.decode()
+
+
+def test_notes_list_conditional_get(
+    author_client, note, django_assert_num_queries
+):
+    url = reverse('notes:list')
+    etag = author_client.get(url)['ETag']
+    # Сессия и агрегат (пользователь из кэша) - строки заметок
+    # не читаются:
+    with django_assert_num_queries(2):
+        response = author_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    # Удаление не меняет MAX(updated), но меняет количество:
+    note.delete()
+    response = author_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.OK
+
+
+@pytest.mark.usefixtures('async_views')
+def test_async_notes_list_and_detail(author_client, note, not_author):
+    Note.objects.create(
+        title='Чужая', text='Текст', slug='foreign', author=not_author
+    )
+    assert resolve(reverse('notes:list')).func.view_class.view_is_async
+    response = author_client.get(reverse('notes:list'))
+    assert list(response.context['object_list']) == [note]
+    etag = response['ETag']
+    response = author_client.get(
+        reverse('notes:list'), HTTP_IF_NONE_MATCH=etag
+    )
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    response = author_client.get(reverse('notes:detail', args=(note.slug,)))
+    assert note.text in response.content.decode()
+
+
+@pytest.mark.parametrize(
+    'parametrized_client, note_in_archive',
+    (
+        (pytest.lazy_fixture('author_client'), True),
+        (pytest.lazy_fixture('not_author_client'), False),
+    )
+)
+def test_export_zip(note, parametrized_client, note_in_archive):
+    response = parametrized_client.get(reverse('notes:export'))
+    assert response['Content-Type'] == 'application/zip'
+    content = b''.join(response.streaming_content)
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        names = archive.namelist()
+        assert (f'{note.slug}.md' in names) is note_in_archive
+        if note_in_archive:
+            markdown = archive.read(f'{note.slug}.md').decode()
+            assert markdown == f'# {note.title}\n\n{note.text}\n'
+
+
+def test_export_zip_streams_large_text(author, author_client):
+    text = 'строка журнала\n' * 20000
+    Note.objects.create(title='Лог', text=text, slug='log', author=author)
+    response = author_client.get(reverse('notes:export'))
+    chunks = [chunk for chunk in response.streaming_content if chunk]
+    # Архив отдаётся частями по мере сжатия, а не одним блоком:
+    assert len(chunks) > 1
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+        assert archive.read('log.md').decode() == f'# Лог\n\n{text}\n'
+
+
+def metric_value(content, line_prefix):
+    for line in content.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(' ', 1)[1])
+    return 0.0
+
+
+def test_metrics_endpoint(author_client, client, note):
+    count_line = 'yanote_request_duration_seconds_count{view="notes:list"}'
+    before = metric_value(client.get('/metrics').content.decode(), count_line)
+    author_client.get(reverse('notes:list'))
+    content = client.get('/metrics').content.decode()
+    assert metric_value(content, count_line) == before + 1
+    assert metric_value(
+        content, 'yanote_request_queries_sum{view="notes:list"}'
+    ) > 0
+    assert metric_value(
+        content, 'yanote_template_seconds_total{view="notes:list"}'
+    ) > 0
+    assert metric_value(content, 'yanote_admission_shed_total') == 0
+
+
+@pytest.mark.usefixtures('async_views')
+def test_middleware_stack_runs_natively_under_asgi(
+    author, form_data, settings, caplog
+):
+    # При DEBUG Django пишет в лог каждый middleware, обёрнутый в поток.
+    settings.DEBUG = True
+    settings.ADMISSION_BURST = 1
+    settings.ADMISSION_RATE = 0.01
+    count_line = 'yanote_request_duration_seconds_count{view="notes:add"}'
+
+    async def browse():
+        anonymous = AsyncClient()
+        await anonymous.get(reverse('notes:home'))
+        hits_before = caches['pages'].stats()['hits']
+        await anonymous.get(reverse('notes:home'))
+        assert caches['pages'].stats()['hits'] == hits_before + 1
+        client = AsyncClient()
+        await client.aforce_login(author)
+        before = metric_value(
+            (await anonymous.get('/metrics')).content.decode(), count_line
+        )
+        response = await client.post(reverse('notes:add'), form_data)
+        assert response.status_code == HTTPStatus.FOUND
+        response = await client.post(reverse('notes:add'), form_data)
+        assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+        content = (await anonymous.get('/metrics')).content.decode()
+        # Отклонённый запрос до разбора URL не дошёл:
+        assert metric_value(content, count_line) == before + 1
+        assert metric_value(
+            content, 'yanote_request_queries_sum{view="notes:add"}'
+        ) > 0
+
+    with caplog.at_level(logging.DEBUG, logger='django.request'):
+        async_to_sync(browse)()
+    assert 'adapted' not in caplog.text
+    assert Note.objects.filter(title=form_data['title']).exists()
+
+
+def test_metrics_forbidden_for_other_hosts(client):
+    response = client.get('/metrics', REMOTE_ADDR='10.0.0.1')
+    assert response.status_code == HTTPStatus.FORBIDDEN
+
+
+def test_metrics_merge_worker_processes(client, settings, tmp_path):
+    settings.METRICS_DIR = str(tmp_path)
+    other_worker = {
+        'views': {'notes:detail': {
+            **empty_view_stats(), 'count': 5, 'queries': 10,
+        }},
+        'cache': {'hits': 7},
+    }
+    (tmp_path / 'metrics-1.json').write_text(json.dumps(other_worker))
+    content = client.get('/metrics').content.decode()
+    assert metric_value(
+        content, 'yanote_request_duration_seconds_count{view="notes:detail"}'
+    ) >= 5
+    assert metric_value(content, 'yanote_fragment_cache_hits_total') >= 7
+
+
+def csrf_input_value(content):
+    return re.search(
+        r'name="csrfmiddlewaretoken" value="([^"]+)"', content
+    ).group(1)
+
+
+def test_login_page_cached_with_visitor_csrf_token(author):
+    author.set_password('password')
+    author.save()
+    pages = caches['pages']
+    url = reverse('users:login')
+    Client().get(url)
+    hits_before = pages.stats()['hits']
+    visitor = Client(enforce_csrf_checks=True)
+    response = visitor.get(url)
+    assert pages.stats()['hits'] == hits_before + 1
+    assert 'csrftoken' in response.cookies
+    token = csrf_input_value(response.content.decode())
+    response = visitor.post(url, {
+        'username': author.username,
+        'password': 'password',
+        'csrfmiddlewaretoken': token,
+    })
+    assert response.status_code == HTTPStatus.FOUND
+
+
+def test_page_cache_skips_authenticated_users(author_client, author):
+    pages = caches['pages']
+    url = reverse('notes:home')
+    Client().get(url)
+    hits_before = pages.stats()['hits']
+    response = author_client.get(url)
+    assert author.username in response.content.decode()
+    assert pages.stats()['hits'] == hits_before
+
+
+def test_page_cache_warm_up():
+    out = io.StringIO()
+    call_command('warm_page_cache', stdout=out)
+    assert 'Страниц в кэше: 3' in out.getvalue()
+    assert caches['pages'].get(page_key(reverse('notes:home'))) is not None
+
+
+def test_notes_list_reads_only_list_columns(author, author_client, note):
+    Note.objects.create(
+        title='Вторая', text='Длинный текст ' * 50, author=author
+    )
+    with CaptureQueriesContext(connection) as captured:
+        response = author_client.get(reverse('notes:list'))
+    sql = ' '.join(query['sql'] for query in captured)
+    assert '"notes_note"."text"' not in sql
+    assert 'COUNT(' not in sql
+    assert response.context['note_count'] == 2
+    assert 'Длинный текст Длинный текст' in response.content.decode()
+    assert response['Last-Modified']
+
+
+def test_note_detail_renders_sanitized_markdown(author, author_client):
+    note = Note.objects.create(
+        title='Разметка', author=author,
+        text='**жирный**\n\n<script>alert(1)</script>',
+    )
+    content = author_client.get(
+        reverse('notes:detail', args=(note.slug,))
+    ).content.decode()
+    assert '<strong>жирный</strong>' in content
+    assert 'alert(1)' not in content
+    assert RenderedMarkdown.objects.filter(digest=note.text_digest).exists()
+
+
+def test_notes_list_filtered_by_tag(author, author_client, note):
+    work = Tag.objects.create(author=author, name='работа')
+    url = reverse('notes:list')
+
+    def list_queries():
+        caches['fragments'].clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = author_client.get(url, {'tag': work.name})
+        return response, len(captured)
+
+    note.tags.add(work)
+    list_queries()
+    response, queries = list_queries()
+    assert list(response.context['object_list']) == [note]
+    for number in range(5):
+        Note.objects.create(
+            title=f'Заметка {number}', text='Текст', author=author
+        ).tags.add(work)
+    Note.objects.create(title='Без метки', text='Текст', author=author)
+    # Метки всех заметок страницы читаются одним запросом:
+    response, more_queries = list_queries()
+    assert more_queries == queries
+    assert response.context['note_count'] == 6
+    assert 'Без метки' not in response.content.decode()
+    assert '#работа' in response.content.decode()
+    response = author_client.get(url, {'tag': 'нет-такой'})
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_export_zip_streams_under_asgi(author, note):
+    async def download():
+        client = AsyncClient()
+        await client.aforce_login(author)
+        response = await client.get(reverse('notes:export'))
+        # Асинхронный итератор: ASGI отдаёт куски по мере сжатия.
+        assert response.is_async
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    content = async_to_sync(download)()
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        assert archive.read(f'{note.slug}.md').decode() == (
+            f'# {note.title}\n\n{note.text}\n'
+        )
+
+
+def test_note_events_stream(author, django_capture_on_commit_callbacks):
+    def create_note():
+        with django_capture_on_commit_callbacks(execute=True):
+            return Note.objects.create(
+                title='Новая', text='Текст', author=author
+            )
+
+    async def receive():
+        client = AsyncClient()
+        await client.aforce_login(author)
+        response = await client.get(reverse('notes:events'))
+        assert response['Content-Type'] == 'text/event-stream'
+        stream = aiter(response.streaming_content)
+        assert (await anext(stream)).startswith(b'retry:')
+        assert broker.subscriber_count() == 1
+        note = await sync_to_async(create_note)()
+        event = (await anext(stream)).decode()
+        await stream.aclose()
+        return note, event
+
+    note, event = async_to_sync(receive)()
+    assert 'event: note' in event
+    data = json.loads(event.split('data: ')[1])
+    assert data == {
+        'action': 'create', 'id': note.pk, 'slug': note.slug,
+        'title': 'Новая',
+    }
+    assert broker.subscriber_count() == 0
+
+
+def test_note_events_need_asgi_and_login(author_client, client):
+    url = reverse('notes:events')
+    assert author_client.get(url).status_code == HTTPStatus.NOT_IMPLEMENTED
+    response = async_to_sync(AsyncClient().get)(url)
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_note_detail_shows_wiki_links_and_backlinks(
+    author, author_client, note, not_author
+):
+    Note.objects.create(
+        title='Ссылается', text=f'См. [[{note.slug}]]', author=author
+    )
+    Note.objects.create(
+        title='Чужая', text=f'[[{note.slug}]]', slug='foreign',
+        author=not_author,
+    )
+    content = author_client.get(
+        reverse('notes:detail', args=(note.slug,))
+    ).content.decode()
+    assert 'Ссылается' in content
+    assert 'Чужая' not in content
+    linking = Note.objects.get(title='Ссылается')
+    content = author_client.get(
+        reverse('notes:detail', args=(linking.slug,))
+    ).content.decode()
+    assert f'href="{reverse("notes:detail", args=(note.slug,))}"' in content
+
+
+def test_note_detail_shows_similar_notes(author, author_client, note):
+    note.text = (
+        'Встреча с командой в пятницу в десять утра в большой переговорной'
+    )
+    note.save()
+    Note.objects.create(
+        title='Похожая', text=note.text + ' на втором этаже', author=author
+    )
+    content = author_client.get(
+        reverse('notes:detail', args=(note.slug,))
+    ).content.decode()
+    assert 'Похожие заметки' in content
+    assert 'Похожая' in content
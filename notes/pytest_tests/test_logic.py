@@ -1,17 +1,49 @@
 # test_logic.py
 from pytest_django.asserts import assertRedirects
+import asyncio
+import time
+from datetime import timedelta
 from http import HTTPStatus
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
 
 import pytest
 
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.checks import run_checks
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from notes.models import Note
+from notes import (
+    admission, benchmark, bulk, events, jobs, minhash, rendering, revisions,
+    sessions, similarity, slugs,
+)
+from notes.auth import LOCAL_USER_TIMEOUT, user_key
+from notes.fields import CompressedText
+from notes.db import (
+    READ_DATABASE, ReadDatabaseRouter, apply_sqlite_pragmas,
+    use_read_database,
+)
+from notes.models import (
+    Job, Note, NoteBand, NoteLink, RenderedMarkdown, Tag,
+)
+from notes.search import search_notes
+from notes.tags import set_tags, tag_string
+from notes.similarity import duplicate_clusters, similar_notes
+from notes.summary import get_summary
 # Импортируем функции для проверки редиректа и ошибки формы:
 from pytest_django.asserts import assertRedirects, assertFormError
 
 # Импортируем из модуля forms сообщение об ошибке:
-from notes.forms import WARNING
+from notes.forms import WARNING, NoteForm
 from pytils.translit import slugify
 
 
@@ -64,6 +96,31 @@ def test_not_unique_slug(author_client, note, form_data):
     assert Note.objects.count() == 1
 
 
+def test_slug_taken_in_race(author_client, note, form_data, monkeypatch):
+    # Проверка формы не видит slug, занятый уже после неё:
+    monkeypatch.setattr(
+        NoteForm, 'clean_slug', lambda form: form.cleaned_data['slug']
+    )
+    monkeypatch.setattr(NoteForm, 'validate_unique', lambda form: None)
+    form_data['slug'] = note.slug
+    response = author_client.post(reverse('notes:add'), data=form_data)
+    assertFormError(
+        response.context['form'], 'slug', errors=(note.slug + WARNING)
+    )
+
+
+def test_other_integrity_error_not_blamed_on_slug(
+    author_client, form_data, monkeypatch
+):
+    def save(self, *args, **kwargs):
+        raise IntegrityError('CHECK constraint failed')
+
+    monkeypatch.setattr(Note, 'save', save)
+    form_data.pop('slug')
+    with pytest.raises(IntegrityError):
+        author_client.post(reverse('notes:add'), data=form_data)
+
+
 def test_empty_slug(author_client, form_data):
     url = reverse('notes:add')
     # Убираем поле slug из словаря:
@@ -128,3 +185,953 @@ def test_other_user_cant_delete_note(not_author_client, slug_for_args):
     response = not_author_client.post(url)
     assert response.status_code == HTTPStatus.NOT_FOUND
     assert Note.objects.count() == 1 
+
+
+def test_search_index_follows_note_changes(author, note):
+    note.text = 'Совсем новый текст'
+    note.save()
+    queryset = Note.objects.filter(author=author)
+    assert note in search_notes(queryset, 'новый')
+    assert note not in search_notes(queryset, 'заметки')
+    note.delete()
+    assert not search_notes(queryset, 'новый').exists()
+
+
+def test_search_index_keeps_no_copy_of_texts(author, note):
+    Note.objects.bulk_create([
+        Note(title='Без индекса', text='Текст', slug='bulk', author=author)
+    ])
+    unindexed = Note.objects.get(slug='bulk')
+    unindexed.text = 'Проиндексирован при правке'
+    unindexed.save()
+    note.text = 'Совсем новый текст'
+    note.save()
+    note.save()
+    queryset = Note.objects.filter(author=author)
+    assert list(search_notes(queryset, 'правке')) == [unindexed]
+    assert list(search_notes(queryset, 'новый')) == [note]
+    unindexed.delete()
+    # Прежние слова удалены из индекса вместе с заметкой или правкой:
+    assert not search_notes(queryset, 'правке').exists()
+    assert not search_notes(queryset, 'заметки').exists()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT title, text FROM notes_note_fts')
+        assert cursor.fetchall() == [(None, None)]
+
+
+def test_after_bulk_create_matches_signals(author, note):
+    notes = Note.objects.bulk_create([
+        Note(
+            title='Пачка', text=f'Ссылка на [[{note.slug}]]', slug='bulk',
+            author=author,
+        ),
+    ])
+    bulk.after_bulk_create(notes)
+    queryset = Note.objects.filter(author=author)
+    assert list(search_notes(queryset, 'ссылка')) == notes
+    assert note_links(notes[0]) == {note.slug}
+    assert NoteBand.objects.filter(note=notes[0]).exists()
+    assert get_summary(author.pk)[0] == 2
+
+
+def test_rebuild_search_index_command(author, note):
+    # bulk_create не вызывает сигналы, заметка попадёт в индекс
+    # только после перестроения:
+    Note.objects.bulk_create([
+        Note(title='Без индекса', text='Текст', slug='bulk', author=author)
+    ])
+    queryset = Note.objects.filter(author=author)
+    assert not search_notes(queryset, 'индекса').exists()
+    call_command('rebuild_search_index', batch_size=1, stdout=StringIO())
+    assert search_notes(queryset, 'индекса').count() == 1
+    assert note in search_notes(queryset, 'заметки')
+
+
+@pytest.mark.parametrize('extension', ('jsonl', 'csv'))
+def test_export_import_notes(tmp_path, author, note, extension):
+    path = tmp_path / f'notes.{extension}'
+    call_command('export_notes', str(path), stdout=StringIO())
+    # Повторный импорт тех же строк: slug уже заняты и получают суффиксы.
+    call_command('import_notes', str(path), batch_size=1, stdout=StringIO())
+    assert Note.objects.count() == 2
+    imported = Note.objects.exclude(pk=note.pk).get()
+    assert imported.title == note.title
+    assert imported.text == note.text
+    assert imported.author == author
+    assert imported.slug == f'{note.slug}-2'
+    assert imported in search_notes(Note.objects.all(), 'заметки')
+
+
+def test_import_allocates_slugs_for_batch(tmp_path, author):
+    path = tmp_path / 'notes.jsonl'
+    path.write_text(
+        '{"title": "Список покупок", "text": "Хлеб"}\n'
+        '{"title": "Список покупок", "text": "Молоко"}\n',
+        encoding='utf-8',
+    )
+    call_command(
+        'import_notes', str(path), author=author.username, stdout=StringIO()
+    )
+    expected_slug = slugify('Список покупок')
+    assert set(Note.objects.values_list('slug', flat=True)) == {
+        expected_slug, f'{expected_slug}-2'
+    }
+    # bulk_create минует сигналы, превью и сводку считает импорт:
+    assert set(Note.objects.values_list('preview', flat=True)) == {
+        'Хлеб', 'Молоко'
+    }
+    assert get_summary(author.pk)[0] == 2
+
+
+def test_empty_slug_gets_numeric_suffix(author_client, note, form_data):
+    url = reverse('notes:add')
+    form_data.pop('slug')
+    # Заголовок, из которого получается уже занятый slug:
+    form_data['title'] = note.slug
+    for expected_slug in (f'{note.slug}-2', f'{note.slug}-3'):
+        response = author_client.post(url, data=form_data)
+        assertRedirects(response, reverse('notes:success'))
+        assert Note.objects.filter(slug=expected_slug).exists()
+
+
+def test_slug_allocation_retries_on_race(author, note, monkeypatch):
+    # Имитируем гонку: первый подбор не видит уже занятый slug.
+    stale_results = [set()]
+
+    def taken_slugs(base, exclude_pk=None):
+        if stale_results:
+            return stale_results.pop()
+        return original_taken_slugs(base, exclude_pk)
+
+    original_taken_slugs = slugs.taken_slugs
+    monkeypatch.setattr(slugs, 'taken_slugs', taken_slugs)
+    new_note = Note.objects.create(
+        title=note.slug, text='Текст', author=author
+    )
+    assert new_note.slug == f'{note.slug}-2'
+
+
+def test_api_create_update_delete(author_client, author, form_data):
+    url = reverse('api:list')
+    response = author_client.post(
+        url, data=form_data, content_type='application/json'
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.json()['slug'] == form_data['slug']
+    detail_url = reverse('api:detail', args=(form_data['slug'],))
+    response = author_client.patch(
+        detail_url, data={'text': 'Другой текст'},
+        content_type='application/json',
+    )
+    assert response.status_code == HTTPStatus.OK
+    note = Note.objects.get()
+    assert note.text == 'Другой текст'
+    assert note.title == form_data['title']
+    assert note.author == author
+    response = author_client.delete(detail_url)
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert Note.objects.count() == 0
+
+
+def test_api_partial_update_keeps_tags(author_client, note):
+    set_tags(note, ['работа', 'срочно'])
+    response = author_client.patch(
+        reverse('api:detail', args=(note.slug,)), data={'title': 'Новый'},
+        content_type='application/json',
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert tag_string(note) == 'работа срочно'
+    response = author_client.patch(
+        reverse('api:detail', args=(note.slug,)), data={'tags': 'дом'},
+        content_type='application/json',
+    )
+    assert tag_string(note) == 'дом'
+
+
+def test_api_token_skips_csrf(author, note, form_data):
+    client = Client(enforce_csrf_checks=True)
+    url = reverse('api:list')
+    response = client.post(url, data=form_data,
+                           content_type='application/json')
+    assert response.status_code == HTTPStatus.FORBIDDEN
+    out = StringIO()
+    call_command('api_token', author.username, stdout=out)
+    headers = {'Authorization': f'Bearer {out.getvalue().strip()}'}
+    response = client.post(
+        url, data=form_data, content_type='application/json',
+        headers=headers,
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    response = client.post(
+        reverse('api:batch'), content_type='application/json',
+        data={'operations': [{'op': 'delete', 'slug': note.slug}]},
+        headers=headers,
+    )
+    assert response.status_code == HTTPStatus.OK
+    # Токен с ошибкой и токен до смены пароля не действуют:
+    response = client.get(url, headers={'Authorization': 'Bearer x'})
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    author.set_password('new-password')
+    author.save()
+    response = client.get(url, headers=headers)
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_api_checks_json_types(author_client, note, form_data):
+    url = reverse('api:list')
+    response = author_client.post(
+        url, data={**form_data, 'text': 42, 'tags': [1]},
+        content_type='application/json',
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert set(response.json()['errors']) == {'text', 'tags'}
+    response = author_client.patch(
+        reverse('api:detail', args=(note.slug,)),
+        data={'tags': ['работа', 'дом']}, content_type='application/json',
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert tag_string(note) == 'дом работа'
+    response = author_client.get(url, {'after': 'x'})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert 'after' in response.json()['errors']
+
+
+def test_api_batch_reports_each_operation(author_client, note, form_data):
+    operations = [
+        {'op': 'create', 'data': form_data},
+        {'op': 'update', 'slug': note.slug, 'data': {'title': 'Новый'}},
+        {'op': 'create', 'data': {'text': 'Дубль', 'slug': note.slug}},
+        {'op': 'delete', 'slug': 'missing'},
+        {'op': 'delete', 'slug': form_data['slug']},
+    ]
+    response = author_client.post(
+        reverse('api:batch'), data={'operations': operations},
+        content_type='application/json',
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    statuses = [result['status'] for result in response.json()['results']]
+    assert statuses == [201, 200, 400, 404, 204]
+    note.refresh_from_db()
+    assert note.title == 'Новый'
+    assert Note.objects.count() == 1
+
+
+def test_api_atomic_batch_rolls_back(author_client, note, form_data):
+    operations = [
+        {'op': 'create', 'data': form_data},
+        {'op': 'update', 'slug': 'missing', 'data': {'title': 'Новый'}},
+    ]
+    response = author_client.post(
+        reverse('api:batch'),
+        data={'operations': operations, 'atomic': True},
+        content_type='application/json',
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert Note.objects.count() == 1
+
+
+def test_api_batch_ignores_notes_of_other_users(
+    not_author_client, note
+):
+    response = not_author_client.post(
+        reverse('api:batch'),
+        data={'operations': [{'op': 'delete', 'slug': note.slug}]},
+        content_type='application/json',
+    )
+    assert response.json()['results'][0]['status'] == HTTPStatus.NOT_FOUND
+    assert Note.objects.filter(pk=note.pk).exists()
+
+
+@pytest.mark.usefixtures('async_views')
+def test_async_views_crud(author_client, author, form_data):
+    response = author_client.post(reverse('notes:add'), data=form_data)
+    assertRedirects(response, reverse('notes:success'))
+    note = Note.objects.get()
+    assert note.author == author
+    # Повтор со вторым таким же slug - ошибка формы, как и в sync-версии:
+    response = author_client.post(reverse('notes:add'), data=form_data)
+    assertFormError(
+        response.context['form'], 'slug', errors=(note.slug + WARNING)
+    )
+    form_data['text'] = 'Изменённый текст'
+    response = author_client.post(
+        reverse('notes:edit', args=(note.slug,)), data=form_data
+    )
+    assertRedirects(response, reverse('notes:success'))
+    note.refresh_from_db()
+    assert note.text == form_data['text']
+    response = author_client.post(reverse('notes:delete', args=(note.slug,)))
+    assertRedirects(response, reverse('notes:success'))
+    assert Note.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_sqlite_pragmas_applied_to_connection(settings):
+    settings.SQLITE_PRAGMAS = {'cache_size': -4000}
+    apply_sqlite_pragmas(connection)
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA cache_size')
+        assert cursor.fetchone()[0] == -4000
+
+
+def test_read_router_only_inside_read_only_views(settings, monkeypatch):
+    monkeypatch.setitem(settings.DATABASES, READ_DATABASE, {})
+    router = ReadDatabaseRouter()
+    assert router.db_for_read(Note) is None
+    with use_read_database():
+        assert router.db_for_read(Note) == READ_DATABASE
+        # Сессии и пользователи читаются из основной базы:
+        assert router.db_for_read(Session) is None
+    assert router.db_for_write(Note) == 'default'
+
+
+@pytest.mark.django_db
+def test_benchmark_run_and_compare():
+    authors = benchmark.seed(users=2, notes_per_user=3, text_bytes=100)
+    assert Note.objects.count() == 6
+    results = benchmark.run(authors[0], requests=3)
+    assert set(results) == set(benchmark.ROUTES)
+    assert all(metrics['queries'] > 0 for metrics in results.values())
+    assert benchmark.compare(results, results, threshold=0) == []
+    faster_baseline = {
+        route: {**metrics, 'p95': metrics['p95'] / 2}
+        for route, metrics in results.items()
+    }
+    regressions = benchmark.compare(results, faster_baseline, threshold=0.2)
+    assert len(regressions) == len(benchmark.ROUTES)
+
+
+@pytest.mark.django_db
+def test_benchmark_not_throttled(settings):
+    settings.ADMISSION_BURST = 5
+    authors = benchmark.seed(users=1, notes_per_user=10, text_bytes=100)
+    results = benchmark.run(
+        authors[0], requests=10, routes=('notes:add', 'notes:edit')
+    )
+    assert set(results) == {'notes:add', 'notes:edit'}
+
+
+@pytest.fixture
+def cached_sessions(settings, db):
+    settings.SESSION_ENGINE = 'notes.sessions'
+    # Фоновая запись не должна вмешиваться в тест.
+    settings.SESSION_WRITE_BEHIND_INTERVAL = 3600
+    sessions.session_cache.clear()
+    yield
+    sessions.write_behind.flush()
+    sessions.session_cache.clear()
+
+
+@pytest.mark.usefixtures('cached_sessions')
+def test_cached_sessions_skip_database(author):
+    client = Client()
+    client.force_login(author)
+    client.get(reverse('notes:list'))
+    with CaptureQueriesContext(connection) as captured:
+        client.get(reverse('notes:list'))
+    assert not any('django_session' in query['sql'] for query in captured)
+    store = sessions.SessionStore(client.session.session_key)
+    store['theme'] = 'dark'
+    store.save()
+    row = Session.objects.get(session_key=store.session_key)
+    assert 'theme' not in row.get_decoded()
+    sessions.write_behind.flush()
+    row = Session.objects.get(session_key=store.session_key)
+    assert row.get_decoded()['theme'] == 'dark'
+    store.delete()
+    assert not Session.objects.filter(session_key=store.session_key).exists()
+
+
+@pytest.mark.usefixtures('cached_sessions')
+def test_cached_sessions_skip_unchanged_writes(author):
+    store = sessions.SessionStore()
+    store['theme'] = 'dark'
+    store.save()
+    store = sessions.SessionStore(store.session_key)
+    store['theme'] = 'dark'
+    assert not store.defer_save(store.load(), store.get_expiry_date())
+
+
+@pytest.mark.usefixtures('cached_sessions')
+def test_write_behind_thread_flushes_and_forgets_deleted(monkeypatch):
+    kept, deleted = sessions.SessionStore(), sessions.SessionStore()
+    for store in (kept, deleted):
+        store['theme'] = 'light'
+        store.save()
+        store['theme'] = 'dark'
+        store.save()
+    Session.objects.filter(session_key=deleted.session_key).delete()
+    # Один проход цикла фонового потока:
+    stops = [False, True]
+    monkeypatch.setattr(
+        sessions.write_behind, 'stopping',
+        SimpleNamespace(wait=lambda timeout: stops.pop(0)),
+    )
+    monkeypatch.setattr(sessions, 'close_old_connections', lambda: None)
+    sessions.write_behind.run()
+    row = Session.objects.get(session_key=kept.session_key)
+    assert row.get_decoded()['theme'] == 'dark'
+    assert not Session.objects.filter(
+        session_key=deleted.session_key
+    ).exists()
+    assert sessions.session_cache.get(deleted.session_key) is None
+    assert sessions.session_cache.get(kept.session_key) is not None
+
+
+@pytest.mark.django_db
+def test_purge_sessions_command():
+    expired = timezone.now() - timedelta(days=1)
+    Session.objects.bulk_create(
+        Session(session_key=f'expired{number}', session_data='',
+                expire_date=expired)
+        for number in range(5)
+    )
+    Session.objects.create(
+        session_key='active', session_data='',
+        expire_date=timezone.now() + timedelta(days=1),
+    )
+    out = StringIO()
+    call_command('purge_sessions', batch_size=2, stdout=out)
+    assert '5' in out.getvalue()
+    assert list(Session.objects.values_list('session_key', flat=True)) == [
+        'active'
+    ]
+
+
+def test_cached_user_saves_query(author, author_client):
+    url = reverse('notes:list')
+    author_client.get(url)
+    with CaptureQueriesContext(connection) as captured:
+        response = author_client.get(url)
+    assert response.context['user'] == author
+    assert not any('auth_user' in query['sql'] for query in captured)
+
+
+def test_password_change_invalidates_cached_user(author, author_client):
+    url = reverse('notes:list')
+    author_client.get(url)
+    author.set_password('new-password')
+    author.save()
+    response = author_client.get(url)
+    assertRedirects(response, f'{reverse("users:login")}?next={url}')
+
+
+def test_logout_forgets_cached_user(author, author_client):
+    author_client.get(reverse('notes:list'))
+    assert caches['users'].get(user_key(author.pk)) is not None
+    author_client.post(reverse('users:logout'))
+    assert caches['users'].get(user_key(author.pk)) is None
+
+
+def test_process_local_user_cache_is_short_lived(author, author_client):
+    author_client.get(reverse('notes:list'))
+    users = caches['users']
+    expires = users._expire_info[users.make_and_validate_key(
+        user_key(author.pk)
+    )]
+    # Сброс после смены пароля другим процессам не виден, поэтому
+    # запись в памяти процесса живёт недолго:
+    assert expires <= time.time() + LOCAL_USER_TIMEOUT
+    warnings = run_checks(include_deployment_checks=True)
+    assert 'notes.W001' in [warning.id for warning in warnings]
+
+
+def test_admission_throttles_user_writes(author_client, settings):
+    settings.ADMISSION_BURST = 2
+    settings.ADMISSION_RATE = 0.01
+    url = reverse('api:list')
+    for number in range(2):
+        response = author_client.post(
+            url, {'title': f'Заметка {number}', 'text': 'Текст'},
+            content_type='application/json',
+        )
+        assert response.status_code == HTTPStatus.CREATED
+    response = author_client.post(
+        url, {'title': 'Лишняя', 'text': 'Текст'},
+        content_type='application/json',
+    )
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert int(response['Retry-After']) >= 1
+    assert admission.write_gate.stats()['throttled'] == 1
+    # Чтение не ограничивается:
+    assert author_client.get(url).status_code == HTTPStatus.OK
+
+
+def test_admission_sheds_writes_over_limit(author_client, form_data, settings):
+    settings.ADMISSION_MAX_WRITES = 0
+    settings.ADMISSION_QUEUE_SIZE = 0
+    response = author_client.post(reverse('notes:add'), data=form_data)
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response['Retry-After'] == '1'
+    assert Note.objects.count() == 0
+
+
+def test_write_gate_queue_timeout(settings):
+    settings.ADMISSION_MAX_WRITES = 1
+    settings.ADMISSION_QUEUE_TIMEOUT = 0.01
+    gate = admission.WriteGate()
+    assert gate.acquire()
+    assert not gate.acquire()
+    gate.release()
+    assert gate.acquire()
+    assert gate.stats() == {
+        'admitted': 2, 'queued': 1, 'shed': 1, 'throttled': 0,
+    }
+
+
+def test_revisions_reconstruct_every_version(note, monkeypatch):
+    monkeypatch.setattr(revisions, 'SNAPSHOT_INTERVAL', 4)
+    versions = [note.text]
+    for number in range(1, 11):
+        note.text = '\n'.join(
+            f'строка {line} правка {number if line % 3 == 0 else 0}'
+            for line in range(number * 5)
+        )
+        note.save()
+        versions.append(note.text)
+    assert note.revisions.filter(is_snapshot=True).count() == 2
+    for number, text in enumerate(versions[:-1], start=1):
+        assert revisions.revision_text(note, number) == text
+
+
+def test_revisions_read_previous_version_from_database(note):
+    original = note.text
+    # Две копии загружены до первой правки; вторая о ней не знает.
+    first = Note.objects.get(pk=note.pk)
+    second = Note.objects.get(pk=note.pk)
+    first.text = 'Первая правка'
+    first.save()
+    second.text = 'Вторая правка'
+    second.save()
+    # Повторное сохранение той же копии после правки в обход неё:
+    Note.objects.filter(pk=note.pk).update(text='Третья правка')
+    second.text = 'Четвёртая правка'
+    second.save()
+    assert [
+        revisions.revision_text(second, number) for number in (1, 2, 3)
+    ] == [original, 'Первая правка', 'Третья правка']
+
+
+def test_author_can_restore_revision(author_client, note, form_data):
+    old_text = note.text
+    author_client.post(reverse('notes:edit', args=(note.slug,)), form_data)
+    note.refresh_from_db()
+    response = author_client.post(
+        reverse('notes:revision', args=(note.slug, 1))
+    )
+    assertRedirects(response, reverse('notes:detail', args=(note.slug,)))
+    note.refresh_from_db()
+    assert note.text == old_text
+    # Восстановление тоже попадает в историю:
+    assert revisions.revision_text(note, 2) == form_data['text']
+
+
+def test_other_user_cant_restore_revision(not_author_client, note):
+    note.text = 'Новый текст'
+    note.save()
+    response = not_author_client.post(
+        reverse('notes:revision', args=(note.slug, 1))
+    )
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_compact_revisions_command(note):
+    versions = [note.text]
+    for number in range(6):
+        note.text = f'Версия {number}'
+        note.save()
+        versions.append(note.text)
+    call_command('compact_revisions', keep=2, stdout=StringIO())
+    numbers = list(
+        note.revisions.order_by('number').values_list('number', flat=True)
+    )
+    assert numbers == [1, 5, 6]
+    for number in numbers:
+        assert revisions.revision_text(note, number) == versions[number - 1]
+
+
+def stored_type(note):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT typeof(text) FROM notes_note WHERE id = %s', [note.pk]
+        )
+        return cursor.fetchone()[0]
+
+
+def test_large_text_compressed_and_loaded_lazily(author, note, settings):
+    settings.NOTES_COMPRESS_THRESHOLD = 1024
+    text = 'Строка журнала\n' * 1000
+    large = Note.objects.create(
+        title='Журнал', text=text, slug='log', author=author
+    )
+    assert stored_type(large) == 'blob'
+    assert stored_type(note) == 'text'
+    large = Note.objects.get(pk=large.pk)
+    assert isinstance(large.__dict__['text'], CompressedText)
+    assert large.text == text
+    assert search_notes(Note.objects.all(), 'журнала').get() == large
+    call_command('rebuild_search_index', stdout=StringIO())
+    assert search_notes(Note.objects.all(), 'журнала').get() == large
+
+
+def test_migration_compresses_existing_texts(note, settings):
+    settings.NOTES_COMPRESS_THRESHOLD = 1024
+    text = 'x' * 5000
+    Note.objects.filter(pk=note.pk).update(text=text)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'UPDATE notes_note SET text = %s WHERE id = %s', [text, note.pk]
+        )
+    assert stored_type(note) == 'text'
+    migration = import_module('notes.migrations.0006_note_compressed_text')
+    migration.compress_texts(apps, SimpleNamespace(connection=connection))
+    assert stored_type(note) == 'blob'
+    note.refresh_from_db()
+    assert note.text == text
+
+
+def test_preview_follows_text(author, note):
+    assert note.preview == note.text
+    note.text = 'слово  \n ' * 100
+    note.save()
+    assert len(note.preview) == 140
+    assert note.preview.endswith('…')
+    assert '\n' not in note.preview
+
+
+def test_summary_maintained_incrementally(author, note):
+    assert get_summary(author.pk) == (1, note.updated)
+    second = Note.objects.create(title='Вторая', text='Текст', author=author)
+    assert get_summary(author.pk) == (2, second.updated)
+    second.delete()
+    count, last_modified = get_summary(author.pk)
+    assert count == 1
+    assert last_modified > second.updated
+
+
+def test_markdown_rendered_once_per_text(author, note, monkeypatch):
+    calls = []
+    original = rendering.render_markdown
+    monkeypatch.setattr(
+        rendering, 'render_markdown',
+        lambda text: calls.append(text) or original(text),
+    )
+    twin = Note.objects.create(title='Копия', text=note.text, author=author)
+    assert rendering.note_html(note) == rendering.note_html(twin)
+    assert len(calls) == 1
+    note.text = '# Заголовок'
+    note.save()
+    assert '<h1>Заголовок</h1>' in rendering.note_html(note)
+    assert len(calls) == 2
+
+
+def test_prerender_notes_command(author, note):
+    out = StringIO()
+    call_command('prerender_notes', stdout=out)
+    assert '1' in out.getvalue()
+    note.text = 'Другой текст'
+    note.save()
+    call_command('prerender_notes', prune=True, stdout=StringIO())
+    assert list(
+        RenderedMarkdown.objects.values_list('digest', flat=True)
+    ) == [note.text_digest]
+
+
+def tag_counts(author):
+    return dict(Tag.objects.filter(author=author).values_list(
+        'name', 'note_count'
+    ))
+
+
+def test_tag_counts_maintained_incrementally(
+    author_client, author, note, form_data
+):
+    form_data['tags'] = 'Работа, #идеи работа'
+    author_client.post(reverse('notes:add'), data=form_data)
+    new_note = Note.objects.get(slug=form_data['slug'])
+    assert set(new_note.tags.values_list('name', flat=True)) == {
+        'работа', 'идеи'
+    }
+    note.tags.add(Tag.objects.get(name='работа'))
+    assert tag_counts(author) == {'работа': 2, 'идеи': 1}
+    form_data['tags'] = 'идеи'
+    author_client.post(
+        reverse('notes:edit', args=(new_note.slug,)), data=form_data
+    )
+    assert tag_counts(author) == {'работа': 1, 'идеи': 1}
+    # Снятие отсутствующей связи счётчик не меняет:
+    note.tags.remove(Tag.objects.get(name='идеи'))
+    Tag.objects.get(name='работа').notes.clear()
+    assert tag_counts(author) == {'работа': 0, 'идеи': 1}
+    new_note.delete()
+    assert tag_counts(author) == {'работа': 0, 'идеи': 0}
+
+
+def test_too_many_tags_rejected(author_client, form_data):
+    form_data['tags'] = ' '.join(f'метка{number}' for number in range(21))
+    response = author_client.post(reverse('notes:add'), data=form_data)
+    assertFormError(
+        response.context['form'], 'tags', errors='Не больше 20 меток.'
+    )
+    assert Note.objects.count() == 0
+
+
+@pytest.mark.usefixtures('async_views')
+def test_async_views_save_tags(author_client, author, form_data):
+    form_data['tags'] = 'идеи'
+    author_client.post(reverse('notes:add'), data=form_data)
+    note = Note.objects.get()
+    response = author_client.get(reverse('notes:edit', args=(note.slug,)))
+    assert response.context['form'].initial['tags'] == 'идеи'
+    form_data['tags'] = 'работа'
+    author_client.post(
+        reverse('notes:edit', args=(note.slug,)), data=form_data
+    )
+    assert tag_counts(author) == {'идеи': 0, 'работа': 1}
+
+
+@pytest.fixture
+def flaky_task(monkeypatch):
+    calls = []
+
+    def flaky(value):
+        calls.append(value)
+        if len(calls) < 3:
+            raise RuntimeError('Сбой')
+
+    monkeypatch.setitem(jobs.TASKS, 'tests.flaky', flaky)
+    flaky.max_attempts = 3
+    return calls
+
+
+@pytest.mark.django_db
+def test_job_retried_with_backoff(flaky_task):
+    jobs.enqueue('tests.flaky', 1)
+    assert jobs.run_pending() == 1
+    job = Job.objects.get()
+    assert (job.state, job.attempts) == (Job.PENDING, 1)
+    assert 'RuntimeError' in job.last_error
+    assert job.run_at > timezone.now()
+    # Задача не готова, пока не прошла задержка:
+    assert jobs.run_pending() == 0
+    for _ in range(2):
+        Job.objects.update(run_at=timezone.now())
+        assert jobs.run_pending() == 1
+    job.refresh_from_db()
+    assert (job.state, job.attempts, job.last_error) == (Job.DONE, 3, '')
+    assert flaky_task == [1, 1, 1]
+
+
+@pytest.mark.django_db
+def test_job_fails_after_max_attempts(flaky_task):
+    jobs.TASKS['tests.flaky'].max_attempts = 1
+    jobs.enqueue('tests.flaky', 1)
+    jobs.run_pending()
+    job = Job.objects.get()
+    assert (job.state, job.attempts) == (Job.FAILED, 1)
+    assert job.finished is not None
+    with pytest.raises(LookupError):
+        jobs.enqueue('tests.unknown')
+
+
+def test_note_save_schedules_markdown_once(author, note):
+    note.title = 'Новый заголовок'
+    note.save()
+    # Текст тот же - ключ идемпотентности тот же:
+    job = Job.objects.get()
+    assert job.key == f'markdown:{note.text_digest}'
+    RenderedMarkdown.objects.all().delete()
+    assert jobs.run_pending() == 1
+    assert RenderedMarkdown.objects.filter(digest=note.text_digest).exists()
+    Job.objects.update(finished=timezone.now() - timedelta(days=30))
+    assert jobs.purge_finished() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_run_jobs_command(flaky_task):
+    jobs.TASKS['tests.flaky'].max_attempts = 1
+    for value in range(3):
+        jobs.enqueue('tests.flaky', value)
+    call_command('run_jobs', burst=True, workers=2, stdout=StringIO())
+    assert sorted(flaky_task) == [0, 1, 2]
+    assert Job.objects.filter(state=Job.PENDING).count() == 0
+
+
+def finished_job(days_ago):
+    return Job.objects.create(
+        name='tests.done', state=Job.DONE, max_attempts=1,
+        run_at=timezone.now(),
+        finished=timezone.now() - timedelta(days=days_ago),
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_worker_purges_finished_jobs():
+    finished_job(days_ago=30)
+    recent = finished_job(days_ago=1)
+    worker = jobs.Worker(size=1)
+    try:
+        worker.run_once()
+        assert list(Job.objects.all()) == [recent]
+        # Следующая очистка - не раньше JOBS_PURGE_INTERVAL:
+        finished_job(days_ago=30)
+        worker.run_once()
+        assert Job.objects.count() == 2
+    finally:
+        worker.stop()
+
+
+@pytest.mark.django_db
+def test_worker_survives_loop_errors(settings, monkeypatch, caplog):
+    settings.JOBS_POLL_INTERVAL = 0.001
+    worker = jobs.Worker(size=1)
+    errors = [OperationalError('database is locked'), RuntimeError('сбой')]
+
+    def run_once():
+        if errors:
+            raise errors.pop(0)
+        worker.stopping.set()
+        return 0
+
+    monkeypatch.setattr(worker, 'run_once', run_once)
+    try:
+        worker.run()
+    finally:
+        worker.stop()
+    # Обе ошибки пережиты, цикл дошёл до остановки:
+    assert not errors
+    assert 'database is locked' in caplog.text
+    assert 'RuntimeError: сбой' in caplog.text
+
+
+def test_slow_event_subscriber_gets_reset(settings):
+    settings.NOTES_EVENTS_BUFFER = 2
+
+    async def overflow():
+        subscription = events.broker.subscribe(1)
+        try:
+            for number in range(3):
+                events.broker.publish(1, {'action': 'update', 'id': number})
+            # Публикация передаёт события в цикл через call_soon_threadsafe.
+            await asyncio.sleep(0)
+            received = [await subscription.next(0)]
+            received.append(await subscription.next(0))
+            return received
+        finally:
+            events.broker.unsubscribe(subscription)
+
+    assert async_to_sync(overflow)() == [events.RESET, None]
+
+
+def note_links(note):
+    return set(
+        NoteLink.objects.filter(source=note)
+        .values_list('target_slug', flat=True)
+    )
+
+
+def test_links_updated_incrementally(author, note):
+    note.text = 'См. [[first]] и [[second]], но не `[[code]]`'
+    note.save()
+    assert note_links(note) == {'first', 'second'}
+    first = NoteLink.objects.get(target_slug='first')
+    note.text = '[[first]] [[third]]'
+    note.save()
+    assert note_links(note) == {'first', 'third'}
+    # Оставшаяся ссылка не пересоздаётся:
+    assert NoteLink.objects.get(target_slug='first').pk == first.pk
+    note.title = 'Новый заголовок'
+    with CaptureQueriesContext(connection) as captured:
+        note.save()
+    assert not any('notes_notelink' in query['sql'] for query in captured)
+
+
+SIMILAR_TEXT = (
+    'Поезд отправляется с третьего пути в семь утра, билеты можно '
+    'купить в кассе на первом этаже вокзала или на сайте дороги'
+)
+
+
+def test_similar_notes_found_by_bands(author, not_author, note):
+    note.text = SIMILAR_TEXT
+    note.save()
+    close = Note.objects.create(
+        title='Похожая', text=SIMILAR_TEXT + ' заранее', author=author
+    )
+    Note.objects.create(
+        title='Другая', text='Купить молоко, хлеб и сыр', author=author
+    )
+    Note.objects.create(
+        title='Чужая', text=SIMILAR_TEXT, slug='foreign', author=not_author
+    )
+    assert similar_notes(note) == [close]
+    assert NoteBand.objects.filter(note=note).exists()
+    keys = set(
+        NoteBand.objects.filter(note=note).values_list('key', flat=True)
+    )
+    note.text = 'Совсем другой текст заметки'
+    note.save()
+    assert similar_notes(note) == []
+    assert keys.isdisjoint(
+        NoteBand.objects.filter(note=note).values_list('key', flat=True)
+    )
+
+
+def test_signature_of_large_text_reads_only_its_start():
+    # Несколько мегабайт разных слов после начала текста:
+    text = SIMILAR_TEXT * 1000 + ' '.join(
+        f'слово{number}' for number in range(300000)
+    )
+    assert len(text) > 30 * minhash.MAX_TEXT_LENGTH
+    started = time.perf_counter()
+    packed = minhash.signature(text)
+    assert time.perf_counter() - started < 1
+    assert packed == minhash.signature(text[:minhash.MAX_TEXT_LENGTH])
+
+
+def test_duplicate_clusters_compare_with_group_representatives(
+    author, monkeypatch
+):
+    groups = [
+        [
+            Note.objects.create(
+                title=f'Заметка {number}', text=text, author=author
+            ).pk
+            for number in range(5)
+        ]
+        for text in (SIMILAR_TEXT, 'Купить молоко, хлеб и сыр ' * 20)
+    ]
+    # Все десять заметок попадают в одну полосу:
+    NoteBand.objects.bulk_create(
+        NoteBand(note_id=note_id, author=author, key=42)
+        for group in groups for note_id in group
+    )
+    calls = []
+
+    def counted_similarity(first, second):
+        calls.append(1)
+        return minhash.similarity(first, second)
+
+    monkeypatch.setattr(similarity, 'similarity', counted_similarity)
+    assert duplicate_clusters() == groups
+    # По четыре сравнения на объединение каждой группы и по одному
+    # для заметок второй группы с представителем первой; попарно со
+    # всеми заметками полосы было бы 33.
+    assert len(calls) <= 13
+
+
+def test_find_duplicates_clusters_whole_table(author, not_author):
+    first = Note.objects.create(
+        title='Первая', text=SIMILAR_TEXT, author=author
+    )
+    second = Note.objects.create(
+        title='Вторая', text=SIMILAR_TEXT + ' заранее', author=not_author
+    )
+    Note.objects.create(
+        title='Третья', text='Купить молоко, хлеб и сыр', author=author
+    )
+    assert duplicate_clusters() == [[first.pk, second.pk]]
+    assert duplicate_clusters(author_id=author.pk) == []
+    out = StringIO()
+    call_command('find_duplicates', stdout=out)
+    assert f'{first.slug} {second.slug}' in out.getvalue()
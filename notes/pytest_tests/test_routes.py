@@ -59,7 +59,7 @@ def test_pages_availability_for_author(author_client, name, note):
 )
 @pytest.mark.parametrize(
     'name',
-    ('notes:detail', 'notes:edit', 'notes:delete'),
+    ('notes:detail', 'notes:edit', 'notes:delete', 'notes:history'),
 )
 def test_pages_availability_for_different_users(
         parametrized_client, name, slug_for_args, expected_status
@@ -75,9 +75,11 @@ def test_pages_availability_for_different_users(
         ('notes:detail', lf('slug_for_args')),
         ('notes:edit', lf('slug_for_args')),
         ('notes:delete', lf('slug_for_args')),
+        ('notes:history', lf('slug_for_args')),
         ('notes:add', None),
         ('notes:success', None),
         ('notes:list', None),
+        ('notes:export', None),
     ),
 )
 # Передаём в тест анонимный клиент, name проверяемых страниц и args:
@@ -88,3 +90,68 @@ def test_redirects(client, name, args):
     expected_url = f'{login_url}?next={url}'
     response = client.get(url)
     assertRedirects(response, expected_url)
+
+
+@pytest.mark.parametrize(
+    'name, args',
+    (
+        ('api:list', None),
+        ('api:detail', lf('slug_for_args')),
+        ('api:batch', None),
+    ),
+)
+def test_api_requires_authentication(client, name, args):
+    response = client.get(reverse(name, args=args))
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+@pytest.mark.parametrize(
+    'parametrized_client, expected_status',
+    [
+        (lf('not_author_client'), HTTPStatus.NOT_FOUND),
+        (lf('author_client'), HTTPStatus.OK)
+    ],
+)
+def test_api_detail_for_different_users(
+        parametrized_client, slug_for_args, expected_status
+):
+    response = parametrized_client.get(
+        reverse('api:detail', args=slug_for_args)
+    )
+    assert response.status_code == expected_status
+
+
+@pytest.mark.usefixtures('async_views')
+@pytest.mark.parametrize(
+    'parametrized_client, expected_status',
+    [
+        (lf('not_author_client'), HTTPStatus.NOT_FOUND),
+        (lf('author_client'), HTTPStatus.OK)
+    ],
+)
+@pytest.mark.parametrize(
+    'name',
+    ('notes:detail', 'notes:edit', 'notes:delete'),
+)
+def test_async_pages_availability_for_different_users(
+        parametrized_client, name, slug_for_args, expected_status
+):
+    url = reverse(name, args=slug_for_args)
+    response = parametrized_client.get(url)
+    assert response.status_code == expected_status
+
+
+@pytest.mark.usefixtures('async_views')
+@pytest.mark.parametrize(
+    'name, args',
+    (
+        ('notes:detail', lf('slug_for_args')),
+        ('notes:add', None),
+        ('notes:list', None),
+    ),
+)
+def test_async_redirects(client, name, args):
+    login_url = reverse('users:login')
+    url = reverse(name, args=args)
+    response = client.get(url)
+    assertRedirects(response, f'{login_url}?next={url}')
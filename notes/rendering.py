@@ -0,0 +1,113 @@
+"""Markdown в тексте заметок.
+
+HTML очищается от опасной разметки и хранится в RenderedMarkdown по
+хешу текста (Note.text_digest), поэтому текст разбирается заново
+только после изменения, а одинаковые тексты - один раз.
+"""
+from xml.etree.ElementTree import Element
+
+import markdown
+import nh3
+from django.urls import reverse
+from markdown.extensions import Extension
+from markdown.inlinepatterns import InlineProcessor
+
+from .fields import as_text
+from .links import WIKI_LINK
+from .models import Note, RenderedMarkdown
+
+EXTENSIONS = ('fenced_code', 'tables', 'sane_lists')
+
+
+class WikiLinkProcessor(InlineProcessor):
+    """[[slug]] - ссылка на страницу заметки.
+
+    HTML хранится по хешу текста и общий для всех авторов, поэтому
+    ссылка не зависит от того, существует ли заметка.
+    """
+
+    def handleMatch(self, match, data):  # noqa: N802
+        slug = match.group(1)
+        link = Element('a')
+        link.set('href', reverse('notes:detail', args=(slug,)))
+        link.text = slug
+        return link, match.start(0), match.end(0)
+
+
+class WikiLinkExtension(Extension):
+
+    def extendMarkdown(self, md):  # noqa: N802
+        # Раньше ссылок Markdown: [[slug]] похоже на [текст].
+        md.inlinePatterns.register(
+            WikiLinkProcessor(WIKI_LINK.pattern, md), 'notes_wiki_link', 175
+        )
+
+
+def render_markdown(text):
+    return nh3.clean(
+        markdown.markdown(
+            text, extensions=[*EXTENSIONS, WikiLinkExtension()]
+        ),
+        link_rel='noopener noreferrer nofollow',
+    )
+
+
+def note_html(note):
+    """HTML текста заметки: из хранилища или отрисованный сейчас."""
+    rendered = RenderedMarkdown.objects.filter(
+        digest=note.text_digest
+    ).values_list('html', flat=True).first()
+    if rendered is not None:
+        return as_text(rendered)
+    html = render_markdown(note.text)
+    RenderedMarkdown.objects.bulk_create(
+        [RenderedMarkdown(digest=note.text_digest, html=html)],
+        ignore_conflicts=True,
+    )
+    return html
+
+
+def render_digest(digest):
+    """Сохраняет HTML текста с этим хешем, если его ещё нет."""
+    if RenderedMarkdown.objects.filter(digest=digest).exists():
+        return
+    note = Note.objects.filter(text_digest=digest).only('text').first()
+    if note is None:
+        # Текст успели изменить или заметку удалили.
+        return
+    RenderedMarkdown.objects.bulk_create(
+        [RenderedMarkdown(digest=digest, html=render_markdown(note.text))],
+        ignore_conflicts=True,
+    )
+
+
+def prerender(batch_size=500):
+    """Отрисовывает тексты, для которых ещё нет HTML; возвращает их число."""
+    total = 0
+    last_id = 0
+    while True:
+        notes = list(
+            Note.objects.filter(id__gt=last_id)
+            .exclude(text_digest__in=RenderedMarkdown.objects.values('digest'))
+            .order_by('id').only('id', 'text', 'text_digest')[:batch_size]
+        )
+        if not notes:
+            return total
+        rendered = {
+            note.text_digest: RenderedMarkdown(
+                digest=note.text_digest, html=render_markdown(note.text)
+            )
+            for note in notes
+        }
+        RenderedMarkdown.objects.bulk_create(
+            rendered.values(), ignore_conflicts=True
+        )
+        total += len(rendered)
+        last_id = notes[-1].id
+
+
+def prune():
+    """Удаляет HTML текстов, которых больше нет ни в одной заметке."""
+    return RenderedMarkdown.objects.exclude(
+        digest__in=Note.objects.values('text_digest')
+    ).delete()[0]
@@ -0,0 +1,121 @@
+"""История правок заметок в виде обратных дельт.
+
+Текущая версия хранится целиком в Note.text, а каждая ревизия - сжатая
+дельта, собирающая её версию из следующей, более новой. Каждая
+SNAPSHOT_INTERVAL-я ревизия хранит сжатый полный текст, поэтому для
+восстановления любой версии нужно не больше SNAPSHOT_INTERVAL дельт.
+"""
+import json
+import zlib
+from difflib import SequenceMatcher
+
+from django.db import transaction
+from django.db.models import Max
+
+SNAPSHOT_INTERVAL = 20
+COMPRESSION_LEVEL = 6
+
+
+def make_delta(new, old):
+    """Операции, собирающие old из строк new.
+
+    Пара [начало, конец] - копия строк new, строка - вставка.
+    """
+    new_lines = new.splitlines(keepends=True)
+    old_lines = old.splitlines(keepends=True)
+    operations = []
+    matcher = SequenceMatcher(None, new_lines, old_lines)
+    for tag, start, end, old_start, old_end in matcher.get_opcodes():
+        if tag == 'equal':
+            operations.append([start, end])
+        elif old_start != old_end:
+            operations.append(''.join(old_lines[old_start:old_end]))
+    return operations
+
+
+def apply_delta(new, operations):
+    lines = new.splitlines(keepends=True)
+    return ''.join(
+        ''.join(lines[operation[0]:operation[1]])
+        if isinstance(operation, list) else operation
+        for operation in operations
+    )
+
+
+def pack(value):
+    return zlib.compress(
+        json.dumps(value, ensure_ascii=False).encode(), COMPRESSION_LEVEL
+    )
+
+
+def unpack(data):
+    return json.loads(zlib.decompress(data))
+
+
+def record_revision(note, title, text, saved):
+    """Сохраняет прежнюю версию заметки перед её текущим текстом."""
+    from .models import NoteRevision
+
+    last = note.revisions.aggregate(last=Max('number'))['last'] or 0
+    number = last + 1
+    is_snapshot = number % SNAPSHOT_INTERVAL == 0
+    return NoteRevision.objects.create(
+        note=note,
+        number=number,
+        title=title,
+        data=pack(text if is_snapshot else make_delta(note.text, text)),
+        is_snapshot=is_snapshot,
+        created=saved,
+    )
+
+
+def revision_text(note, number):
+    """Текст версии number: от ближайшего более нового снимка назад."""
+    revisions = note.revisions.filter(number__gte=number)
+    snapshot = revisions.filter(is_snapshot=True).order_by(
+        'number'
+    ).values_list('number', flat=True).first()
+    if snapshot is not None:
+        revisions = revisions.filter(number__lte=snapshot)
+    text = note.text
+    for is_snapshot, data in revisions.order_by('-number').values_list(
+        'is_snapshot', 'data'
+    ):
+        value = unpack(data)
+        text = value if is_snapshot else apply_delta(text, value)
+    return text
+
+
+def restore_revision(note, revision):
+    """Возвращает заметке версию revision; текущая уходит в историю."""
+    note.title = revision.title
+    note.text = revision_text(note, revision.number)
+    note.save()
+    return note
+
+
+def compact_revisions(note, keep):
+    """Сливает ревизии старше keep последних в одну, самую старую.
+
+    Возвращает число удалённых ревизий.
+    """
+    revisions = list(
+        note.revisions.order_by('-number').only('number', 'is_snapshot')
+    )
+    older = revisions[keep:]
+    if len(older) < 2:
+        return 0
+    oldest = older[-1]
+    base = (
+        revision_text(note, revisions[keep - 1].number) if keep
+        else note.text
+    )
+    oldest_text = revision_text(note, oldest.number)
+    with transaction.atomic():
+        note.revisions.filter(
+            pk__in=[revision.pk for revision in older[:-1]]
+        ).delete()
+        note.revisions.filter(pk=oldest.pk).update(
+            data=pack(make_delta(base, oldest_text)), is_snapshot=False
+        )
+    return len(older) - 1
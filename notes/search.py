@@ -0,0 +1,163 @@
+"""Полнотекстовый поиск заметок по индексу FTS5 (только SQLite).
+
+Индекс contentless (content=''): хранит только словарь и позиции, а не
+копию заголовков и текстов, поэтому сжатие notes_note.text уменьшает
+базу на самом деле. Без копии FTS5 не знает прежних слов заметки:
+запись удаляется командой 'delete' со значениями, которые были
+проиндексированы, - их читают из notes_note до изменения строки.
+"""
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .fields import as_text, decompress
+
+FTS_TABLE = 'notes_note_fts'
+NOTE_TABLE = 'notes_note'
+
+
+def fts_available(using=connection):
+    """Полнотекстовый индекс FTS5 есть только у SQLite."""
+    return using.vendor == 'sqlite'
+
+
+def build_match_expression(query):
+    """Превращает ввод пользователя в безопасное выражение MATCH.
+
+    Каждое слово берётся в кавычки (операторы FTS5 не срабатывают)
+    и ищется по префиксу; слова объединяются через AND.
+    """
+    terms = []
+    for word in query.split():
+        word = word.replace('"', '""')
+        terms.append(f'"{word}"*')
+    return ' '.join(terms)
+
+
+def indexed_version(note_id):
+    """(заголовок, текст) заметки в индексе или None, если её там нет.
+
+    Читать нужно до изменения строки notes_note: удаление из индекса
+    без прежних значений испортило бы его.
+    """
+    if not fts_available():
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT {NOTE_TABLE}.title, {NOTE_TABLE}.text '
+            f'FROM {NOTE_TABLE} JOIN {FTS_TABLE} '
+            f'ON {FTS_TABLE}.rowid = {NOTE_TABLE}.id '
+            f'WHERE {NOTE_TABLE}.id = %s',
+            [note_id],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    title, text = row
+    # Сжатый текст приходит из курсора как BLOB.
+    if isinstance(text, (bytes, memoryview)):
+        text = decompress(text)
+    return title, text
+
+
+def delete_from_index(cursor, note_id, version):
+    cursor.execute(
+        f'INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, title, text) '
+        "VALUES ('delete', %s, %s, %s)",
+        [note_id, *version],
+    )
+
+
+def index_note(note, previous=None):
+    """Обновляет запись заметки; previous - результат indexed_version."""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        if previous is not None:
+            if previous == (note.title, note.text):
+                return
+            delete_from_index(cursor, note.pk, previous)
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, text) '
+            'VALUES (%s, %s, %s)',
+            [note.pk, note.title, note.text],
+        )
+
+
+def index_notes(notes):
+    """Добавляет в индекс пачку новых заметок одним executemany."""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, text) '
+            'VALUES (%s, %s, %s)',
+            [(note.pk, note.title, note.text) for note in notes],
+        )
+
+
+def unindex_note(note_id):
+    """Удаляет заметку из индекса; вызывать до удаления строки."""
+    version = indexed_version(note_id)
+    if version is None:
+        return
+    with connection.cursor() as cursor:
+        delete_from_index(cursor, note_id, version)
+
+
+def search_notes(queryset, query):
+    """Фильтрует queryset по запросу и сортирует по релевантности (bm25).
+
+    Ограничения доступа остаются в переданном queryset, индекс только
+    присоединяется к нему по rowid.
+    """
+    expression = build_match_expression(query)
+    if not expression:
+        return queryset.none()
+    if not fts_available():
+        return queryset.filter(
+            Q(title__icontains=query) | Q(text__icontains=query)
+        )
+    note_table = queryset.model._meta.db_table
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = {note_table}.id',
+            f'{FTS_TABLE} MATCH %s',
+        ],
+        params=[expression],
+        select={'rank': f'bm25({FTS_TABLE})'},
+        order_by=['rank'],
+    )
+
+
+def rebuild_index(batch_size=1000):
+    """Перестраивает индекс целиком, читая заметки пачками по id.
+
+    Возвращает количество проиндексированных заметок.
+    """
+    from .models import Note
+
+    if not fts_available():
+        return 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('delete-all')"
+        )
+    total = 0
+    last_id = 0
+    while True:
+        batch = list(
+            Note.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', 'title', 'text')[:batch_size]
+        )
+        if not batch:
+            return total
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, text) '
+                'VALUES (%s, %s, %s)',
+                [(pk, title, as_text(text)) for pk, title, text in batch],
+            )
+        total += len(batch)
+        last_id = batch[-1][0]
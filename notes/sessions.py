@@ -0,0 +1,311 @@
+"""Сессии в базе с кэшем процесса перед ней.
+
+Чтение идёт из ограниченного LRU процесса. Изменения попадают в LRU
+сразу, а в базу - пачкой: фоновый поток процесса записывает их раз в
+SESSION_WRITE_BEHIND_INTERVAL секунд, даже если новых запросов нет.
+Изменения последнего интервала пропадут, если процесс будет убит
+(SIGKILL); при обычном завершении они записываются. Неизменённая
+сессия не записывается вовсе. Создание и удаление сессии пишутся в базу
+сразу: ключ должен быть уникальным, а выход из системы - надёжным.
+
+Другие процессы видят изменения сессии с задержкой не больше
+SESSION_CACHE_TTL плюс интервал записи.
+"""
+import atexit
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from threading import Event, Lock, Thread
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends import db
+from django.db import (
+    DatabaseError, close_old_connections, router, transaction,
+)
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+PURGE_BATCH_SIZE = 1000
+WRITE_BATCH_SIZE = 500
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+class SessionCache:
+    """LRU сериализованных сессий процесса с временем жизни записи."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        """(данные, срок действия) или None, если записи нет или устарела."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            payload, expire_date, cached_at = entry
+            if (
+                time.monotonic() - cached_at > setting('SESSION_CACHE_TTL', 30)
+                or expire_date <= timezone.now()
+            ):
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return payload, expire_date
+
+    def set(self, key, payload, expire_date):
+        with self.lock:
+            self.entries[key] = (payload, expire_date, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > setting('SESSION_CACHE_SIZE', 10000):
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class WriteBehind:
+    """Отложенные обновления сессий; повторные записи ключа склеиваются."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.pending = {}
+        self.flushed_at = time.monotonic()
+        self.thread = None
+        self.stopping = Event()
+
+    def enqueue(self, key, session_data, expire_date):
+        with self.lock:
+            self.pending[key] = (session_data, expire_date)
+            if self.thread is None:
+                self.thread = Thread(
+                    target=self.run, name='notes-sessions', daemon=True
+                )
+                self.thread.start()
+
+    def run(self):
+        """Фоновая запись: процесс без запросов тоже сбрасывает очередь."""
+        while not self.stopping.wait(
+            setting('SESSION_WRITE_BEHIND_INTERVAL', 5.0)
+        ):
+            try:
+                self.flush()
+            except DatabaseError:
+                # Несохранённое осталось в очереди до следующего раза.
+                pass
+            finally:
+                close_old_connections()
+
+    def discard(self, key):
+        with self.lock:
+            self.pending.pop(key, None)
+
+    def is_due(self):
+        interval = setting('SESSION_WRITE_BEHIND_INTERVAL', 5.0)
+        return bool(self.pending) and (
+            time.monotonic() - self.flushed_at >= interval
+            or len(self.pending) >= WRITE_BATCH_SIZE
+        )
+
+    def maybe_flush(self):
+        if self.is_due():
+            self.flush()
+
+    def flush(self):
+        """Пишет накопленные сессии UPDATE-ами по WRITE_BATCH_SIZE строк.
+
+        Только UPDATE: сессию, удалённую другим процессом (выход из
+        системы), отложенная запись не воскресит, а из LRU процесса
+        она удаляется.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+        if not pending:
+            return
+        model = db.SessionStore.get_model_class()
+        using = router.db_for_write(model)
+        items = list(pending.items())
+        try:
+            with transaction.atomic(using=using):
+                for start in range(0, len(items), WRITE_BATCH_SIZE):
+                    batch = items[start:start + WRITE_BATCH_SIZE]
+                    keys = [key for key, _ in batch]
+                    rows = model.objects.using(using).filter(
+                        session_key__in=keys
+                    )
+                    updated = rows.update(
+                        session_data=Case(*(
+                            When(session_key=key, then=Value(data))
+                            for key, (data, _) in batch
+                        )),
+                        expire_date=Case(*(
+                            When(session_key=key, then=Value(expire_date))
+                            for key, (_, expire_date) in batch
+                        )),
+                    )
+                    if updated < len(batch):
+                        self.forget_deleted(keys, rows)
+        except DatabaseError:
+            # Возвращаем в очередь то, что не успели перезаписать.
+            with self.lock:
+                for key, value in pending.items():
+                    self.pending.setdefault(key, value)
+            raise
+
+    def forget_deleted(self, keys, rows):
+        existing = set(rows.values_list('session_key', flat=True))
+        for key in keys:
+            if key not in existing:
+                session_cache.discard(key)
+
+
+session_cache = SessionCache()
+write_behind = WriteBehind()
+
+
+@atexit.register
+def flush_on_exit():
+    write_behind.stopping.set()
+    try:
+        write_behind.flush()
+    except DatabaseError:
+        pass
+
+
+def purge_expired(batch_size=PURGE_BATCH_SIZE):
+    """Удаляет истёкшие сессии пачками; возвращает их число.
+
+    Каждая пачка - короткая транзакция по индексу expire_date, поэтому
+    очистка не держит блокировку записи SQLite надолго.
+    """
+    model = db.SessionStore.get_model_class()
+    now = timezone.now()
+    total = 0
+    while True:
+        keys = list(
+            model.objects.filter(expire_date__lt=now)
+            .values_list('session_key', flat=True)[:batch_size]
+        )
+        if not keys:
+            return total
+        total += model.objects.filter(session_key__in=keys).delete()[0]
+
+
+class SessionStore(db.SessionStore):
+    """Сессии в базе с LRU процесса и отложенной записью изменений."""
+
+    def cached(self):
+        """Последнее известное состояние сессии: очередь записи или LRU."""
+        pending = write_behind.pending.get(self.session_key)
+        if pending is not None:
+            session_data, expire_date = pending
+            return self.serialize(self.decode(session_data)), expire_date
+        return session_cache.get(self.session_key)
+
+    def serialize(self, data):
+        return self.serializer().dumps(data)
+
+    def load_cached(self):
+        entry = self.cached()
+        if entry is None:
+            return None
+        return self.serializer().loads(entry[0])
+
+    def remember(self, session):
+        if session is None:
+            return {}
+        data = self.decode(session.session_data)
+        session_cache.set(
+            self.session_key, self.serialize(data), session.expire_date
+        )
+        return data
+
+    def load(self):
+        data = self.load_cached()
+        if data is not None:
+            return data
+        return self.remember(self._get_session_from_db())
+
+    async def aload(self):
+        data = self.load_cached()
+        if data is not None:
+            return data
+        return self.remember(await self._aget_session_from_db())
+
+    def defer_save(self, data, expire_date):
+        """Кладёт изменения в LRU и очередь; False - если их нет."""
+        payload = self.serialize(data)
+        cached = self.cached()
+        slack = timedelta(seconds=setting('SESSION_EXPIRY_SLACK', 60))
+        if (
+            cached is not None
+            and cached[0] == payload
+            and expire_date - cached[1] < slack
+        ):
+            return False
+        session_cache.set(self.session_key, payload, expire_date)
+        write_behind.enqueue(self.session_key, self.encode(data), expire_date)
+        return True
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        if must_create:
+            super().save(must_create=True)
+            session_cache.set(
+                self.session_key,
+                self.serialize(self._get_session(no_load=True)),
+                self.get_expiry_date(),
+            )
+            return
+        self.defer_save(self._get_session(), self.get_expiry_date())
+        write_behind.maybe_flush()
+
+    async def asave(self, must_create=False):
+        if self.session_key is None:
+            return await self.acreate()
+        if must_create:
+            await super().asave(must_create=True)
+            session_cache.set(
+                self.session_key,
+                self.serialize(await self._aget_session(no_load=True)),
+                await self.aget_expiry_date(),
+            )
+            return
+        self.defer_save(
+            await self._aget_session(), await self.aget_expiry_date()
+        )
+        if write_behind.is_due():
+            await sync_to_async(write_behind.flush)()
+
+    def forget(self, session_key):
+        key = session_key or self.session_key
+        if key is not None:
+            session_cache.discard(key)
+            write_behind.discard(key)
+
+    def delete(self, session_key=None):
+        self.forget(session_key)
+        super().delete(session_key)
+
+    async def adelete(self, session_key=None):
+        self.forget(session_key)
+        await super().adelete(session_key)
+
+    @classmethod
+    def clear_expired(cls):
+        purge_expired()
+
+    @classmethod
+    async def aclear_expired(cls):
+        await sync_to_async(purge_expired)()
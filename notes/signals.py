@@ -0,0 +1,183 @@
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_out
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .auth import forget_user
+from .db import apply_sqlite_pragmas
+from .events import broker, note_event
+from .fields import as_text
+from .jobs import enqueue
+from .links import update_links
+from .models import Note
+from .revisions import record_revision
+from .search import index_note, indexed_version, unindex_note
+from .similarity import update_bands
+from .summary import note_added, note_changed, note_removed
+from .tags import count_links, linked_ids, note_untagged
+from .tasks import RENDER_MARKDOWN
+
+
+@receiver(pre_save, sender=Note)
+def capture_indexed_version(sender, instance, **kwargs):
+    """Запоминает проиндексированную версию: без неё не удалить."""
+    instance.indexed_version = (
+        None if instance._state.adding else indexed_version(instance.pk)
+    )
+
+
+@receiver(post_save, sender=Note)
+def update_search_index(sender, instance, **kwargs):
+    """Переиндексирует заметку после сохранения."""
+    index_note(instance, getattr(instance, 'indexed_version', None))
+
+
+@receiver(pre_save, sender=Note)
+def capture_previous_version(sender, instance, using, **kwargs):
+    """Запоминает версию заметки в базе до сохранения.
+
+    Копия в памяти могла устареть (правка из другого запроса), поэтому
+    версия читается из базы. Note.save идёт в транзакции: в SQLite она
+    сразу берёт блокировку записи (transaction_mode IMMEDIATE), в
+    остальных базах строку блокирует SELECT ... FOR UPDATE.
+    """
+    instance.previous_version = None
+    if instance._state.adding:
+        return
+    notes = sender.objects.using(using)
+    if connections[using].features.has_select_for_update:
+        notes = notes.select_for_update()
+    instance.previous_version = notes.filter(pk=instance.pk).values_list(
+        'title', 'text', 'updated'
+    ).first()
+
+
+@receiver(post_save, sender=Note)
+def save_revision(sender, instance, created, **kwargs):
+    """Кладёт прежнюю версию в историю, если заметка изменилась."""
+    previous = getattr(instance, 'previous_version', None)
+    if previous is not None:
+        title, text, saved = previous
+        text = as_text(text)
+        if (title, text) != (instance.title, instance.text):
+            record_revision(instance, title, text, saved)
+
+
+@receiver(post_save, sender=Note)
+def schedule_markdown(sender, instance, **kwargs):
+    """Ставит отрисовку текста в фоновую очередь - один раз на текст."""
+    enqueue(
+        RENDER_MARKDOWN, instance.text_digest,
+        key=f'markdown:{instance.text_digest}',
+    )
+
+
+def text_changed(instance, created):
+    """Изменился ли текст при этом сохранении."""
+    previous = getattr(instance, 'previous_version', None)
+    return (
+        created or previous is None
+        or as_text(previous[1]) != instance.text
+    )
+
+
+@receiver(post_save, sender=Note)
+def update_note_links(sender, instance, created, **kwargs):
+    """Обновляет ссылки [[slug]] заметки, если изменился текст."""
+    if text_changed(instance, created):
+        update_links(instance, created)
+
+
+@receiver(post_save, sender=Note)
+def update_note_bands(sender, instance, created, **kwargs):
+    """Обновляет ключи полос LSH, если изменился текст."""
+    if text_changed(instance, created):
+        update_bands(instance, created)
+
+
+@receiver(pre_delete, sender=Note)
+def remove_from_search_index(sender, instance, **kwargs):
+    """Убирает заметку из индекса, пока её строка ещё в базе."""
+    unindex_note(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Убирает пользователя из кэша после изменения или удаления."""
+    forget_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, user, **kwargs):
+    """Убирает пользователя из кэша при выходе из системы."""
+    if user is not None:
+        forget_user(user.pk)
+
+
+@receiver(post_save, sender=Note)
+def update_summary(sender, instance, created, **kwargs):
+    """Обновляет сводку автора: число заметок и время изменения."""
+    if created:
+        note_added(instance.author_id, instance.updated)
+    else:
+        note_changed(instance.author_id, instance.updated)
+
+
+@receiver(post_delete, sender=Note)
+def update_summary_on_delete(sender, instance, **kwargs):
+    """Уменьшает число заметок автора."""
+    note_removed(instance.author_id)
+
+
+@receiver(m2m_changed, sender=Note.tags.through)
+def update_tag_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    """Меняет число заметок у добавленных и снятых меток."""
+    if action in ('pre_remove', 'pre_clear'):
+        # Снимать можно и отсутствующие связи - считаем только те,
+        # что есть в базе.
+        instance.removed_links = linked_ids(instance, reverse, pk_set)
+        return
+    if action == 'post_add':
+        count_links(instance, reverse, pk_set, 1)
+    elif action in ('post_remove', 'post_clear'):
+        count_links(instance, reverse, instance.removed_links, -1)
+    else:
+        return
+    # Метки видны в списке: сводка - его валидаторы и ключи фрагментов.
+    note_changed(instance.author_id, timezone.now())
+
+
+@receiver(pre_delete, sender=Note)
+def update_tag_counts_on_delete(sender, instance, **kwargs):
+    """Уменьшает число заметок у меток удаляемой заметки."""
+    note_untagged(instance)
+
+
+@receiver(post_save, sender=Note)
+def publish_note_saved(sender, instance, created, **kwargs):
+    """Сообщает открытым потокам автора о новой или изменённой заметке."""
+    event = note_event('create' if created else 'update', instance)
+    transaction.on_commit(
+        lambda: broker.publish(instance.author_id, event)
+    )
+
+
+@receiver(post_delete, sender=Note)
+def publish_note_deleted(sender, instance, **kwargs):
+    """Сообщает открытым потокам автора об удалении заметки."""
+    event = note_event('delete', instance)
+    transaction.on_commit(
+        lambda: broker.publish(instance.author_id, event)
+    )
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    """Настраивает каждое новое соединение с базой."""
+    apply_sqlite_pragmas(connection)
@@ -0,0 +1,140 @@
+"""Похожие заметки по MinHash-подписям и индексу полос LSH.
+
+Подпись (Note.signature) считается при сохранении, ключи её полос
+хранятся в NoteBand. Кандидаты в похожие - заметки автора, у которых
+совпал хотя бы один ключ: выборка по индексу (author, key), а не
+перебор всех заметок. Кандидаты проверяются оценкой сходства по
+подписям.
+"""
+from django.conf import settings
+from django.db.models import Count
+
+from .minhash import band_keys, similarity
+from .models import Note, NoteBand
+
+DEFAULT_THRESHOLD = 0.5
+SIMILAR_LIMIT = 5
+
+
+def threshold():
+    return getattr(
+        settings, 'NOTES_SIMILARITY_THRESHOLD', DEFAULT_THRESHOLD
+    )
+
+
+def note_bands(note):
+    if note.signature is None:
+        return []
+    return [
+        NoteBand(note=note, author_id=note.author_id, key=key)
+        for key in set(band_keys(note.signature))
+    ]
+
+
+def update_bands(note, created=False):
+    """Заменяет ключи полос заметки после изменения текста."""
+    if not created:
+        NoteBand.objects.filter(note=note).delete()
+    NoteBand.objects.bulk_create(note_bands(note))
+
+
+def band_notes(notes):
+    """Ключи полос пачки новых заметок одним INSERT (для bulk_create)."""
+    NoteBand.objects.bulk_create(
+        band for note in notes for band in note_bands(note)
+    )
+
+
+def candidates(note):
+    return Note.objects.filter(
+        pk__in=NoteBand.objects.filter(
+            author_id=note.author_id, key__in=band_keys(note.signature)
+        ).exclude(note_id=note.pk).values('note_id')
+    ).only('slug', 'title', 'signature')
+
+
+def rank(note, notes, limit):
+    minimum = threshold()
+    scored = [
+        (similarity(note.signature, other.signature), other)
+        for other in notes
+    ]
+    scored = [(score, other) for score, other in scored if score >= minimum]
+    scored.sort(key=lambda item: -item[0])
+    return [other for _, other in scored[:limit]]
+
+
+def similar_notes(note, limit=SIMILAR_LIMIT):
+    """Самые похожие заметки того же автора, не больше limit."""
+    if note.signature is None:
+        return []
+    return rank(note, candidates(note), limit)
+
+
+class Clusters:
+    """Система непересекающихся множеств для групп дубликатов."""
+
+    def __init__(self):
+        self.parents = {}
+
+    def find(self, item):
+        root = item
+        while self.parents.setdefault(root, root) != root:
+            root = self.parents[root]
+        # Сжатие пути: следующие поиски сразу находят корень.
+        while item != root:
+            self.parents[item], item = root, self.parents[item]
+        return root
+
+    def union(self, first, second):
+        self.parents[self.find(first)] = self.find(second)
+
+    def groups(self):
+        groups = {}
+        for item in self.parents:
+            groups.setdefault(self.find(item), []).append(item)
+        return sorted(
+            sorted(group) for group in groups.values() if len(group) > 1
+        )
+
+
+def duplicate_clusters(min_similarity=None, author_id=None):
+    """Группы id похожих заметок по всей таблице.
+
+    Сравниваются только заметки с общим ключом полосы, причём новая
+    заметка сравнивается не с каждой заметкой полосы, а с одним
+    представителем каждой уже найденной в полосе группы. Группа
+    объединяет заметки, связанные цепочкой пар со сходством не ниже
+    порога. Авторов не различает, если не задан author_id.
+    """
+    if min_similarity is None:
+        min_similarity = threshold()
+    bands = NoteBand.objects.all()
+    if author_id is not None:
+        bands = bands.filter(author_id=author_id)
+    shared = bands.values('key').annotate(
+        notes=Count('id')
+    ).filter(notes__gt=1).values('key')
+    rows = bands.filter(key__in=shared).order_by(
+        'key', 'note_id'
+    ).values_list('key', 'note_id', 'note__signature')
+    clusters = Clusters()
+    # Представители групп текущей полосы: первая заметка каждой группы.
+    representatives, bucket_key = [], None
+    for key, note_id, packed in rows.iterator():
+        if key != bucket_key:
+            representatives, bucket_key = [], key
+        compared = {clusters.find(note_id)}
+        for other_id, other in representatives:
+            # Группы могли слиться: с каждой сравниваем один раз.
+            root = clusters.find(other_id)
+            if root in compared:
+                continue
+            compared.add(root)
+            if similarity(other, packed) >= min_similarity:
+                clusters.union(other_id, note_id)
+        if clusters.find(note_id) not in {
+            clusters.find(other_id) for other_id, _ in representatives
+        }:
+            representatives.append((note_id, packed))
+    return clusters.groups()
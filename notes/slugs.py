@@ -0,0 +1,120 @@
+from django.db import IntegrityError, transaction
+from pytils.translit import slugify
+
+# Сколько символов оставлять под числовой суффикс вида "-123".
+SUFFIX_RESERVE = 8
+# Сколько раз подбирать slug заново, если его успели занять.
+SLUG_ATTEMPTS = 5
+DEFAULT_SLUG = 'note'
+
+
+def slug_max_length():
+    from .models import Note
+
+    return Note._meta.get_field('slug').max_length
+
+
+def base_slug(note):
+    """Желаемый slug заметки: заданный вручную или из заголовка."""
+    max_length = slug_max_length()
+    slug = note.slug or slugify(note.title)[:max_length]
+    return slug or DEFAULT_SLUG
+
+
+def with_suffix(base, number):
+    """Добавляет к slug числовой суффикс, укорачивая основу при нужде."""
+    if number < 2:
+        return base
+    suffix = f'-{number}'
+    return base[:slug_max_length() - len(suffix)] + suffix
+
+
+def variants_range(base):
+    """Границы [lower, upper), в которые попадают base и все base-N.
+
+    Slug состоит из [-a-zA-Z0-9_], а '.' идёт в ASCII сразу за '-',
+    поэтому для короткой основы диапазон содержит только её варианты.
+    Длинная основа при добавлении суффикса укорачивается, и тогда
+    берётся общий префикс.
+    """
+    prefix_length = slug_max_length() - SUFFIX_RESERVE
+    if len(base) <= prefix_length:
+        return base, base + '.'
+    prefix = base[:prefix_length]
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def taken_slugs(base, exclude_pk=None):
+    """Занятые варианты base - один запрос по индексу slug.
+
+    Префикс выражен диапазоном, а не LIKE: SQLite не использует индекс
+    для LIKE с ESCAPE, который генерирует startswith.
+    """
+    from .models import Note
+
+    lower, upper = variants_range(base)
+    queryset = Note.objects.filter(slug__gte=lower, slug__lt=upper)
+    if exclude_pk is not None:
+        queryset = queryset.exclude(pk=exclude_pk)
+    return set(queryset.values_list('slug', flat=True))
+
+
+def first_free(base, taken):
+    """Первый slug вида base, base-2, base-3, ... не входящий в taken."""
+    number = 1
+    while True:
+        slug = with_suffix(base, number)
+        if slug not in taken:
+            return slug
+        number += 1
+
+
+def allocate_slug(note):
+    """Уникальный slug для одной заметки."""
+    base = base_slug(note)
+    return first_free(base, taken_slugs(base, exclude_pk=note.pk))
+
+
+def allocate_slugs(notes):
+    """Назначает уникальные slug сразу пачке несохранённых заметок.
+
+    Сначала одним запросом проверяются точные совпадения; запрос
+    по диапазону вариантов делается только для основ, которые уже
+    заняты в базе или внутри пачки.
+    """
+    from .models import Note
+
+    bases = [base_slug(note) for note in notes]
+    taken = set(
+        Note.objects.filter(slug__in=set(bases))
+        .values_list('slug', flat=True)
+    )
+    scanned = set()
+    for note, base in zip(notes, bases):
+        if base in taken and base not in scanned:
+            taken |= taken_slugs(base)
+            scanned.add(base)
+        note.slug = first_free(base, taken)
+        taken.add(note.slug)
+    return notes
+
+
+def bulk_create_with_slugs(notes):
+    """bulk_create с подбором slug; при гонке пачка подбирается заново.
+
+    Проверки заранее не делается: конфликт ловит уникальный индекс,
+    а пачка откатывается до точки сохранения.
+    """
+    from .models import Note
+
+    requested = [note.slug for note in notes]
+    for attempt in range(1, SLUG_ATTEMPTS + 1):
+        allocate_slugs(notes)
+        try:
+            with transaction.atomic():
+                return Note.objects.bulk_create(notes)
+        except IntegrityError:
+            if attempt == SLUG_ATTEMPTS:
+                raise
+            for note, slug in zip(notes, requested):
+                note.slug = slug
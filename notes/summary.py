@@ -0,0 +1,54 @@
+"""Сводка по заметкам автора, поддерживаемая инкрементально.
+
+Сигналы вызывают note_added, note_changed и note_removed; массовые
+вставки (импорт, bulk_create) вызывают note_added сами.
+"""
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from .models import Note, NoteSummary
+
+
+def refresh_summary(author_id):
+    """Пересчитывает сводку автора по таблице заметок."""
+    state = Note.objects.filter(author_id=author_id).aggregate(
+        note_count=Count('id'), last_modified=Max('updated')
+    )
+    NoteSummary.objects.update_or_create(author_id=author_id, defaults=state)
+
+
+def note_added(author_id, modified, count=1):
+    updated = NoteSummary.objects.filter(author_id=author_id).update(
+        note_count=F('note_count') + count, last_modified=modified
+    )
+    if not updated:
+        refresh_summary(author_id)
+
+
+def note_changed(author_id, modified):
+    updated = NoteSummary.objects.filter(author_id=author_id).update(
+        last_modified=modified
+    )
+    if not updated:
+        refresh_summary(author_id)
+
+
+def note_removed(author_id):
+    # Удаление не двигает MAX(updated), поэтому время берётся текущее.
+    # Строки нет, если удаляется сам автор: тогда обновлять нечего.
+    NoteSummary.objects.filter(author_id=author_id).update(
+        note_count=F('note_count') - 1, last_modified=timezone.now()
+    )
+
+
+def get_summary(author_id):
+    """(число заметок, время последнего изменения) одним запросом по PK."""
+    return NoteSummary.objects.filter(author_id=author_id).values_list(
+        'note_count', 'last_modified'
+    ).first() or (0, None)
+
+
+async def aget_summary(author_id):
+    return await NoteSummary.objects.filter(author_id=author_id).values_list(
+        'note_count', 'last_modified'
+    ).afirst() or (0, None)
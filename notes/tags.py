@@ -0,0 +1,112 @@
+"""Метки заметок и число заметок с каждой меткой.
+
+Число хранится в Tag.note_count и меняется при добавлении и снятии
+метки (сигнал m2m_changed) и при удалении заметки, поэтому список
+меток автора не считает GROUP BY по связям.
+"""
+import re
+
+from django.db.models import F, Prefetch
+
+from .models import NoteTag, Tag
+
+MAX_TAGS = 20
+SEPARATORS = re.compile(r'[\s,]+')
+
+
+def parse_tags(value):
+    """Названия меток из строки через пробел или запятую, без повторов."""
+    names = []
+    for name in SEPARATORS.split(value.lower()):
+        name = name.lstrip('#')
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def prefetch_tags():
+    """Метки страницы заметок одним запросом вместо запроса на заметку."""
+    return Prefetch('tags', queryset=Tag.objects.only('id', 'name'))
+
+
+def author_tags(author_id):
+    """Метки автора, у которых есть заметки, с их числом."""
+    return Tag.objects.filter(author_id=author_id, note_count__gt=0)
+
+
+def missing_tags(author_id, names, existing):
+    known = {tag.name for tag in existing}
+    return [
+        Tag(author_id=author_id, name=name)
+        for name in names if name not in known
+    ]
+
+
+def get_tags(author_id, names):
+    """Метки автора с этими названиями; недостающие создаются."""
+    if not names:
+        return []
+    tags = Tag.objects.filter(author_id=author_id, name__in=names)
+    missing = missing_tags(author_id, names, tags)
+    if missing:
+        # Метку могли создать параллельно - конфликт не ошибка.
+        Tag.objects.bulk_create(missing, ignore_conflicts=True)
+        tags = tags.all()
+    return list(tags)
+
+
+async def aget_tags(author_id, names):
+    if not names:
+        return []
+    tags = Tag.objects.filter(author_id=author_id, name__in=names)
+    missing = missing_tags(author_id, names, [tag async for tag in tags])
+    if missing:
+        await Tag.objects.abulk_create(missing, ignore_conflicts=True)
+        tags = tags.all()
+    return [tag async for tag in tags]
+
+
+def set_tags(note, names):
+    note.tags.set(get_tags(note.author_id, names))
+
+
+async def aset_tags(note, names):
+    await note.tags.aset(await aget_tags(note.author_id, names))
+
+
+def tag_string(note):
+    return ' '.join(note.tags.values_list('name', flat=True))
+
+
+async def atag_string(note):
+    return ' '.join(
+        [name async for name in note.tags.values_list('name', flat=True)]
+    )
+
+
+def linked_ids(instance, reverse, pk_set):
+    """Ключи другой стороны существующих связей instance (из pk_set)."""
+    if reverse:
+        links, column = NoteTag.objects.filter(tag=instance), 'note_id'
+    else:
+        links, column = NoteTag.objects.filter(note=instance), 'tag_id'
+    if pk_set is not None:
+        links = links.filter(**{f'{column}__in': pk_set})
+    return set(links.values_list(column, flat=True))
+
+
+def count_links(instance, reverse, pk_set, delta):
+    """Меняет число заметок у меток на delta за каждую связь."""
+    if not pk_set:
+        return
+    if reverse:
+        tags = Tag.objects.filter(pk=instance.pk)
+        delta *= len(pk_set)
+    else:
+        tags = Tag.objects.filter(pk__in=pk_set)
+    tags.update(note_count=F('note_count') + delta)
+
+
+def note_untagged(note):
+    """Снимает заметку со счёта её меток перед удалением заметки."""
+    Tag.objects.filter(notes=note).update(note_count=F('note_count') - 1)
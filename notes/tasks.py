@@ -0,0 +1,11 @@
+"""Фоновые задачи заметок; регистрируются при загрузке приложения."""
+from .jobs import task
+from .rendering import render_digest
+
+RENDER_MARKDOWN = 'notes.render_markdown'
+
+
+@task(RENDER_MARKDOWN)
+def render_markdown(digest):
+    """Отрисовывает Markdown нового текста до первого просмотра."""
+    render_digest(digest)
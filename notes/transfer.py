@@ -0,0 +1,65 @@
+import csv
+import json
+import sys
+from contextlib import contextmanager
+from itertools import islice
+
+FIELDS = ('title', 'text', 'slug', 'author')
+FORMATS = ('jsonl', 'csv')
+
+
+def detect_format(path, fmt=None):
+    """Формат файла: явно заданный или по расширению."""
+    if fmt:
+        return fmt
+    if str(path).endswith('.csv'):
+        return 'csv'
+    return 'jsonl'
+
+
+@contextmanager
+def open_stream(path, mode):
+    """Открывает файл или stdin/stdout, если путь равен '-'."""
+    if path == '-':
+        yield sys.stdin if mode == 'r' else sys.stdout
+        return
+    with open(path, mode, encoding='utf-8', newline='') as stream:
+        yield stream
+
+
+def read_rows(stream, fmt):
+    """Лениво читает записи из потока, по одной строке за раз."""
+    if fmt == 'csv':
+        # Тексты заметок бывают больше стандартного лимита поля.
+        csv.field_size_limit(sys.maxsize)
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def write_rows(stream, rows, fmt):
+    """Пишет кортежи в порядке FIELDS, не накапливая их в памяти."""
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(FIELDS)
+        for row in rows:
+            writer.writerow(row)
+            yield row
+        return
+    for row in rows:
+        stream.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False))
+        stream.write('\n')
+        yield row
+
+
+def batched(iterable, size):
+    """Разбивает поток на списки длины size."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def throughput(rows, seconds):
+    return rows / seconds if seconds else float(rows)
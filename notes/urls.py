@@ -1,15 +1,30 @@
+from django.conf import settings
 from django.urls import path
 
-from notes import views
+from notes import async_views, events, views
 
 app_name = 'notes'
 
+# CRUD-представления: синхронные или нативно асинхронные для ASGI.
+crud = async_views if settings.NOTES_ASYNC_VIEWS else views
+
 urlpatterns = [
     path('', views.Home.as_view(), name='home'),
-    path('add/', views.NoteCreate.as_view(), name='add'),
-    path('edit/<slug:slug>/', views.NoteUpdate.as_view(), name='edit'),
-    path('note/<slug:slug>/', views.NoteDetail.as_view(), name='detail'),
-    path('delete/<slug:slug>/', views.NoteDelete.as_view(), name='delete'),
-    path('notes/', views.NotesList.as_view(), name='list'),
+    path('add/', crud.NoteCreate.as_view(), name='add'),
+    path('edit/<slug:slug>/', crud.NoteUpdate.as_view(), name='edit'),
+    path('note/<slug:slug>/', crud.NoteDetail.as_view(), name='detail'),
+    path('delete/<slug:slug>/', crud.NoteDelete.as_view(), name='delete'),
+    path('notes/', crud.NotesList.as_view(), name='list'),
+    path(
+        'history/<slug:slug>/', views.NoteHistory.as_view(), name='history'
+    ),
+    path(
+        'history/<slug:slug>/<int:number>/',
+        views.NoteRevisionDetail.as_view(),
+        name='revision',
+    ),
+    path('export/', views.NoteExport.as_view(), name='export'),
+    path('search/', views.NoteSearch.as_view(), name='search'),
+    path('events/', events.note_events, name='events'),
     path('done/', views.NoteSuccess.as_view(), name='success'),
 ]
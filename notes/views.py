@@ -1,9 +1,32 @@
+import hashlib
+from functools import partial
+
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponseRedirect, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.shortcuts import get_object_or_404
+from django.urls import reverse, reverse_lazy
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, quote_etag
+)
+from django.utils.http import http_date
 from django.views import generic
 
-from .forms import NoteForm
-from .models import Note
+from .cache import notes_version
+from .db import ReadDatabaseMixin
+from .export import astream_zip, stream_zip
+from .forms import WARNING, NoteForm
+from .links import backlinks
+from .models import Note, Tag
+from .pagination import keyset_paginate, parse_cursor
+from .rendering import note_html
+from .revisions import restore_revision, revision_text
+from .search import search_notes
+from .similarity import similar_notes
+from .summary import get_summary
+from .tags import author_tags, prefetch_tags
 
 
 class Home(generic.TemplateView):
@@ -26,19 +49,94 @@ class NoteBase(LoginRequiredMixin):
         return self.model.objects.filter(author=self.request.user)
 
 
-class NoteCreate(NoteBase, generic.CreateView):
+class FragmentCacheMixin:
+    """Передаёт в шаблон версию заметок для ключей {% cache %}.
+
+    Сводку автора (self.summary) читает get_validators.
+    """
+    fragment_cache_timeout = 600
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['notes_version'] = notes_version(self.summary)
+        context['fragment_cache_timeout'] = self.fragment_cache_timeout
+        return context
+
+
+class ConditionalGetMixin:
+    """Отвечает 304 на If-None-Match/If-Modified-Since без отрисовки."""
+
+    def get_validators(self):
+        """Возвращает пару (части ETag, время изменения) или None."""
+        raise NotImplementedError
+
+    def make_etag(self, *parts):
+        # Страница зависит от пользователя и CSRF-секрета: get_token
+        # заводит секрет, если его ещё нет, до первой отрисовки.
+        get_token(self.request)
+        parts = (
+            self.request.user.pk,
+            self.request.META['CSRF_COOKIE'],
+            *parts,
+        )
+        digest = hashlib.md5(
+            ':'.join(map(str, parts)).encode(), usedforsecurity=False
+        )
+        return quote_etag(digest.hexdigest())
+
+    def check_conditions(self, validators):
+        """Возвращает ETag, время изменения и ответ 304 или None."""
+        etag_parts, last_modified = validators
+        etag = self.make_etag(*etag_parts)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=timestamp
+        )
+        return etag, timestamp, response
+
+    def set_validators(self, response, etag, timestamp):
+        response.headers.setdefault('ETag', etag)
+        if timestamp:
+            response.headers.setdefault('Last-Modified', http_date(timestamp))
+        # Браузер должен каждый раз проверять актуальность страницы.
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators()
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+        etag, timestamp, response = self.check_conditions(validators)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return self.set_validators(response, etag, timestamp)
+
+
+class SlugConflictMixin:
+    """Заданный вручную slug могли занять уже после проверки формы."""
+
+    def form_valid(self, form):
+        try:
+            with transaction.atomic():
+                return super().form_valid(form)
+        except IntegrityError:
+            if not form.slug_taken():
+                raise
+            form.add_error('slug', form.cleaned_data['slug'] + WARNING)
+            return self.form_invalid(form)
+
+
+class NoteCreate(NoteBase, SlugConflictMixin, generic.CreateView):
     """Добавление заметки."""
     template_name = 'notes/form.html'
     form_class = NoteForm
 
     def form_valid(self, form):
-        new_note = form.save(commit=False)
-        new_note.author = self.request.user
-        new_note.save()
+        form.instance.author = self.request.user
         return super().form_valid(form)
 
 
-class NoteUpdate(NoteBase, generic.UpdateView):
+class NoteUpdate(NoteBase, SlugConflictMixin, generic.UpdateView):
     """Редактирование заметки."""
     template_name = 'notes/form.html'
     form_class = NoteForm
@@ -49,11 +147,170 @@ class NoteDelete(NoteBase, generic.DeleteView):
     template_name = 'notes/delete.html'
 
 
-class NotesList(NoteBase, generic.ListView):
+class NotesList(
+    ReadDatabaseMixin, NoteBase, ConditionalGetMixin, FragmentCacheMixin,
+    generic.ListView,
+):
     """Список всех заметок пользователя."""
     template_name = 'notes/list.html'
+    paginate_by = 50
+    cursor_kwarg = 'after'
+    tag_kwarg = 'tag'
+    # Списку хватает этих колонок; text не читается.
+    list_fields = ('id', 'slug', 'title', 'preview')
+
+    def get_tag(self):
+        """Метка из ?tag= или None; чужая или неизвестная метка - 404."""
+        name = self.request.GET.get(self.tag_kwarg)
+        if not name:
+            return None
+        tag = Tag.objects.filter(author=self.request.user, name=name).first()
+        if tag is None:
+            raise Http404('Метка не найдена.')
+        return tag
+
+    def get_queryset(self):
+        queryset = super().get_queryset().only(
+            *self.list_fields
+        ).prefetch_related(prefetch_tags())
+        self.tag = self.get_tag()
+        if self.tag is not None:
+            # Заметки метки по индексу (tag, note) в порядке id.
+            queryset = queryset.filter(tags=self.tag)
+        return queryset
+
+    def paginate_queryset(self, queryset, page_size):
+        """Постраничный вывод по курсору (author, id) вместо OFFSET."""
+        cursor = parse_cursor(self.request.GET.get(self.cursor_kwarg))
+        page = keyset_paginate(queryset, cursor, page_size)
+        return None, page, page.object_list, page.has_next()
+
+    def get_validators(self):
+        """Валидаторы из сводки автора - одна строка по первичному ключу.
+
+        Время в сводке сдвигается и при удалении заметки, поэтому его
+        можно отдавать как Last-Modified.
+        """
+        self.summary = get_summary(self.request.user.pk)
+        cursor = self.request.GET.get(self.cursor_kwarg, '')
+        tag = self.request.GET.get(self.tag_kwarg, '')
+        return (*self.summary, tag, cursor), self.summary[1]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['tag'] = self.tag
+        context['tags'] = author_tags(self.request.user.pk)
+        context['note_count'] = (
+            self.summary[0] if self.tag is None else self.tag.note_count
+        )
+        return context
 
 
-class NoteDetail(NoteBase, generic.DetailView):
+def detail_validators(state, summary):
+    """Валидаторы страницы заметки по её (pk, updated) и сводке автора.
+
+    Обратные ссылки и похожие заметки меняются вместе с другими
+    заметками автора - каждое такое изменение двигает его сводку.
+    """
+    return (state, summary), max(state[1], summary[1] or state[1])
+
+
+class NoteDetail(
+    ReadDatabaseMixin, NoteBase, ConditionalGetMixin, FragmentCacheMixin,
+    generic.DetailView,
+):
     """Заметка подробно."""
     template_name = 'notes/detail.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Шаблон вызовет функцию только при промахе кэша фрагментов.
+        context['note_html'] = partial(note_html, self.object)
+        context['note_tags'] = self.object.tags.all()
+        context['backlinks'] = backlinks(self.object)
+        context['similar_notes'] = partial(similar_notes, self.object)
+        return context
+
+    def get_validators(self):
+        state = self.get_queryset().filter(
+            slug=self.kwargs['slug']
+        ).values_list('pk', 'updated').first()
+        if state is None:
+            return None
+        self.summary = get_summary(self.request.user.pk)
+        return detail_validators(state, self.summary)
+
+
+class NoteHistory(NoteBase, generic.DetailView):
+    """История правок заметки."""
+    template_name = 'notes/history.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Сжатые данные для списка не нужны.
+        context['revisions'] = self.object.revisions.order_by(
+            '-number'
+        ).defer('data')
+        return context
+
+
+class NoteRevisionDetail(NoteBase, generic.DetailView):
+    """Прошлая версия заметки; POST восстанавливает её."""
+    template_name = 'notes/revision.html'
+
+    def get_revision(self):
+        return get_object_or_404(
+            self.object.revisions.defer('data'), number=self.kwargs['number']
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        revision = context['revision'] = self.get_revision()
+        context['text'] = revision_text(self.object, revision.number)
+        return context
+
+    def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        restore_revision(self.object, self.get_revision())
+        return HttpResponseRedirect(
+            reverse('notes:detail', args=(self.object.slug,))
+        )
+
+
+class NoteSearch(NoteBase, generic.ListView):
+    """Полнотекстовый поиск по заметкам пользователя."""
+    template_name = 'notes/search.html'
+    paginate_by = 50
+    query_kwarg = 'q'
+
+    def get_query(self):
+        return self.request.GET.get(self.query_kwarg, '').strip()
+
+    def get_queryset(self):
+        return search_notes(super().get_queryset(), self.get_query())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.get_query()
+        return context
+
+
+class NoteExport(NoteBase, generic.View):
+    """Скачивание всех заметок пользователя ZIP-архивом Markdown-файлов."""
+
+    def get(self, request):
+        notes = self.get_queryset().order_by('id').only(
+            'title', 'text', 'slug'
+        )
+        # Под ASGI синхронный генератор был бы собран в память целиком.
+        if isinstance(request, ASGIRequest):
+            content = astream_zip(notes)
+        else:
+            content = stream_zip(notes)
+        return StreamingHttpResponse(
+            content,
+            content_type='application/zip',
+            headers={
+                'Content-Disposition': 'attachment; filename="notes.zip"',
+            },
+        )
@@ -14,3 +14,15 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yanote.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.PAGE_CACHE_WARM_UP:
+    from notes.page_cache import start_warm_up  # noqa: E402
+
+    start_warm_up()
+
+if settings.JOBS_RUN_IN_APP:
+    from notes.jobs import start_worker  # noqa: E402
+
+    start_worker()
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 from django.urls import reverse_lazy
@@ -22,11 +23,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'notes.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'notes.middleware.PageCacheMiddleware',
+    'notes.middleware.CachedAuthenticationMiddleware',
+    'notes.middleware.AdmissionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -35,10 +39,17 @@ ROOT_URLCONF = 'yanote.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени отрисовки для /metrics.
+        'BACKEND': 'notes.metrics.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Скомпилированные шаблоны переиспользуются между запросами.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -59,6 +70,89 @@ DATABASES = {
     }
 }
 
+# Профиль базы: 'default' или 'production' (WAL, PRAGMA, постоянные
+# соединения). PRAGMA применяются к каждому соединению в notes.signals.
+DATABASE_PROFILE = os.getenv('YANOTE_DB_PROFILE', 'default')
+
+SQLITE_PRAGMAS = {}
+
+if DATABASE_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Ожидание блокировки на уровне драйвера, в секундах.
+            'timeout': 20,
+            # Транзакция сразу берёт блокировку записи, а не повышает её
+            # посреди работы, - это и давало "database is locked".
+            'transaction_mode': 'IMMEDIATE',
+        },
+    })
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 20000,
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    }
+    # Сессии читаются из памяти процесса, а пишутся в базу пачками.
+    SESSION_ENGINE = 'notes.sessions'
+    # Отдельное соединение или файл-реплика для NotesList и NoteDetail.
+    # Можно указать путь к основной базе: в WAL чтение не ждёт записи.
+    READ_DATABASE_NAME = os.getenv('YANOTE_DB_READ_NAME')
+    if READ_DATABASE_NAME:
+        DATABASES['read'] = {
+            **DATABASES['default'],
+            'NAME': READ_DATABASE_NAME,
+            'OPTIONS': {'timeout': 20},
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_ROUTERS = ['notes.db.ReadDatabaseRouter']
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Отрисованные фрагменты страниц заметок. Для нескольких воркеров
+    # его стоит направить в общий кэш (Redis, Memcached).
+    'fragments': {
+        'BACKEND': 'notes.cache.StatsLocMemCache',
+        'LOCATION': 'notes-fragments',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Пользователи для CachedAuthenticationMiddleware. При нескольких
+    # воркерах нужен общий кэш, иначе сброс записи после смены пароля
+    # не виден другим процессам; в памяти процесса запись живёт не
+    # дольше notes.auth.LOCAL_USER_TIMEOUT (30 с).
+    'users': {
+        'BACKEND': 'notes.cache.StatsLocMemCache',
+        'LOCATION': 'notes-users',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Целые страницы для анонимов (PageCacheMiddleware).
+    'pages': {
+        'BACKEND': 'notes.cache.StatsLocMemCache',
+        'LOCATION': 'notes-pages',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100,
+        },
+    },
+}
+
+# Страницы, которые анонимы получают из кэша. Общий кэш прогревают
+# командой warm_page_cache; PAGE_CACHE_WARM_UP прогревает кэш каждого
+# процесса в фоновом потоке после запуска WSGI/ASGI-приложения.
+PAGE_CACHE_URLS = ('notes:home', 'users:login', 'users:signup')
+PAGE_CACHE_WARM_UP = False
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -85,5 +179,64 @@ STATIC_URL = '/static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Метрики Prometheus: с какого адреса можно читать /metrics и куда
+# воркеры сбрасывают свои снимки (нужно при нескольких процессах).
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+METRICS_DIR = os.getenv('YANOTE_METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 1.0
+
+# Кэш сессий notes.sessions: размер LRU, время жизни записи и интервал
+# отложенной записи в секундах; сдвиг срока действия меньше
+# SESSION_EXPIRY_SLACK секунд не считается изменением сессии.
+SESSION_CACHE_SIZE = 10000
+SESSION_CACHE_TTL = 30
+SESSION_WRITE_BEHIND_INTERVAL = 5.0
+SESSION_EXPIRY_SLACK = 60
+
+# Ограничение записей (AdmissionMiddleware): одновременных записей на
+# процесс, длина и время ожидания очереди, частота и запас записей
+# на пользователя в секунду.
+ADMISSION_MAX_WRITES = 4
+ADMISSION_QUEUE_SIZE = 16
+ADMISSION_QUEUE_TIMEOUT = 2.0
+ADMISSION_RATE = 5.0
+ADMISSION_BURST = 20
+ADMISSION_RETRY_AFTER = 1
+
+# Тексты заметок длиннее порога (в байтах) хранятся сжатыми:
+# 'zlib' или 'zstd' (нужен пакет zstandard).
+NOTES_COMPRESS_THRESHOLD = 4096
+NOTES_COMPRESSION = 'zlib'
+
+# Фоновые задачи (notes.jobs): обработчик в процессе приложения, пул
+# 'thread' или 'process' и его размер, интервал опроса базы, задержка
+# первого повтора и её предел, через сколько секунд задача считается
+# зависшей, сколько дней хранить выполненные задачи и как часто
+# (в секундах) обработчик удаляет более старые.
+JOBS_RUN_IN_APP = True
+JOBS_POOL = 'thread'
+JOBS_WORKERS = 2
+JOBS_POLL_INTERVAL = 1.0
+JOBS_RETRY_DELAY = 5
+JOBS_RETRY_MAX_DELAY = 3600
+JOBS_LOCK_TIMEOUT = 600
+JOBS_KEEP_DAYS = 7
+JOBS_PURGE_INTERVAL = 3600
+
+# Поток изменений заметок (notes.events): сколько событий ждёт
+# медленного клиента и раз в сколько секунд слать пустой комментарий.
+NOTES_EVENTS_BUFFER = 100
+NOTES_EVENTS_HEARTBEAT = 15
+
+# Поиск похожих заметок (notes.similarity): наименьшая оценка сходства
+# текстов от 0 до 1.
+NOTES_SIMILARITY_THRESHOLD = 0.5
+
+# Нативно асинхронные CRUD-представления заметок (для запуска под ASGI).
+NOTES_ASYNC_VIEWS = False
+
+# Срок действия токенов JSON API (notes.auth.make_api_token), секунд.
+API_TOKEN_MAX_AGE = 90 * 24 * 60 * 60
+
 LOGIN_URL = reverse_lazy('users:login')
 LOGIN_REDIRECT_URL = reverse_lazy('notes:home')
@@ -4,9 +4,13 @@ from django.contrib.auth.forms import UserCreationForm
 from django.urls import include, path
 from django.views.generic import CreateView
 
+from notes.metrics import metrics_view
+
 urlpatterns = [
     path('', include('notes.urls')),
+    path('api/', include('notes.api_urls')),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 auth_urls = ([